@@ -16,7 +16,7 @@ import SouthEastIcon from '@mui/icons-material/SouthEast'
 import HourglassEmptyIcon from '@mui/icons-material/HourglassEmpty'
 
 // React Hooks
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 
 // Import the Networking functions
 import { post, get, secondTicks } from '../../helpers/networkManager'
@@ -52,9 +52,22 @@ const Dashboard = () => {
   // ----------------------------
   // Hook for the selected frequency value
   const [selectedValue, setSelectedValue] = useState('minute')
+  // The WebSocket handler is created once, it reads the current selection through this ref
+  const selectedValueRef = useRef(selectedValue)
+  // The open WebSocket - the server is told the selected frequency, so a resync holds the signals of that frequency
+  const wsRef = useRef(null)
+  const sendSelectedFrequency = () => {
+    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ frequency: selectedValueRef.current }))
+    }
+  }
   // Handle a different frequency selection
   const handleChange = (event) => {
+    selectedValueRef.current = event.target.value
     setSelectedValue(event.target.value)
+    sendSelectedFrequency()
+    // The signals of the previous frequency are not mixed with the new ones
+    setMessages(null)
   }
   // ----------------------------
 
@@ -99,17 +112,20 @@ const Dashboard = () => {
   // ----------------------------
 
   // ----------------------------
-  // Calling the checkIfRunning func at the start of the app and also getting the last prediction if there is an ongoing process on the server
+  // Calling the checkIfRunning func at the start of the app and also getting the last predictions if there is an ongoing process on the server
+  // [ called again when another frequency is selected, every frequency has its own pipeline and signals ]
   useEffect(() => {
     checkIfRunning()
     getLatestPredictionData()
-  }, [])
-  // Using a get request gets the data of the last prediction
+  }, [selectedValue])
+  // Using a get request gets the data of the last predictions of the selected frequency
   const getLatestPredictionData = async () => {
     try {
-      const data = await get('/signals', { key: 'value' })
-      let reversedData = data['signal_data'].reverse()
-      setMessages(reversedData)
+      const data = await get(`/signals?frequency=${selectedValue}`)
+      // A response for a frequency that is no longer selected is ignored
+      if (data['frequency'] !== selectedValueRef.current) return
+      // The server sends 'No Signals.' instead of a list when the pipeline has no predictions yet
+      setMessages(Array.isArray(data['signal_data']) ? data['signal_data'].reverse() : null)
     } catch (err) {
       setError(err.message)
     }
@@ -120,15 +136,27 @@ const Dashboard = () => {
   // Use effect block for running the webSocket used to receive signal notifications
   useEffect(() => {
     const ws = new WebSocket(process.env.REACT_APP_WEBSOCKET_BASE_URL)
+    wsRef.current = ws
 
     ws.onopen = () => {
       console.log('WebSocket connection opened')
+      sendSelectedFrequency()
     }
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data)
-      let reversedData = data['signal_data'].reverse()
-      setMessages(reversedData)
+      // The server sends the signals of every running pipeline - only the selected frequency is shown
+      if (data['frequency'] && data['frequency'] !== selectedValueRef.current) return
+      if (data['signal_data']) {
+        // The full history - sent when connecting and when the client fell behind
+        let reversedData = data['signal_data'].reverse()
+        setMessages(reversedData)
+      } else if (data['signal']) {
+        // A new signal - added in front of the last 10 signals
+        setMessages((prevMessages) =>
+          [data['signal'], ...(prevMessages || [])].slice(0, 10)
+        )
+      }
     }
 
     ws.onerror = (error) => {
@@ -140,6 +168,7 @@ const Dashboard = () => {
     }
 
     return () => {
+      wsRef.current = null
       ws.close()
     }
   }, [])
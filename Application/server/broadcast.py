@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+
+from payload_format import legacy_format
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of messages a client can have waiting before it is considered too slow
+default_queue_size = 16
+
+# Seconds a single send can take before the client is disconnected
+default_send_timeout = 5.0
+
+
+# One connected WebSocket client - the messages are queued and sent by its own task,
+# so a slow client only delays itself
+class BroadcastClient:
+
+    def __init__(self, websocket, queue_size, payload_format, frequency=None):
+        self.websocket = websocket
+        self.payload_format = payload_format
+
+        # The frequency the client shows - its resync messages hold the history of that pipeline (None for the latest)
+        self.frequency = frequency
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.sent = 0
+
+
+# The WebSocket broadcast of the signals:
+# # Every message is serialized once per payload format in use and the same payload is queued for every client
+# # Publishing never waits for a client - the queued messages are sent concurrently by one task per client
+# # A client whose queue is full has fallen behind: its queued messages are dropped and replaced by a resync message
+# # holding the full current state of the frequency it shows, so it can not miss a delta
+# # A client that does not accept a message within send_timeout, or whose connection fails, is disconnected
+class Broadcaster:
+
+    def __init__(self, resync_message=None, queue_size=default_queue_size, send_timeout=default_send_timeout):
+        # resync_message(frequency) returns the message with the full current state of the frequency (None for the
+        # latest one), or None when there is nothing to send
+        self.resync_message = resync_message
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.clients = {}
+
+        self.published = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.disconnected = 0
+
+    @staticmethod
+    def serialize(message, payload_format):
+        # JSON goes in text frames, MessagePack in binary frames
+        with metrics.serialize_seconds.time(target='websocket', layout=payload_format.layout, encoding=payload_format.encoding):
+            payload = payload_format.encode(message)
+        return payload if payload_format.is_binary() else payload.decode()
+
+    def resync_payload(self, payload_format, frequency=None):
+        message = self.resync_message(frequency) if self.resync_message is not None else None
+        return self.serialize(message, payload_format) if message is not None else None
+
+    def connect(self, websocket, payload_format=legacy_format, frequency=None):
+        client = BroadcastClient(websocket, self.queue_size, payload_format, frequency)
+        self.clients[websocket] = client
+
+        # A new client starts from the full current state, the next messages are deltas
+        payload = self.resync_payload(payload_format, frequency)
+        if payload is not None:
+            client.queue.put_nowait(payload)
+        client.task = asyncio.create_task(self.send_loop(client))
+        return client
+
+    def select(self, websocket, frequency):
+        # The client shows another frequency - its next resync is made for it
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.frequency = frequency
+
+    async def disconnect(self, websocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+            try:
+                await client.task
+            except asyncio.CancelledError:
+                pass
+
+    async def send_loop(self, client):
+        try:
+            while True:
+                payload = await client.queue.get()
+                if isinstance(payload, bytes):
+                    send = client.websocket.send_bytes(payload)
+                else:
+                    send = client.websocket.send_text(payload)
+                with metrics.websocket_send_seconds.time():
+                    await asyncio.wait_for(send, self.send_timeout)
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Too slow or the connection is gone - the client is dropped, it gets a resync when it connects again
+            logger.warning(f"Disconnecting WebSocket client: {e!r}")
+            self.disconnected += 1
+            metrics.websocket_disconnects.inc()
+            self.clients.pop(client.websocket, None)
+            try:
+                await client.websocket.close()
+            except Exception:
+                pass
+
+    def publish(self, message):
+        # Serialized once for all the clients using the same payload format
+        start_time = time.perf_counter()
+        payloads = {}
+        resync_payloads = {}
+        self.published += 1
+
+        for client in list(self.clients.values()):
+            payload_format = client.payload_format
+            if payload_format.key not in payloads:
+                payloads[payload_format.key] = self.serialize(message, payload_format)
+            payload = payloads[payload_format.key]
+            try:
+                client.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # The client fell behind - the waiting messages are replaced by the full current state
+                self.dropped += client.queue.qsize()
+                metrics.websocket_dropped.inc(client.queue.qsize())
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                resync_key = (payload_format.key, client.frequency)
+                if resync_key not in resync_payloads:
+                    resync_payloads[resync_key] = self.resync_payload(payload_format, client.frequency)
+                resync_payload = resync_payloads[resync_key]
+                client.queue.put_nowait(resync_payload if resync_payload is not None else payload)
+                self.resyncs += 1
+        metrics.broadcast_seconds.observe(time.perf_counter() - start_time)
+
+    async def close(self):
+        for websocket in list(self.clients):
+            await self.disconnect(websocket)
+
+    def stats(self):
+        return {
+            'clients': len(self.clients),
+            'published': self.published,
+            'dropped': self.dropped,
+            'disconnected': self.disconnected,
+            'resyncs': self.resyncs,
+            'max_queue_length': max((client.queue.qsize() for client in self.clients.values()), default=0),
+            'queue_size': self.queue_size,
+        }
@@ -1,5 +1,15 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
 import requests
 
+logger = logging.getLogger(__name__)
+
 # Coingecko link for daily prices for the past 60 days (daily granulation):
 last_60_days_API = 'https://api.coingecko.com/api/v3/coins/bitcoin/market_chart?vs_currency=usd&days=60&interval=daily'
 
@@ -9,35 +19,142 @@ last_24_minutes_API = 'https://api.coingecko.com/api/v3/coins/bitcoin/market_cha
 # Coinbase link for current price
 current_API = 'https://api.pro.coinbase.com/products/BTC-USD/ticker'
 
+# Seconds to wait for a response before giving up on a request
+request_timeout = 10
+
+# Parameters sent with the current price request
+current_price_params = {
+    'ids': 'bitcoin',
+    'vs_currencies': 'usd'
+}
+
 class DataFetching:
 
-    def get_latest_bitcoin_price(self):
-        url = current_API
-        params = {
-            'ids': 'bitcoin',
-            'vs_currencies': 'usd'
-        }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        else:
+    def __init__(self):
+        # One session for all the requests, so the connections are kept alive between calls
+        self.session = requests.Session()
+
+    def get_json(self, url, params=None):
+        try:
+            response = self.session.get(url, params=params, timeout=request_timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Error fetching {url}: {e}")
             return None
-    
-    def get_5_minutes_bitcoin_prices(self):
-        url = last_24_minutes_API
-        response = requests.get(url)
         if response.status_code == 200:
             data = response.json()
             return data
         else:
             return None
 
+    def get_latest_bitcoin_price(self):
+        return self.get_json(current_API, params=current_price_params)
+
+    def get_5_minutes_bitcoin_prices(self):
+        return self.get_json(last_24_minutes_API)
+
     def get_daily_bitcoin_prices(self):
-        url = last_60_days_API
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        else:
-            return None
\ No newline at end of file
+        return self.get_json(last_60_days_API)
+
+
+# The asyncio version of DataFetching, awaited from the server event loop:
+# # One aiohttp session with a pool of kept alive connections is used for every request
+# # Every request has a timeout, so a slow API can not stall the pipeline
+# # Failed requests (connection errors, timeouts, 429 and 5xx responses) are retried a bounded number of times,
+# # waiting an exponential backoff with random jitter in between
+# # A 429 response blocks every request to that host until its Retry-After time has passed
+# The API links can be changed, so the fetching can run against a local stand-in server
+class AsyncDataFetching:
+
+    def __init__(self, current_url=current_API, minutes_url=last_24_minutes_API, daily_url=last_60_days_API,
+                 timeout=request_timeout, max_retries=3, backoff=0.5, max_backoff=8.0, connection_limit=10):
+        self.current_url = current_url
+        self.minutes_url = minutes_url
+        self.daily_url = daily_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connection_limit = connection_limit
+        self.session = None
+
+        # Time (time.monotonic) until which each host asked us to stop sending requests
+        self.rate_limited_until = {}
+
+    async def get_session(self):
+        # The session is created on first use, inside the running event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def retry_delay(self, attempt):
+        # Exponential backoff with full jitter between half and the whole backoff
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def retry_after_seconds(response):
+        # Retry-After can be a number of seconds or an HTTP date
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def wait_for_rate_limit(self, host):
+        remaining = self.rate_limited_until.get(host, 0) - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    async def get_json(self, url, params=None):
+        session = await self.get_session()
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            await self.wait_for_rate_limit(host)
+            delay = None
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+
+                    if response.status == 429:
+                        # Rate limited - every request to this host waits, not only this one
+                        delay = self.retry_after_seconds(response)
+                        if delay is None:
+                            delay = self.retry_delay(attempt)
+                        self.rate_limited_until[host] = time.monotonic() + delay
+                        delay = 0
+                    elif response.status < 500:
+                        # Other client errors will not succeed on a retry
+                        logger.warning(f"Error fetching {url}: HTTP {response.status}")
+                        return None
+                    else:
+                        logger.warning(f"Error fetching {url}: HTTP {response.status}, attempt {attempt + 1}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error fetching {url}: {e!r}, attempt {attempt + 1}")
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_delay(attempt) if delay is None else delay)
+
+        return None
+
+    async def get_latest_bitcoin_price(self):
+        return await self.get_json(self.current_url, params=current_price_params)
+
+    async def get_5_minutes_bitcoin_prices(self):
+        return await self.get_json(self.minutes_url)
+
+    async def get_daily_bitcoin_prices(self):
+        return await self.get_json(self.daily_url)
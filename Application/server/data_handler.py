@@ -1,40 +1,162 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
 import pandas as pd
 
-from data_fetching import DataFetching
+from data_fetching import DataFetching, AsyncDataFetching
 import predict
-import predict_long
+from model_registry import model_registry
+from tick_buffer import TickRingBuffer
+from streaming_lstm import load_streaming_forecaster
+import metrics
 
+logger = logging.getLogger(__name__)
 
-class DataHandler:
+# Number of points each prediction is made from - 60 for the sequence and the current price
+predict_window_size = 61
 
-    def __init__(self):
-        self.data_fetch_manager = DataFetching()
-        self.data_array = []
-        self.prediction_data = []
+# Number of ticks after which the streaming LSTM state is rebuilt from the window, to bound its drift
+default_resync_interval = 10
 
-    def populate_for_seconds(self, latest_data):
-        # Append the fetched data to the data_array
-        self.data_array.append(latest_data)
-        if len(self.data_array) == 61:
 
-            # Create a DataFrame from the JSON data
-            df = pd.DataFrame(self.data_array)
+class DataHandler:
 
-            # Columns to drop
-            columns_to_drop = ['ask', 'bid', 'volume', 'trade_id', 'size', 'rfq_volume']
+    def __init__(self, data_fetch_manager=None, async_fetch_manager=None):
+        # The fetch managers can be shared by several handlers, so they also share the pooled connections
+        self.data_fetch_manager = data_fetch_manager or DataFetching()
+        self.async_fetch_manager = async_fetch_manager or AsyncDataFetching()
+        self.prediction_data = []
 
-            # Drop the columns
-            df = df.drop(columns=columns_to_drop)
+        # Bumped on every change of prediction_data - the version of every kept prediction is in prediction_versions
+        self.version = 0
+        self.prediction_versions = []
+        self.prediction_lock = threading.Lock()
+
+        # Bumped by every reset - a run started before the reset of a stopped pipeline may still be running in its
+        # worker thread, what it gets afterwards is dropped instead of being added to the new history
+        self.generation = 0
+
+        # The last 61 minute mode ticks
+        self.tick_buffer = TickRingBuffer(predict_window_size)
+
+        # The prices of the same ticks as fetched ('30000.00') - the historical prices are sent with them unchanged
+        self.tick_price_strings = deque(maxlen=predict_window_size)
+        self.ticks_since_prediction = 0
+
+        # Number of ticks between two minute mode predictions - 61 predicts once per full window like before,
+        # 1 predicts on every tick using the sliding window
+        self.prediction_interval = int(os.getenv('MINUTE_PREDICTION_INTERVAL', predict_window_size))
+
+        # Minute mode inference - 'window' recomputes the forecast from the full window,
+        # 'streaming' keeps the LSTM state and advances it by one step per tick (NumPy only)
+        self.minute_inference_mode = os.getenv('MINUTE_INFERENCE_MODE', 'window')
+        self.streaming_forecaster = None
+        self.streaming_version = None
+        self.resync_interval = int(os.getenv('STREAMING_RESYNC_INTERVAL', default_resync_interval)) or None
+        if self.minute_inference_mode not in ('window', 'streaming'):
+            raise ValueError(f"Unknown minute inference mode: {self.minute_inference_mode}")
+
+    def reset(self):
+        with self.prediction_lock:
+            self.generation += 1
+            self.tick_buffer.clear()
+            self.tick_price_strings.clear()
+            self.ticks_since_prediction = 0
+
+            # The version keeps growing, so a client never mistakes the new predictions for ones it already has
+            self.version += 1
+            self.prediction_data = []
+            self.prediction_versions = []
+        if self.streaming_forecaster is not None:
+            self.streaming_forecaster.clear()
+
+    def is_current(self, generation):
+        # False for a run started before the last reset - no generation means the caller is not a pipeline run
+        return generation is None or generation == self.generation
+
+    def populate_for_seconds(self, latest_data, generation=None):
+        # Push the fetched tick into the ring buffer - only the time and the price are kept
+        with metrics.prepare_seconds.time(frequency='minute'):
+            tick_time = datetime.fromisoformat(latest_data['time'].replace('Z', '+00:00')).timestamp()
+            with self.prediction_lock:
+                if not self.is_current(generation):
+                    return
+                self.tick_buffer.push(tick_time, float(latest_data['price']))
+                self.tick_price_strings.append(latest_data['price'])
+                self.ticks_since_prediction += 1
+
+        if self.minute_inference_mode == 'streaming' and self.tick_buffer.is_full():
+            self.stream_tick()
+
+        # Predict once the buffer holds 61 ticks, then every prediction_interval ticks on the sliding window
+        if self.tick_buffer.is_full() and self.ticks_since_prediction >= self.prediction_interval:
+            # View of the last 61 ticks - nothing is copied
+            window = self.tick_buffer.window()
+
+            # The streaming forecast branches from the kept LSTM state, the window mode forecasts the full window
+            future_prices = self.streaming_forecaster.forecast() if self.streaming_forecaster is not None else None
 
             # Predict next prices
-            return_obj = predict.predict_next_trend(df)
-            #print(return_obj)
+            return_obj = predict.predict_next_trend_from_window(window[:, 0], window[:, 1], self.tick_buffer.min,
+                                                                self.tick_buffer.max, future_prices,
+                                                                price_strings=list(self.tick_price_strings))
+            #logger.debug(return_obj)
+            if self.add_prediction(return_obj, generation):
+                self.ticks_since_prediction = 0
+
+    def add_prediction(self, return_obj, generation=None):
+        # Keeping the last 10 predictions, each one with the version it was added with
+        with self.prediction_lock:
+            if not self.is_current(generation):
+                logger.debug("Dropping a prediction of a run started before the pipeline was stopped")
+                return False
+            self.version += 1
             if len(self.prediction_data) >= 10:
                 self.prediction_data.pop(0)
+                self.prediction_versions.pop(0)
             self.prediction_data.append(return_obj)
-            self.data_array = []  # Reset the array
+            self.prediction_versions.append(self.version)
+        return True
+
+    def predictions_since(self, version=None):
+        # The current version and the predictions added after the given version (all of them without a version)
+        with self.prediction_lock:
+            if version is None:
+                return self.version, list(self.prediction_data)
+            start = bisect.bisect_right(self.prediction_versions, version)
+            return self.version, self.prediction_data[start:]
+
+    def streaming_model(self):
+        # The streaming forecaster of the short shot model, built on the first tick and built again when the registry
+        # loaded a new version of the model - the new one starts from the current window
+        entry = model_registry[predict.default_model_name]
+        if self.streaming_forecaster is None or self.streaming_version != entry.version:
+            self.streaming_version = entry.version
+            self.streaming_forecaster = load_streaming_forecaster(entry.current_file(), self.resync_interval)
+        return self.streaming_forecaster
+
+    def stream_tick(self):
+        self.streaming_model()
+
+        # The forecast sequence is the window without its last tick (the current price), like in predict.py
+        window = self.tick_buffer.window()
+        if self.streaming_forecaster.needs_resync():
+            # Rebuilding the state from the full sequence with the scaler of the current window
+            data_min, data_max = self.tick_buffer.min, self.tick_buffer.max
+            self.streaming_forecaster.reset(window[:-1, 1], data_min, data_max - data_min)
+        else:
+            # Only the tick that just joined the sequence is fed to the LSTM
+            self.streaming_forecaster.observe(window[-2, 1])
+
+    def populate_for_5_minutes(self, latest_data, generation=None):
+        start_time = time.perf_counter()
 
-    def populate_for_5_minutes(self, latest_data):
         # Convert the data to a DataFrame
         df = pd.DataFrame(latest_data["prices"], columns=["time", "price"])
 
@@ -43,30 +165,30 @@ class DataHandler:
 
         # Keep only the last 61 points
         df_last_61 = df.tail(61)
+        metrics.prepare_seconds.observe(time.perf_counter() - start_time, frequency='hour')
 
         # Predict next prices
         return_obj = predict.predict_next_trend(df_last_61)
     
-        if len(self.prediction_data) >= 10:
-            self.prediction_data.pop(0)
-        self.prediction_data.append(return_obj)
+        self.add_prediction(return_obj, generation)
+
+    def populate_for_days(self, latest_data, generation=None):
+        start_time = time.perf_counter()
 
-    def populate_for_days(self, latest_data):
         # Convert the data to a DataFrame
         df = pd.DataFrame(latest_data["prices"], columns=["time", "price"])
         
         # Converting prices to strings
         df['price'] = df['price'].astype(str)
+        metrics.prepare_seconds.observe(time.perf_counter() - start_time, frequency='day')
 
         # Predict next prices
-        return_obj = predict_long.predict_next_trend(df)
+        return_obj = predict.predict_next_trend(df, model_name='long_shot')
     
-        if len(self.prediction_data) >= 10:
-            self.prediction_data.pop(0)
-        self.prediction_data.append(return_obj)
+        self.add_prediction(return_obj, generation)
 
     def populate_array(self, frequency):
-        print(frequency)
+        logger.debug(frequency)
         
         if frequency == 'minute':
             # Fetch the latest bitcoin price data
@@ -80,4 +202,35 @@ class DataHandler:
             # Fetch the latest bitcoin price data
             latest_data = self.data_fetch_manager.get_daily_bitcoin_prices()
             self.populate_for_days(latest_data)
+
+    async def populate_array_async(self, frequency):
+        logger.debug(frequency)
+        start_time = time.perf_counter()
+
+        # Stopping the pipeline cancels this coroutine but not the worker thread below - the generation tells the
+        # thread its pipeline was reset meanwhile
+        generation = self.generation
+
+        # Fetch the latest bitcoin price data without blocking the event loop
+        if frequency == 'minute':
+            latest_data = await self.async_fetch_manager.get_latest_bitcoin_price()
+            populate = self.populate_for_seconds
+        elif frequency == 'hour':
+            latest_data = await self.async_fetch_manager.get_5_minutes_bitcoin_prices()
+            populate = self.populate_for_5_minutes
+        elif frequency == 'day':
+            latest_data = await self.async_fetch_manager.get_daily_bitcoin_prices()
+            populate = self.populate_for_days
+        else:
+            return
+        metrics.fetch_seconds.observe(time.perf_counter() - start_time, frequency=frequency)
+
+        # The API did not answer after all the retries - skip this cycle
+        if latest_data is None:
+            logger.warning(f"No data fetched for frequency: {frequency}")
+            metrics.fetch_errors.inc(frequency=frequency)
+            return
+
+        # The data handling and the prediction run in a worker thread, so the event loop keeps serving requests
+        await asyncio.to_thread(populate, latest_data, generation)
     
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Maximum number of forecasts kept in memory
+default_max_entries = 128
+
+
+# Cache of the forecasted prices, so an input window that did not change since the previous cycle is not predicted again
+# # The key is made of the model id and a hash of the input window together with the scaler parameters
+# # When the cache is full the least recently used forecast is evicted
+# # The hits and misses are counted to see how often the model is skipped
+class ForecastCache:
+
+    def __init__(self, max_entries=default_max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # The fetching thread and the event loop can both use the cache
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def window_key(model_id, window, data_min, data_range):
+        window_hash = hashlib.blake2b(np.ascontiguousarray(window, dtype=np.float64).tobytes(), digest_size=16)
+        window_hash.update(np.array([data_min, data_range], dtype=np.float64).tobytes())
+        return model_id, window_hash.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forecast(self, model_id, rollout_engine, window, scaler):
+        # Returns the cached forecast for the window, or runs the model and stores the result
+        key = self.window_key(model_id, window, scaler.data_min_[0], scaler.data_range_[0])
+        future_prices = self.get(key)
+        if future_prices is None:
+            future_prices = rollout_engine.forecast(window, scaler)
+
+            # Stored read only, so a caller can not change a cached forecast
+            future_prices.setflags(write=False)
+            self.put(key, future_prices)
+        return future_prices
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# The cache shared by the short and long models, the model id keeps their forecasts apart
+forecast_cache = ForecastCache()
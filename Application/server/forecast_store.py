@@ -0,0 +1,155 @@
+# Forecast Store
+# The forecasts of the backtests and evaluations are kept on disk, so a rerun only forecasts the windows it does not
+# have yet - after a change of the thresholds, a few rows appended to a CSV, or a run that was interrupted:
+# # One folder per dataset, model file and horizon, in a .forecast_store folder next to the CSV
+# # A forecast is stored under its window end index and a digest of what it was computed from - the 60 input prices
+# #   and the scaler parameters - so a changed row (or a scaler moved by a new minimum or maximum) only forecasts the
+# #   windows it changed again
+# # The model is identified by a hash of its file, so a retrained model never reads the forecasts of the old one
+# # Every batch of new forecasts is written as its own segment file as soon as it is computed, so a run that stops
+# #   keeps everything before its last batch; compact merges the segments into one
+# # Segment files are numbered after the last one in the folder and get a random suffix, so two runs writing the same
+# #   folder never replace each other's segments
+#
+# Usage: python forecast_store.py list ../../Backtesting_script/data
+#        python forecast_store.py compact ../../Backtesting_script/data
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import uuid
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+from model_artifacts import file_digest
+
+# Name of the folder holding the stored forecasts, next to the CSV files
+store_folder_name = '.forecast_store'
+
+# Size in bytes of the digest of every window
+window_digest_size = 16
+
+# Segment files - segment_<number>_<random suffix>.npz, or segment_<number>.npz for the older ones
+segment_pattern = re.compile(r'segment_(\d+)(?:_[0-9a-f]+)?\.npz$')
+
+
+def forecasts_folder(model_path, data_path, horizon, model_digest=None):
+    data_path = os.path.abspath(data_path)
+    dataset_name = os.path.splitext(os.path.basename(data_path))[0]
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    model_digest = model_digest or file_digest(model_path)
+    return os.path.join(os.path.dirname(data_path), store_folder_name, dataset_name, f'{model_name}-{model_digest}-h{horizon}')
+
+def window_digests(windows, data_min, data_range):
+    # One digest per window, of its prices and of the scaler parameters it is scaled with
+    windows = np.ascontiguousarray(windows, dtype=np.float64)
+    scaler = np.array([data_min, data_range], dtype=np.float64).tobytes()
+    digests = np.empty(len(windows), dtype=f'S{window_digest_size}')
+    for position, window in enumerate(windows):
+        digest = hashlib.blake2b(window.tobytes(), digest_size=window_digest_size)
+        digest.update(scaler)
+        digests[position] = digest.digest()
+    return digests
+
+
+# The stored forecasts of one dataset, model and horizon
+class StoredForecasts:
+
+    def __init__(self, folder, horizon):
+        self.folder = folder
+        self.horizon = horizon
+        self.rows = {}
+        self.segments = []
+        self.future_prices = []
+
+        # Every segment is loaded once - the forecasts are found by (window end index, window digest)
+        segment_paths = glob.glob(os.path.join(folder, 'segment_*.npz'))
+        for segment_path in sorted(path for path in segment_paths if segment_pattern.match(os.path.basename(path))):
+            with np.load(segment_path) as segment:
+                self.add(segment['window_ends'], segment['digests'], segment['future_prices'])
+            self.segments.append(segment_path)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, window_ends, digests, future_prices):
+        segment = len(self.future_prices)
+        self.future_prices.append(future_prices)
+        for row, key in enumerate(zip(window_ends.tolist(), digests.tolist())):
+            self.rows[key] = (segment, row)
+
+    def lookup(self, window_ends, digests):
+        # Returns which windows are stored, and the stored forecasts of those windows
+        found = np.zeros(len(window_ends), dtype=bool)
+        future_prices = np.empty((len(window_ends), self.horizon))
+        for position, key in enumerate(zip(window_ends.tolist(), digests.tolist())):
+            stored = self.rows.get(key)
+            if stored is not None:
+                found[position] = True
+                future_prices[position] = self.future_prices[stored[0]][stored[1]]
+        return found, future_prices[found]
+
+    def write_segment(self, window_ends, digests, future_prices):
+        # Written to a temporary file first, so an interrupted run never leaves half a segment behind - the temporary
+        # name does not match segment_*.npz, so it is never read as a segment
+        os.makedirs(self.folder, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(segment_pattern.match, os.listdir(self.folder)) if match]
+        segment_path = os.path.join(self.folder, f'segment_{max(numbers, default=-1) + 1:06d}_{uuid.uuid4().hex[:12]}.npz')
+        temporary_path = os.path.join(self.folder, f'tmp_{os.getpid()}_{uuid.uuid4().hex[:12]}.npz')
+        np.savez(temporary_path, window_ends=window_ends, digests=digests, future_prices=future_prices)
+        os.replace(temporary_path, segment_path)
+        return segment_path
+
+    def save(self, window_ends, digests, future_prices):
+        window_ends = np.asarray(window_ends, dtype=np.int64)
+        future_prices = np.asarray(future_prices, dtype=np.float64)
+        self.segments.append(self.write_segment(window_ends, digests, future_prices))
+        self.add(window_ends, digests, future_prices)
+
+    def compact(self):
+        # Merges every segment into one - the last stored forecast of a window is kept
+        if len(self.segments) <= 1:
+            return
+        keys = list(self.rows)
+        window_ends = np.array([key[0] for key in keys], dtype=np.int64)
+        digests = np.array([key[1] for key in keys], dtype=f'S{window_digest_size}')
+        future_prices = np.array([self.future_prices[segment][row] for segment, row in self.rows.values()]).reshape(-1, self.horizon)
+        order = np.argsort(window_ends, kind='stable')
+
+        # The merged segment is written before the merged ones are removed, and only the segments loaded here are
+        # removed - a segment another run wrote meanwhile is kept
+        segment_path = self.write_segment(window_ends[order], digests[order], future_prices[order])
+        for merged_path in self.segments:
+            os.remove(merged_path)
+
+        self.rows = {}
+        self.future_prices = []
+        self.segments = [segment_path]
+        self.add(window_ends[order], digests[order], future_prices[order])
+
+
+def open_forecasts(model_path, data_path, horizon, model_digest=None):
+    return StoredForecasts(forecasts_folder(model_path, data_path, horizon, model_digest), horizon)
+
+def stored_folders(data_folder):
+    return sorted(glob.glob(os.path.join(os.path.abspath(data_folder), store_folder_name, '*', '*-h*')))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stored backtest forecasts')
+    parser.add_argument('command', choices=['list', 'compact'])
+    parser.add_argument('folder', help='folder of the CSV datasets')
+    args = parser.parse_args(argv)
+
+    for folder in stored_folders(args.folder):
+        horizon = int(folder.rsplit('-h', 1)[1])
+        stored_forecasts = StoredForecasts(folder, horizon)
+        if args.command == 'compact':
+            stored_forecasts.compact()
+        dataset_name = os.path.basename(os.path.dirname(folder))
+        print(f"{dataset_name:<28} {os.path.basename(folder):<40} {len(stored_forecasts):>8} forecasts in {len(stored_forecasts.segments)} segments")
+
+if __name__ == "__main__":
+    main()
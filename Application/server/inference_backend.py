@@ -0,0 +1,49 @@
+import os
+
+# The inference backend is selected with the INFERENCE_BACKEND environment variable:
+# # tensorflow - the Keras model wrapped in the compiled rollout (the default)
+# # numpy - the weights are read from the .h5 file and the forward pass runs in NumPy, TensorFlow is never imported
+default_backend = 'tensorflow'
+
+
+# A model with more than one output is a direct multi-horizon model - it gets the engine without the 60 step loop
+# Both backends load the model from its converted artifact (model_artifacts.py), converting the .h5 file on first use
+def load_rollout_engine(model_path, backend=None):
+    backend = backend or os.getenv('INFERENCE_BACKEND', default_backend)
+
+    if backend == 'numpy':
+        from lstm_numpy import NumpyRolloutEngine, NumpyDirectEngine
+        from model_artifacts import load_numpy_model
+        model = load_numpy_model(model_path)
+        return NumpyDirectEngine(model) if model.output_size() > 1 else NumpyRolloutEngine(model)
+    elif backend == 'tensorflow':
+        from rollout import RolloutEngine, DirectEngine
+        from model_artifacts import load_keras_model
+        model = load_keras_model(model_path)
+        return DirectEngine(model) if model.output_shape[-1] > 1 else RolloutEngine(model)
+    else:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+
+# The number of inference worker processes used by the server is set with the INFERENCE_WORKERS environment variable:
+# # 0 - the model runs inside the server process
+# # 1 or more - the model runs in a pool of worker processes, see inference_pool.py
+default_workers = 1
+
+def server_inference_pool(backend=None):
+    # The pool of the server, created without starting it - None when the models run inside the server process
+    workers = int(os.getenv('INFERENCE_WORKERS', default_workers))
+    if workers <= 0:
+        return None
+    from inference_pool import get_inference_pool
+    return get_inference_pool(workers, backend)
+
+def load_server_rollout_engine(model_path, backend=None, version=None):
+    pool = server_inference_pool(backend)
+    if pool is None:
+        return load_rollout_engine(model_path, backend)
+
+    # The model is only registered here - it is loaded by the workers when the pool starts, or on their first job
+    # The version tells the workers to load the file again when it was replaced
+    from inference_pool import PooledRolloutEngine
+    return PooledRolloutEngine(pool, model_path, version)
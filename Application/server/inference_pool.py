@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+from inference_backend import load_rollout_engine
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of seconds the recent utilization is measured over
+utilization_window = 60
+
+
+# The models are run in separate worker processes, so the forecasts never hold the GIL of the server process:
+# # Every worker loads the registered models once, when it starts, and keeps them for all the jobs - a model registered
+# #   later is loaded on its first job, and loaded again on the first job of a new version of its file
+# # The server submits the raw windows and the scaler parameters, and gets the future prices back
+# # The number of jobs waiting and the share of time the workers spend forecasting are tracked for /inference_stats
+# The workers are forked from the server before it starts any thread, and before TensorFlow is imported,
+# which is why the pool is started from the server startup hook
+class InferencePool:
+
+    def __init__(self, workers=1, backend=None):
+        self.workers = workers
+        self.backend = backend
+        self.model_paths = []
+        self.model_versions = {}
+        self.executor = None
+        self.started_at = None
+
+        # Jobs submitted and not finished yet, and the forecasting time reported by the workers
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.recent_jobs = deque()
+
+    def register(self, model_path, version=None):
+        # The models registered before start are loaded by every worker when it starts
+        if model_path not in self.model_paths:
+            self.model_paths.append(model_path)
+        self.model_versions[model_path] = version
+
+    def start_executor(self):
+        if self.executor is None:
+            # fork keeps the startup fast and does not import the server module again in the workers
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=load_worker_models,
+                initargs=(dict(self.model_versions), self.backend),
+            )
+            self.started_at = time.monotonic()
+        return self.executor
+
+    def start_workers(self):
+        # Forks every worker right away, from the calling thread, and returns the futures of their warm-up
+        executor = self.start_executor()
+        return [executor.submit(warm_up_worker, list(self.model_paths)) for _ in range(self.workers)]
+
+    async def start(self):
+        # Starting every worker and waiting until its models are loaded and warmed up
+        return await asyncio.gather(*(asyncio.wrap_future(future) for future in self.start_workers()))
+
+    def submit(self, model_path, windows, data_min, data_range, version=None):
+        executor = self.start_executor()
+        with self.lock:
+            self.pending += 1
+        future = executor.submit(worker_forecast_batch, model_path, windows, data_min, data_range, version)
+        future.add_done_callback(self.job_done)
+        return future
+
+    def job_done(self, future):
+        finished_at = time.monotonic()
+        with self.lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                return
+            self.completed += 1
+            compute_seconds = future.result()[1]
+            metrics.inference_job_seconds.observe(compute_seconds)
+            self.busy_seconds += compute_seconds
+            self.recent_jobs.append((finished_at, compute_seconds))
+            while self.recent_jobs and self.recent_jobs[0][0] < finished_at - utilization_window:
+                self.recent_jobs.popleft()
+
+    def forecast_batch(self, model_path, windows, data_min, data_range, version=None):
+        # Blocking version, for the code running in the fetching worker thread - waiting does not hold the GIL
+        return self.submit(model_path, windows, data_min, data_range, version).result()[0]
+
+    async def forecast_batch_async(self, model_path, windows, data_min, data_range, version=None):
+        future = self.submit(model_path, windows, data_min, data_range, version)
+        return (await asyncio.wrap_future(future))[0]
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            elapsed = now - self.started_at if self.started_at is not None else 0.0
+            recent_busy = sum(seconds for finished_at, seconds in self.recent_jobs if finished_at >= now - utilization_window)
+            recent_elapsed = min(elapsed, utilization_window)
+            return {
+                'workers': self.workers,
+                'models': list(self.model_paths),
+                'running': self.executor is not None,
+                'in_flight': self.pending,
+                'queue_depth': max(0, self.pending - self.workers),
+                'completed': self.completed,
+                'failed': self.failed,
+                'busy_seconds': round(self.busy_seconds, 4),
+                'utilization': round(self.busy_seconds / (elapsed * self.workers), 4) if elapsed else 0.0,
+                'recent_utilization': round(recent_busy / (recent_elapsed * self.workers), 4) if recent_elapsed else 0.0,
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+# A rollout engine with the same interface as RolloutEngine and NumpyRolloutEngine, running in the pool
+class PooledRolloutEngine:
+
+    def __init__(self, pool, model_path, version=None):
+        self.pool = pool
+        self.model_path = model_path
+        self.version = version
+        pool.register(model_path, version)
+
+    def forecast_batch(self, windows, data_min, data_range):
+        windows = np.asarray(windows, dtype=np.float64)
+        return self.pool.forecast_batch(self.model_path, windows, data_min, data_range, self.version)
+
+    def forecast(self, window, scaler):
+        # Forecasting a single window using the parameters of an already fitted MinMaxScaler
+        window = np.asarray(window, dtype=np.float64).reshape(1, -1)
+        return self.forecast_batch(window, scaler.data_min_[0], scaler.data_range_[0])[0]
+
+
+# The models loaded in a worker process, by model path - (version, rollout engine)
+worker_engines = {}
+worker_backend = None
+
+def load_worker_models(model_versions, backend):
+    global worker_backend
+    worker_backend = backend
+    for model_path, version in model_versions.items():
+        # A model that can not be loaded does not stop the worker - its jobs fail with the loading error instead
+        try:
+            worker_engine(model_path, version)
+        except Exception as e:
+            logger.error(f"Inference worker {os.getpid()} could not load {model_path}: {e!r}")
+
+def worker_engine(model_path, version=None):
+    # A model that was not registered before the start is loaded on its first job,
+    # and a model whose file was replaced is loaded again on the first job of the new version
+    loaded = worker_engines.get(model_path)
+    if loaded is None or (version is not None and loaded[0] != version):
+        loaded = worker_engines[model_path] = (version, load_rollout_engine(model_path, worker_backend))
+    return loaded[1]
+
+def warm_up_worker(model_paths):
+    # One forecast per model, so the compiled rollout is traced before the first real job
+    window = np.linspace(0.0, 1.0, 60).reshape(1, -1)
+    for model_path in model_paths:
+        if model_path in worker_engines:
+            worker_engines[model_path][1].forecast_batch(window, 0.0, 1.0)
+    return os.getpid()
+
+def worker_forecast_batch(model_path, windows, data_min, data_range, version=None):
+    start_time = time.perf_counter()
+    future_prices = worker_engine(model_path, version).forecast_batch(windows, data_min, data_range)
+    return future_prices, time.perf_counter() - start_time
+
+
+# The pool used by the server - created by inference_backend.load_server_rollout_engine when INFERENCE_WORKERS > 0
+inference_pool = None
+
+def get_inference_pool(workers, backend=None):
+    global inference_pool
+    if inference_pool is None:
+        inference_pool = InferencePool(workers, backend)
+    return inference_pool
@@ -0,0 +1,256 @@
+# Numpy library helps with numerical operation
+import numpy as np
+
+# h5py is used for reading the weights straight from the Keras .h5 files, without loading TensorFlow
+import h5py
+
+import json
+import sys
+
+# Latency histograms served on /metrics
+import metrics
+
+# Number of future steps predicted for every forecast
+forecast_horizon = 60
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+def relu(x):
+    return np.maximum(x, 0.0)
+
+def linear(x):
+    return x
+
+# The Keras activations used by the trained models, by the name stored in the model config
+activations = {
+    'sigmoid': sigmoid,
+    'hard_sigmoid': hard_sigmoid,
+    'tanh': np.tanh,
+    'relu': relu,
+    'linear': linear,
+}
+
+
+# The LSTM layer works exactly like the Keras one:
+# # The kernel holds the input weights and the recurrent kernel the hidden state weights of the 4 gates
+# # The gates are stored in the order: input, forget, cell candidate, output
+# # At every timestep the new cell state and hidden state are computed from the input and the previous hidden state
+class NumpyLSTMLayer:
+
+    def __init__(self, kernel, recurrent_kernel, bias, activation='tanh', recurrent_activation='sigmoid', return_sequences=False):
+        self.kernel = kernel
+        self.recurrent_kernel = recurrent_kernel
+        self.bias = bias
+        self.units = recurrent_kernel.shape[0]
+        self.activation = activations[activation]
+        self.recurrent_activation = activations[recurrent_activation]
+        self.return_sequences = return_sequences
+
+    def initial_state(self, batch_size):
+        hidden_state = np.zeros((batch_size, self.units), dtype=self.kernel.dtype)
+        cell_state = np.zeros((batch_size, self.units), dtype=self.kernel.dtype)
+        return hidden_state, cell_state
+
+    def project(self, inputs):
+        # The input part of the gates does not depend on the previous state, so it is computed for all timesteps at once
+        return inputs @ self.kernel + self.bias
+
+    def step(self, projected_input, hidden_state, cell_state):
+        units = self.units
+        gates = projected_input + hidden_state @ self.recurrent_kernel
+
+        input_gate = self.recurrent_activation(gates[:, :units])
+        forget_gate = self.recurrent_activation(gates[:, units:2 * units])
+        candidate = self.activation(gates[:, 2 * units:3 * units])
+        output_gate = self.recurrent_activation(gates[:, 3 * units:])
+
+        cell_state = forget_gate * cell_state + input_gate * candidate
+        hidden_state = output_gate * self.activation(cell_state)
+        return hidden_state, cell_state
+
+    def forward(self, inputs, state=None):
+        # inputs: (batch, timesteps, features)
+        batch_size, timesteps, _ = inputs.shape
+        hidden_state, cell_state = state if state is not None else self.initial_state(batch_size)
+        projected = self.project(inputs)
+
+        outputs = np.empty((batch_size, timesteps, self.units), dtype=self.kernel.dtype) if self.return_sequences else None
+        for t in range(timesteps):
+            hidden_state, cell_state = self.step(projected[:, t], hidden_state, cell_state)
+            if outputs is not None:
+                outputs[:, t] = hidden_state
+
+        if outputs is None:
+            outputs = hidden_state
+        return outputs, (hidden_state, cell_state)
+
+
+class NumpyDenseLayer:
+
+    def __init__(self, kernel, bias, activation='linear'):
+        self.kernel = kernel
+        self.bias = bias
+        self.activation = activations[activation]
+
+    def forward(self, inputs):
+        outputs = inputs @ self.kernel
+        if self.bias is not None:
+            outputs = outputs + self.bias
+        return self.activation(outputs)
+
+
+def read_h5(model_path):
+    # The model config and the weights of every layer of a Keras .h5 file, by layer name
+    # The weights of every layer are listed, in order, in the 'weight_names' attribute of its group
+    layer_weights = {}
+    with h5py.File(model_path, 'r') as model_file:
+        model_config = json.loads(model_file.attrs['model_config'])
+        weights_group = model_file['model_weights']
+        for layer in model_config['config']['layers']:
+            name = layer['config']['name']
+            if name in weights_group:
+                layer_group = weights_group[name]
+                layer_weights[name] = [np.asarray(layer_group[weight_name]) for weight_name in layer_group.attrs.get('weight_names', [])]
+    return model_config, layer_weights
+
+
+# A Sequential model made of LSTM, Dropout and Dense layers, read from a Keras .h5 file
+# Dropout does nothing at inference time, so those layers are skipped
+class NumpyLSTMModel:
+
+    def __init__(self, layers):
+        self.layers = layers
+
+    @classmethod
+    def from_h5(cls, model_path, dtype=np.float32):
+        model_config, layer_weights = read_h5(model_path)
+        return cls.from_config(model_config, layer_weights, dtype)
+
+    @classmethod
+    def from_config(cls, model_config, layer_weights, dtype=np.float32):
+        # model_config is the Keras model config, layer_weights the weights of every layer by layer name
+        layers = []
+        for layer in model_config['config']['layers']:
+            class_name = layer['class_name']
+            config = layer['config']
+
+            if class_name in ('InputLayer', 'Dropout'):
+                continue
+
+            weights = [np.asarray(weight, dtype=dtype) for weight in layer_weights[config['name']]]
+
+            if class_name == 'LSTM':
+                kernel, recurrent_kernel = weights[0], weights[1]
+                bias = weights[2] if config.get('use_bias', True) else np.zeros(kernel.shape[1], dtype=dtype)
+                layers.append(NumpyLSTMLayer(
+                    kernel, recurrent_kernel, bias,
+                    activation=config['activation'],
+                    recurrent_activation=config['recurrent_activation'],
+                    return_sequences=config['return_sequences'],
+                ))
+            elif class_name == 'Dense':
+                bias = weights[1] if config.get('use_bias', True) else None
+                layers.append(NumpyDenseLayer(weights[0], bias, activation=config['activation']))
+            else:
+                raise ValueError(f"Layer type {class_name} is not supported by the NumPy backend")
+
+        return cls(layers)
+
+    def output_size(self):
+        # 1 for the autoregressive models, the number of future steps for a direct multi-horizon model
+        return self.layers[-1].kernel.shape[1]
+
+    def predict(self, inputs):
+        # inputs: (batch, sequence_length, 1), the same as the Keras model
+        outputs = np.asarray(inputs, dtype=self.layers[0].kernel.dtype)
+        for layer in self.layers:
+            if isinstance(layer, NumpyLSTMLayer):
+                outputs, _ = layer.forward(outputs)
+            else:
+                outputs = layer.forward(outputs)
+        return outputs
+
+
+# The same rollout as the TensorFlow RolloutEngine, running on the NumPy model
+class NumpyRolloutEngine:
+
+    def __init__(self, model, horizon=forecast_horizon):
+        self.model = model
+        self.horizon = horizon
+
+    def forecast_batch(self, windows, data_min, data_range):
+        # windows: raw prices of shape (batch, sequence_length)
+        # data_min, data_range: the scaler parameters, either one value or one value per window
+        windows = np.asarray(windows, dtype=np.float64)
+        batch_size = windows.shape[0]
+        data_min = np.broadcast_to(np.asarray(data_min, dtype=np.float64), (batch_size,)).reshape(-1, 1)
+        data_range = np.broadcast_to(np.asarray(data_range, dtype=np.float64), (batch_size,)).reshape(-1, 1)
+
+        # A constant series gives a range of 0, the MinMaxScaler uses 1 in this case
+        data_range = np.where(data_range == 0, 1.0, data_range)
+
+        # Scaling the raw prices the same way the MinMaxScaler does
+        current_sequence = ((windows - data_min) / data_range)[:, :, np.newaxis]
+        scaled_predictions = np.empty((batch_size, self.horizon))
+
+        for step in range(self.horizon):
+            # Predict the next scaled value, then drop the oldest value and append the prediction
+            with metrics.model_step_seconds.time(engine='numpy'):
+                next_value = self.model.predict(current_sequence)
+            scaled_predictions[:, step] = next_value[:, 0]
+            current_sequence = np.concatenate([current_sequence[:, 1:, :], next_value[:, np.newaxis, :]], axis=1)
+
+        # Inverse transforming the predictions to get actual prices
+        return scaled_predictions * data_range + data_min
+
+    def forecast(self, window, scaler):
+        # Forecasting a single window using the parameters of an already fitted MinMaxScaler
+        window = np.asarray(window, dtype=np.float64).reshape(1, -1)
+        return self.forecast_batch(window, scaler.data_min_[0], scaler.data_range_[0])[0]
+
+
+# The engine of a direct multi-horizon model on the NumPy model - one forward pass gives every future step
+class NumpyDirectEngine(NumpyRolloutEngine):
+
+    def __init__(self, model):
+        super().__init__(model, horizon=model.output_size())
+
+    def forecast_batch(self, windows, data_min, data_range):
+        windows = np.asarray(windows, dtype=np.float64)
+        batch_size = windows.shape[0]
+        data_min = np.broadcast_to(np.asarray(data_min, dtype=np.float64), (batch_size,)).reshape(-1, 1)
+        data_range = np.broadcast_to(np.asarray(data_range, dtype=np.float64), (batch_size,)).reshape(-1, 1)
+        data_range = np.where(data_range == 0, 1.0, data_range)
+
+        with metrics.model_step_seconds.time(engine='numpy_direct'):
+            scaled_predictions = self.model.predict(((windows - data_min) / data_range)[:, :, np.newaxis])
+        return scaled_predictions.astype(np.float64) * data_range + data_min
+
+
+# Parity check against Keras - usage: python lstm_numpy.py models/short_shot.h5
+def main():
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'models/short_shot.h5'
+
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(model_path)
+    numpy_model = NumpyLSTMModel.from_h5(model_path)
+
+    # Random windows in the [0, 1] range the models were trained on
+    windows = np.random.default_rng(0).random((32, 60, 1)).astype(np.float32)
+
+    keras_output = keras_model.predict(windows, verbose=0)
+    numpy_output = numpy_model.predict(windows)
+    max_difference = float(np.max(np.abs(keras_output - numpy_output)))
+
+    print(f'Max absolute difference between Keras and NumPy: {max_difference:.3e}')
+    if max_difference > 1e-5:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
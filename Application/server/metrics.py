@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds - from a tenth of a millisecond for a model step up to the retried upstream fetches
+default_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# Prometheus style metrics served on /metrics, without any extra dependency:
+# # Histogram - counts the observed values in cumulative buckets, with their sum and count
+# # Counter - a value that only goes up
+# # Gauge - a value read from a function when the metrics are collected
+# The values are kept per label combination and updated under a lock, so the worker threads can record them
+class Metric:
+
+    metric_type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def label_values(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def format_labels(self, label_values, extra=()):
+        pairs = list(zip(self.label_names, label_values)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (f'{name}="{escape_label(value)}"' for name, value in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+
+
+class Counter(Metric):
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f'{self.name}{self.format_labels(key)} {format_value(value)}' for key, value in values.items()]
+
+
+class Gauge(Metric):
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def collect(self):
+        return self.header() + [f'{self.name} {format_value(self.function())}']
+
+
+class Histogram(Metric):
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=default_buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # One count per bucket (not cumulative yet), the +Inf count, the sum
+                state = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def collect(self):
+        with self.lock:
+            values = {key: ([*state[0]], state[1], state[2]) for key, state in self.values.items()}
+
+        lines = self.header()
+        for key, (bucket_counts, count, total) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{self.format_labels(key, [("le", format_value(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{self.format_labels(key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{self.format_labels(key)} {format_value(total)}')
+            lines.append(f'{self.name}_count{self.format_labels(key)} {count}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        # The Prometheus text exposition format
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+registry = Registry()
+
+# Content type of the text exposition format
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# The metrics of the prediction pipeline
+fetch_seconds = Histogram('pipeline_fetch_seconds', 'Time spent fetching the prices from the upstream API', ['frequency'])
+prepare_seconds = Histogram('pipeline_prepare_seconds', 'Time spent turning the fetched prices into the model input (DataFrame or ring buffer)', ['frequency'])
+dataframe_seconds = Histogram('predict_dataframe_seconds', 'Time spent building the DataFrame and the historical prices of a prediction', ['model'])
+scale_seconds = Histogram('predict_scale_seconds', 'Time spent fitting the MinMaxScaler', ['model'])
+rollout_seconds = Histogram('predict_rollout_seconds', 'Time spent forecasting the 60 future prices, cache hits included', ['model'])
+model_step_seconds = Histogram('model_step_seconds', 'Time of one model call of the NumPy rollout or of one streaming LSTM step', ['engine'])
+inference_job_seconds = Histogram('inference_job_seconds', 'Forecasting time reported by the inference worker processes')
+serialize_seconds = Histogram('serialize_seconds', 'Time spent encoding a payload', ['target', 'layout', 'encoding'])
+broadcast_seconds = Histogram('websocket_broadcast_seconds', 'Time spent queueing one message for every WebSocket client')
+websocket_send_seconds = Histogram('websocket_send_seconds', 'Time spent sending one message to one WebSocket client')
+tick_to_signal_seconds = Histogram('tick_to_signal_seconds', 'Time from the start of a pipeline run to the broadcast of its signal', ['frequency'])
+
+fetch_errors = Counter('pipeline_fetch_errors_total', 'Pipeline runs without data after all the retries', ['frequency'])
+pipeline_failures = Counter('pipeline_failures_total', 'Pipeline runs that raised an error', ['frequency'])
+skipped_ticks = Counter('pipeline_skipped_ticks_total', 'Ticks skipped because the previous run overran', ['frequency'])
+predictions = Counter('predictions_total', 'Predictions made', ['frequency', 'signal'])
+websocket_dropped = Counter('websocket_dropped_messages_total', 'Messages dropped for WebSocket clients that fell behind')
+websocket_disconnects = Counter('websocket_disconnects_total', 'WebSocket clients disconnected because they were too slow or failed')
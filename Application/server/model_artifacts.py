@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import os
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+from lstm_numpy import read_h5
+
+logger = logging.getLogger(__name__)
+
+# Folder next to the models where the converted artifacts are kept
+converted_folder_name = '.converted'
+
+# Bumped when the layout of the artifact changes, so the old artifacts are converted again
+artifact_format_version = 1
+
+
+# Converted model artifacts - the model config and the weights of a Keras .h5 file, stored in one .npz file:
+# # Loading it skips the h5py group and attribute traversal and the Keras h5 loader - the Keras model is rebuilt from
+# # its config and gets all its weights in one set_weights call, the NumPy model is built from the same arrays
+# # The artifact is named after a hash of the .h5 file, so a changed or replaced model file is converted again
+# # A model that can not be converted is loaded from the .h5 file as before
+def file_digest(model_path):
+    digest = hashlib.blake2b(digest_size=8)
+    with open(model_path, 'rb') as model_file:
+        for block in iter(lambda: model_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def artifact_path(model_path, digest=None):
+    folder = os.path.join(os.path.dirname(os.path.abspath(model_path)), converted_folder_name)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(folder, f'{name}-{digest or file_digest(model_path)}-v{artifact_format_version}.npz')
+
+def convert_model(model_path, output_path):
+    model_config, layer_weights = read_h5(model_path)
+
+    # The weights are stored flat, in layer order - the order Keras set_weights expects for a Sequential model
+    layer_names = [layer['config']['name'] for layer in model_config['config']['layers']]
+    weight_counts = [len(layer_weights.get(name, [])) for name in layer_names]
+    weights = [weight for name in layer_names for weight in layer_weights.get(name, [])]
+
+    # Written to a temporary file first, so a worker never reads half an artifact
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temporary_path = f'{output_path}.{os.getpid()}.tmp.npz'
+    np.savez(temporary_path, model_config=np.array(json.dumps(model_config)), layer_names=np.array(json.dumps(layer_names)),
+             weight_counts=np.array(weight_counts), **{f'weight_{index}': weight for index, weight in enumerate(weights)})
+    os.replace(temporary_path, output_path)
+
+def load_artifact(model_path):
+    # Returns the model config, the weights by layer name and the flat list of weights
+    path = artifact_path(model_path)
+    if not os.path.exists(path):
+        convert_model(model_path, path)
+        logger.info(f"Converted {model_path} to {path}")
+
+    with np.load(path) as artifact:
+        model_config = json.loads(str(artifact['model_config']))
+        layer_names = json.loads(str(artifact['layer_names']))
+        weights = [artifact[f'weight_{index}'] for index in range(int(artifact['weight_counts'].sum()))]
+
+        layer_weights = {}
+        position = 0
+        for name, count in zip(layer_names, artifact['weight_counts'].tolist()):
+            layer_weights[name] = weights[position:position + count]
+            position += count
+    return model_config, layer_weights, weights
+
+def load_keras_model(model_path):
+    from tensorflow.keras.models import load_model, model_from_json
+    try:
+        model_config, _, weights = load_artifact(model_path)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Loading {model_path} without a converted artifact: {e!r}")
+        return load_model(model_path)
+
+    model = model_from_json(json.dumps(model_config))
+    model.set_weights(weights)
+    return model
+
+def load_numpy_model(model_path):
+    from lstm_numpy import NumpyLSTMModel
+    try:
+        model_config, layer_weights, _ = load_artifact(model_path)
+    except (OSError, KeyError) as e:
+        logger.warning(f"Loading {model_path} without a converted artifact: {e!r}")
+        return NumpyLSTMModel.from_h5(model_path)
+    return NumpyLSTMModel.from_config(model_config, layer_weights)
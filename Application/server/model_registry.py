@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+from inference_backend import load_server_rollout_engine
+
+logger = logging.getLogger(__name__)
+
+# The models served by the pipelines - the short shot model predicts the minute and hour pipelines,
+# the long shot model the day pipeline
+default_models = {
+    'short_shot': 'models/short_shot.h5',
+    'long_shot': 'models/long_shot.h5',
+}
+
+# Setting the sequence length for the LSTM input - the shape of the warm-up window
+sequence_length = 60
+
+
+def file_version(model_path):
+    # Changes when the file is replaced or written again
+    stat = os.stat(model_path)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+# One served model - loaded on first use (or by the background loading of the server), warmed up, and swapped for
+# the new file when it changes on disk:
+# # The direct multi-horizon model (training.py --horizon 60) is used instead of the autoregressive one when it
+# # exists, so training it and copying it next to the model is enough to serve it
+# # A new version is loaded and warmed up next to the current one, which keeps serving the forecasts meanwhile,
+# # then replaces it in one assignment - a forecast always runs on one complete model
+# # A version that can not be loaded (a missing file, or a corrupt or foreign .h5 failing with any error) is not retried
+# # until the file changes, and the previous model stays
+class ModelEntry:
+
+    def __init__(self, name, model_path):
+        self.name = name
+        self.model_path = model_path
+        self.direct_model_path = f'{os.path.splitext(model_path)[0]}_direct.h5'
+        self.lock = threading.Lock()
+
+        # (rollout engine, model id, version) of the served model
+        self.loaded = None
+        self.loading = False
+        self.error = None
+        self.failed_version = None
+        self.pending_version = None
+        self.loads = 0
+        self.load_seconds = None
+        self.warm_up_seconds = None
+        self.loaded_at = None
+
+    def current_file(self):
+        return self.direct_model_path if os.path.exists(self.direct_model_path) else self.model_path
+
+    def get(self):
+        # The rollout engine and the model id the forecasts are cached under
+        loaded = self.loaded
+        if loaded is None:
+            loaded = self.load()
+        return loaded[0], loaded[1]
+
+    @property
+    def version(self):
+        loaded = self.loaded
+        return loaded[2] if loaded is not None else None
+
+    def load(self, force=False):
+        with self.lock:
+            model_path = self.current_file()
+            version = f'{os.path.basename(model_path)}:{file_version(model_path)}' if os.path.exists(model_path) else None
+            if self.loaded is not None and self.loaded[2] == version and not force:
+                return self.loaded
+            if self.error is not None and version == self.failed_version and not force:
+                # A new exception every time - raising the stored one again would keep growing its traceback
+                raise RuntimeError(f"The {self.name} model could not be loaded from {model_path}: {self.error}") from None
+
+            self.loading = True
+            try:
+                if version is None:
+                    raise FileNotFoundError(f"{model_path} does not exist")
+                start_time = time.perf_counter()
+                rollout_engine = load_server_rollout_engine(model_path, version=version)
+                load_seconds = time.perf_counter() - start_time
+
+                # The first forecast traces and compiles the rollout - it is run here instead of in the first prediction
+                start_time = time.perf_counter()
+                rollout_engine.forecast_batch(np.zeros((1, sequence_length)), np.zeros(1), np.ones(1))
+                warm_up_seconds = time.perf_counter() - start_time
+            except Exception as e:
+                # h5py and the Keras deserializer raise KeyError, TypeError and others for a file they can not read
+                self.error = f'{e!r}'
+                self.failed_version = version
+                logger.error(f"Could not load the {self.name} model from {model_path}: {e!r}")
+                raise
+            finally:
+                self.loading = False
+
+            self.loaded = (rollout_engine, f'{self.name}@{version}', version)
+            self.error = None
+            self.failed_version = None
+            self.loads += 1
+            self.load_seconds = load_seconds
+            self.warm_up_seconds = warm_up_seconds
+            self.loaded_at = time.time()
+            logger.info(f"Loaded the {self.name} model from {model_path} in {load_seconds:.2f}s, warmed up in {warm_up_seconds:.2f}s")
+            return self.loaded
+
+    def reload_if_changed(self):
+        # Reloads a model that was loaded before and whose file changed since - a file that is still being written
+        # keeps changing, so a new version is only loaded once it was seen the same on two checks in a row
+        if self.loaded is None or self.loading:
+            return False
+        model_path = self.current_file()
+        try:
+            version = f'{os.path.basename(model_path)}:{file_version(model_path)}'
+        except OSError:
+            return False
+        if version == self.loaded[2] or version == self.failed_version:
+            return False
+        if version != self.pending_version:
+            self.pending_version = version
+            return False
+        try:
+            self.load()
+        except Exception:
+            return False
+        return True
+
+    def stats(self):
+        if self.loading:
+            state = 'loading'
+        elif self.loaded is not None:
+            state = 'ready'
+        elif self.error is not None:
+            state = 'failed'
+        else:
+            state = 'not loaded'
+        return {
+            'state': state,
+            'file': self.current_file(),
+            'version': self.version,
+            'error': self.error,
+            'loads': self.loads,
+            'load_seconds': round(self.load_seconds, 4) if self.load_seconds is not None else None,
+            'warm_up_seconds': round(self.warm_up_seconds, 4) if self.warm_up_seconds is not None else None,
+            'loaded_at': self.loaded_at,
+        }
+
+
+class ModelRegistry:
+
+    def __init__(self, model_paths=default_models):
+        self.entries = {name: ModelEntry(name, model_path) for name, model_path in model_paths.items()}
+
+    def __getitem__(self, name):
+        return self.entries[name]
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def load_all(self, force=False):
+        # Loads every model, a model that fails does not stop the others - returns the names of the loaded ones
+        loaded = []
+        for name, entry in self.entries.items():
+            try:
+                entry.load(force)
+            except Exception:
+                continue
+            loaded.append(name)
+        return loaded
+
+    def reload_changed(self):
+        return [name for name, entry in self.entries.items() if entry.reload_if_changed()]
+
+    async def watch(self, interval):
+        # Checks the model files every interval seconds, the loading runs in a worker thread
+        while True:
+            await asyncio.sleep(interval)
+            reloaded = await asyncio.to_thread(self.reload_changed)
+            if reloaded:
+                logger.info(f"Reloaded the changed models: {reloaded}")
+
+    def stats(self):
+        return {name: entry.stats() for name, entry in self.entries.items()}
+
+
+# The models of the server, loaded when they are first used
+model_registry = ModelRegistry()
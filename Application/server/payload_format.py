@@ -0,0 +1,191 @@
+# Payload formats of the signals sent on /signals and on the WebSocket
+# # legacy - the snapshots as predict.py builds them: lists of {'time': date string, 'price': price string} objects,
+# #          the shape the React client reads
+# # compact - the same snapshots with the prices as columns: {'time': [epoch milliseconds], 'price': [floats]}
+# The payloads are encoded as JSON (with orjson when it is installed) or as MessagePack (when msgpack is installed)
+#
+# Size and encode time comparison: python payload_format.py
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# orjson and msgpack are optional - without orjson the standard json module is used,
+# without msgpack the MessagePack encoding is not offered
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+layouts = ('legacy', 'compact')
+encodings = ('json', 'msgpack')
+
+# Number of compacted snapshots kept, enough for the histories of the three pipelines
+compact_cache_size = 64
+
+
+def to_epoch_ms(time_string):
+    # The dates written by predict.py - dates without a time zone are UTC, like the fetched prices
+    parsed = datetime.fromisoformat(time_string.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(round(parsed.timestamp() * 1000))
+
+def compact_prices(prices):
+    return {
+        'time': [to_epoch_ms(item['time']) for item in prices],
+        'price': [float(item['price']) for item in prices],
+    }
+
+# A snapshot never changes once it is made, so it is compacted once and reused for every client and every request
+# The cache is keyed by the id of the snapshot and keeps the snapshot itself, so an id can not be reused meanwhile
+compact_cache = OrderedDict()
+compact_cache_lock = threading.Lock()
+
+def compact_snapshot(snapshot):
+    key = id(snapshot)
+    with compact_cache_lock:
+        cached = compact_cache.get(key)
+        if cached is not None and cached[0] is snapshot:
+            compact_cache.move_to_end(key)
+            return cached[1]
+
+    compact = dict(snapshot)
+    compact['historical_prices'] = compact_prices(snapshot['historical_prices'])
+    compact['future_prices'] = compact_prices(snapshot['future_prices'])
+
+    with compact_cache_lock:
+        compact_cache[key] = (snapshot, compact)
+        if len(compact_cache) > compact_cache_size:
+            compact_cache.popitem(last=False)
+    return compact
+
+def compact_message(message):
+    # Compacting the snapshots of a /signals body or of a WebSocket message, the other fields are kept
+    compact = dict(message)
+    if isinstance(message.get('signal_data'), list):
+        compact['signal_data'] = [compact_snapshot(snapshot) for snapshot in message['signal_data']]
+    if isinstance(message.get('signal'), dict):
+        compact['signal'] = compact_snapshot(message['signal'])
+    return compact
+
+def encode_json(message):
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message, separators=(",", ":")).encode()
+
+def encode_msgpack(message):
+    return msgpack.packb(message, use_bin_type=True)
+
+
+# A negotiated layout and encoding - the encoding falls back to JSON when msgpack is not installed
+class PayloadFormat:
+
+    def __init__(self, layout='legacy', encoding='json'):
+        if layout not in layouts:
+            raise ValueError(f"Unknown payload layout: {layout}")
+        if encoding not in encodings:
+            raise ValueError(f"Unknown payload encoding: {encoding}")
+        if encoding == 'msgpack' and msgpack is None:
+            encoding = 'json'
+        self.layout = layout
+        self.encoding = encoding
+        self.key = (layout, encoding)
+
+    @classmethod
+    def negotiate(cls, layout=None, encoding=None):
+        # Unknown values fall back to the legacy JSON payload the React client reads
+        layout = layout if layout in layouts else 'legacy'
+        encoding = encoding if encoding in encodings else 'json'
+        return cls(layout, encoding)
+
+    @property
+    def media_type(self):
+        return 'application/msgpack' if self.encoding == 'msgpack' else 'application/json'
+
+    def encode(self, message):
+        # Returns bytes - JSON is sent as text frames and MessagePack as binary frames on the WebSocket
+        if self.layout == 'compact':
+            message = compact_message(message)
+        if self.encoding == 'msgpack':
+            return encode_msgpack(message)
+        return encode_json(message)
+
+    def is_binary(self):
+        return self.encoding == 'msgpack'
+
+
+legacy_format = PayloadFormat()
+
+
+def sample_snapshot(index=0):
+    # A snapshot shaped like the ones predict.py makes in minute mode - 61 historical and 60 future prices
+    start = 1719870000 + index * 61
+    historical_prices = [
+        {'time': str(datetime.fromtimestamp(start + i, tz=timezone.utc)), 'price': str(61234.123456789 + i * 1.37)}
+        for i in range(61)
+    ]
+    future_prices = [
+        {'time': datetime.fromtimestamp(start + 61 + i, tz=timezone.utc).isoformat(), 'price': f'{61300.0 + i * 0.71:.2f}'}
+        for i in range(60)
+    ]
+    return {
+        'historical_prices': historical_prices,
+        'future_prices': future_prices,
+        'signal': 'Hold',
+        'time': '2024-07-01 21:38:00',
+        'profit': 0,
+    }
+
+def time_encoding(encode, message, repeats):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        payload = encode(message)
+    return len(payload), (time.perf_counter() - start_time) / repeats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Size and encode time of the signal payload formats')
+    parser.add_argument('--snapshots', type=int, default=10, help='number of snapshots in the full history')
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    history = [sample_snapshot(i) for i in range(args.snapshots)]
+    messages = {
+        'full history': {'signal_data': history, 'frequency': 'minute'},
+        'one signal': {'signal': history[-1], 'frequency': 'minute'},
+    }
+
+    encoders = [('legacy', 'json (stdlib)', lambda message: json.dumps(message, separators=(",", ":")).encode())]
+    for layout in layouts:
+        if orjson is not None:
+            encoders.append((layout, 'json (orjson)', PayloadFormat(layout, 'json').encode))
+        if msgpack is not None:
+            encoders.append((layout, 'msgpack', PayloadFormat(layout, 'msgpack').encode))
+        if layout == 'compact' and orjson is None:
+            encoders.append((layout, 'json (stdlib)', PayloadFormat(layout, 'json').encode))
+
+    print(f"{'message':<14} {'layout':<8} {'encoding':<14} {'bytes':>9} {'encode us':>10}")
+    for message_name, message in messages.items():
+        for layout, encoding_name, encode in encoders:
+            # The first call compacts the snapshots - the timing is the one of the following, cached calls
+            encode(message)
+            size, seconds = time_encoding(encode, message, args.repeats)
+            print(f"{message_name:<14} {layout:<8} {encoding_name:<14} {size:>9} {seconds * 1e6:>10.1f}")
+
+    # The one time cost of compacting a snapshot, paid when it is first sent in the compact layout
+    compact_cache.clear()
+    start_time = time.perf_counter()
+    for snapshot in history:
+        compact_snapshot(snapshot)
+    print(f"Compacting a snapshot (once per snapshot): {(time.perf_counter() - start_time) / len(history) * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -4,25 +4,32 @@ import numpy as np
 # Pandas library is used for data manipulation
 import pandas as pd
 
-# A very popular library for plotting graphs
-import matplotlib.pyplot as plt
-
-# Using the TensorFlow library for machine learning
-import tensorflow as tf
-
-# Importing model importing function from Keras
-from tensorflow.keras.models import load_model
-
 # A sklearn MinMaxScaler for normalization of our dataset
 from sklearn.preprocessing import MinMaxScaler
 
 #
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+import logging
+import time
 
 import global_var
 
-# Loading the pre-trained model
-model = load_model('models/short_shot.h5')
+# Latency histograms served on /metrics
+import metrics
+
+# The served models - loaded on first use or in the background, and reloaded when their file changes
+from model_registry import model_registry
+
+# Forecasts are cached by input window, so an unchanged window does not run the model again
+from forecast_cache import forecast_cache
+
+logger = logging.getLogger(__name__)
+
+# The short shot model predicts the minute and hour pipelines, the long shot model the day pipeline
+# Every function takes the name of the model in the registry - the pre-trained model wrapped in its rollout engine,
+# so a forecast is a single call
+default_model_name = 'short_shot'
 
 # Thresholds for determining the strength of the trend
 # Short - Shot
@@ -34,16 +41,6 @@ model = load_model('models/short_shot.h5')
 upward_threshold = 0.01
 downward_threshold = -0.01
 
-# Prepare sequences for LSTM model - the exact same func like in the testing script
-def create_sequences(data, seq_length):
-    xs, ys = [], []
-    for i in range(len(data) - seq_length):
-        x = data[i:i + seq_length]
-        y = data[i + seq_length]
-        xs.append(x)
-        ys.append(y)
-    return np.array(xs), np.array(ys)
-
 def create_timestamp():
     time_now = datetime.now().isoformat()
 
@@ -64,11 +61,13 @@ def compute_percentage_differene(last_price, future_prices_mean):
 
     return percentage_increase
 
-def predict_next_trend(data_frame):
+def predict_next_trend(data_frame, model_name=default_model_name):
 
     # Loading the data from CSV
     df = data_frame
 
+    start_time = time.perf_counter()
+
     # Convert 'Date' column to datetime and set as index - same as in the training and testing scripts
     df['time'] = pd.to_datetime(df['time'])
     df.set_index('time', inplace=True)
@@ -76,87 +75,94 @@ def predict_next_trend(data_frame):
     # Extract 'Close' prices
     close_prices = df['price'].values.reshape(-1, 1)
 
-    # Normalizing data
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(close_prices)
+    dataframe_time = time.perf_counter() - start_time
 
-    # Setting the sequence length for the LSTM input
-    sequence_length = 60
+    # Normalizing data - the scaler is fitted here, the window is scaled inside the rollout engine
+    with metrics.scale_seconds.time(model=model_name):
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaler.fit(close_prices)
 
-    # Calling the create sequences func
-    X, y = create_sequences(scaled_data, sequence_length)
+    start_time = time.perf_counter()
+    data_frame.index.name = 'time'
+    # Reset the index to convert 'time' into a column
+    df_reset = data_frame.reset_index()
+    # Convert 'time' column to string
+    df_reset['time'] = df_reset['time'].astype(str)
+    # Convert DataFrame to array of objects
+    array_of_historical_price = df_reset.to_dict(orient='records')
+    metrics.dataframe_seconds.observe(dataframe_time + time.perf_counter() - start_time, model=model_name)
 
-    # Printing shapes to understand the dimensions
-    print(f"Shape of X before reshaping: {X.shape}")
-    print(f"Shape of y: {y.shape}")
+    return forecast_next_trend(close_prices, scaler, array_of_historical_price, model_name=model_name)
 
-    # Ensure X has the right shape before reshaping
-    # The array X must be 3-dimensional.
-    # The second dimension of X (which corresponds to the sequence length) must match the expected sequence_length.
-    if X.ndim == 3 and X.shape[1] == sequence_length:
-        X = np.reshape(X, (X.shape[0], X.shape[1], 1))
-    else:
-        print("Error: X does not have the expected number of dimensions or sequence length.")
+def predict_next_trend_from_window(times, prices, data_min, data_max, future_prices=None, model_name=default_model_name,
+                                   price_strings=None):
+    # The same prediction for the last 61 ticks of the minute mode ring buffer, without building a DataFrame
+    # times are epoch seconds, prices are floats, data_min and data_max are the rolling min and max of the prices
+    # future_prices can be given when the forecast was already made, e.g. by the streaming forecaster
+    # price_strings are the prices as they were fetched - the DataFrame based version sends them unchanged ('30000.00'),
+    # str() of the float would not ('30000.0')
 
-    # Debugging: Print shape after reshaping
-    print(f"Shape of X after reshaping: {X.shape}")
+    # The scaler is fitted on the min and max only, which gives the same parameters as fitting it on all the prices
+    with metrics.scale_seconds.time(model=model_name):
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaler.fit([[data_min], [data_max]])
 
-    # Reshape this sequence to match the model's expected input shape: (1, sequence_length, 1)
-    current_sequence = scaled_data[60 - sequence_length:60].reshape(1, sequence_length, 1)
+    # The historical prices in the same format as the DataFrame based version
+    with metrics.dataframe_seconds.time(model=model_name):
+        if price_strings is None:
+            price_strings = [str(price) for price in prices.tolist()]
+        array_of_historical_price = [
+            {'time': str(datetime.fromtimestamp(tick_time, tz=timezone.utc)), 'price': price}
+            for tick_time, price in zip(times.tolist(), price_strings)
+        ]
 
-    # Retrieve the current price by inversely transforming the current point in scaled_data to the original scale
-    current_price = scaler.inverse_transform(scaled_data[60].reshape(-1, 1))[0, 0]
-    
-    # Initializijg  an empty list to store the predicted future prices.
-    future_prices = []
+    return forecast_next_trend(prices.reshape(-1, 1), scaler, array_of_historical_price, future_prices, model_name)
 
-    for j in range(60):
+def forecast_next_trend(close_prices, scaler, array_of_historical_price, future_prices=None, model_name=default_model_name):
 
-        # Predict the next value using the current sequence and add this value to future_prices
-        next_value = model.predict(current_sequence)[0, 0]
-        next_price = scaler.inverse_transform([[next_value]])[0, 0]
-        future_prices.append(next_price)
-        
-        # Update the current sequence by appending the new predicted value and dropping the oldest value
-        new_value_scaled = scaler.transform([[next_price]])
-        current_sequence = np.append(current_sequence[:, 1:, :], new_value_scaled.reshape(1, 1, 1), axis=1)
+    # Setting the sequence length for the LSTM input
+    sequence_length = 60
+
+    # The sequence used for forecasting - the first 60 prices, the same points the scaled sequence was taken from
+    current_sequence = close_prices[60 - sequence_length:60, 0].astype(np.float64)
+
+    # Retrieve the current price by inversely transforming the current point in scaled_data to the original scale
+    current_price = scaler.inverse_transform(scaler.transform(close_prices[60].reshape(-1, 1)))[0, 0]
 
-    # Inverse transform predictions to get actual prices - similar to what was done in the training script
-    predicted_prices = scaler.inverse_transform(np.array(current_sequence).reshape(-1, 1))
+    # Predict the next 60 prices in one call - the window shifting and the scaling are done inside the compiled rollout
+    # The forecasts are cached under the model id, which changes with the version of the model file
+    if future_prices is None:
+        rollout_engine, model_id = model_registry[model_name].get()
+        with metrics.rollout_seconds.time(model=model_name):
+            future_prices = forecast_cache.forecast(model_id, rollout_engine, current_sequence, scaler)
+
+    # After 60 steps the sequence is made only of predicted values, which are already in the original scale
+    predicted_prices = future_prices.reshape(-1, 1)
     
     # Calculate the average predicted price change percentage using the mean of future_prices
     predicted_change_percentage = (np.mean(future_prices) - current_price) / current_price * 100
     mean_of_future_prices = float(np.mean(future_prices))
-    print(mean_of_future_prices)
-    print(current_price)
-    print(predicted_change_percentage)
+    logger.debug(f"Mean of future prices: {mean_of_future_prices}, current price: {current_price}, "
+                 f"predicted change: {predicted_change_percentage}")
 
     return_signal = ''
 
     # Strong upward trend detected, decide to buy
     if predicted_change_percentage > upward_threshold:
         return_signal = 'Buy'
-        global_var.last_BTC_buy_price = df['price'].iloc[-1]
-        print('Strong Buy signal with a predicted increase percentage of: ' + str(predicted_change_percentage))
+        global_var.last_BTC_buy_price = array_of_historical_price[-1]['price']
+        logger.info('Strong Buy signal with a predicted increase percentage of: ' + str(predicted_change_percentage))
     # Strong downward trend detected, decide to sell
     elif predicted_change_percentage < downward_threshold:
         return_signal = 'Sell'
-        print('Strong Sell signal with a predicted decrease percentage of: ' + str(predicted_change_percentage))
+        logger.info('Strong Sell signal with a predicted decrease percentage of: ' + str(predicted_change_percentage))
     # Weak trend detected, hold position
     else:
-        print('Weak Sell/Buy signal - Holding')
+        logger.info('Weak Sell/Buy signal - Holding')
         return_signal = 'Hold'
         pass   
 
 
-    data_frame.index.name = 'time'
-    # Reset the index to convert 'time' into a column
-    df_reset = data_frame.reset_index()
-    # Convert 'time' column to string
-    df_reset['time'] = df_reset['time'].astype(str)
-    # Convert DataFrame to array of objects
-    array_of_historical_price = df_reset.to_dict(orient='records')
-
     # Convert the data to the desired format
     array_of_future_price_before = [{'price': f'{price[0]:.2f}'} for price in predicted_prices]
     # Get the last time item from the first array
@@ -0,0 +1,232 @@
+# Price Store
+# The Yahoo style CSV files (Date,Open,High,Low,Close,Adj Close,Volume) are converted once into a columnar format:
+# # One .npy file per column - the dates as int64 epoch seconds (UTC) and every numeric column as float64
+# # A meta.json file with the column names and the size and modification time of the source CSV
+# # The converted files sit in a .price_store folder next to the CSV and are rebuilt when the CSV changes
+# The columns are opened memory mapped, so loading is instant and a slice only reads the rows it needs
+# Several processes can load the same CSV for the first time together (the workers of a search or a backtest matrix):
+# # Every writer converts into its own temporary folder and moves it in place with one rename
+# # A writer that finds an up to date dataset already in place discards its own copy
+# # An outdated dataset is renamed aside before it is removed, so a reader never opens a folder that is being removed,
+# #   and the readers that opened it before keep their memory mapped columns
+#
+# Usage: python price_store.py convert ../../Backtesting_script/data
+#        python price_store.py list ../../Backtesting_script/data
+
+import argparse
+import copy
+import json
+import os
+import re
+import shutil
+import sys
+import uuid
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+# Name of the folder holding the converted datasets, next to the CSV files
+store_folder_name = '.price_store'
+
+# Version of the stored format - datasets written with another version are converted again
+store_format_version = 1
+
+# Column names tried, in order, for the dates
+date_column_names = ['Date', 'Time', 'time', 'date', 'Timestamp']
+
+
+def column_file_name(column):
+    # 'Adj Close' -> 'adj_close.npy'
+    return re.sub(r'[^0-9a-zA-Z]+', '_', column).strip('_').lower() + '.npy'
+
+def dataset_folder(csv_path):
+    csv_path = os.path.abspath(csv_path)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), store_folder_name, name)
+
+def source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def is_up_to_date(csv_path):
+    meta_path = os.path.join(dataset_folder(csv_path), 'meta.json')
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        # Not converted yet, or renamed aside by another writer meanwhile
+        return False
+    return meta.get('version') == store_format_version and meta.get('source') == source_signature(csv_path)
+
+def convert_csv(csv_path, force=False):
+    folder = dataset_folder(csv_path)
+    if not force and is_up_to_date(csv_path):
+        return folder
+
+    # Parsing the CSV and the dates - this is the only time it happens for this file
+    df = pd.read_csv(csv_path)
+    date_column = next((name for name in date_column_names if name in df.columns), df.columns[0])
+    dates = pd.to_datetime(df[date_column], utc=True)
+    timestamps = dates.dt.as_unit('s').astype('int64').values
+
+    # Written to a temporary folder of this writer first and then moved in place, so a reader never sees half a dataset
+    writer_id = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+    temporary_folder = f'{folder}.{writer_id}.tmp'
+    os.makedirs(temporary_folder)
+
+    np.save(os.path.join(temporary_folder, 'timestamp.npy'), timestamps)
+    columns = {}
+    for column in df.columns:
+        if column == date_column or not pd.api.types.is_numeric_dtype(df[column]):
+            continue
+        file_name = column_file_name(column)
+        np.save(os.path.join(temporary_folder, file_name), df[column].values.astype(np.float64))
+        columns[column] = file_name
+
+    meta = {
+        'version': store_format_version,
+        'source': source_signature(csv_path),
+        'source_name': os.path.basename(csv_path),
+        'date_column': date_column,
+        'columns': columns,
+        'rows': int(len(df)),
+        'ascending': bool(np.all(np.diff(timestamps) >= 0)),
+        'start': int(timestamps[0]) if len(timestamps) else None,
+        'end': int(timestamps[-1]) if len(timestamps) else None,
+    }
+    with open(os.path.join(temporary_folder, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    publish_folder(temporary_folder, folder, csv_path, writer_id, force)
+    return folder
+
+def publish_folder(temporary_folder, folder, csv_path, writer_id, force=False):
+    while True:
+        # The rename fails when the folder exists - it is only ever replaced as a whole
+        try:
+            os.rename(temporary_folder, folder)
+            return
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+
+        # Another writer converted the same CSV meanwhile
+        if not force and is_up_to_date(csv_path):
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+            return
+
+        # The dataset in place is outdated - renamed aside first, only this writer removes it
+        stale_folder = f'{folder}.{writer_id}.stale'
+        try:
+            os.rename(folder, stale_folder)
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(stale_folder, ignore_errors=True)
+        force = False
+
+
+# A converted dataset - every column is a read only memory mapped NumPy array
+class PriceSeries:
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+
+        # Every column is mapped here - opening it is cheap, the pages are only read when the values are used,
+        # and an open dataset keeps working when a newer conversion replaces its folder
+        self.timestamps = np.load(os.path.join(folder, 'timestamp.npy'), mmap_mode='r')
+        self.columns = {column: np.load(os.path.join(folder, file_name), mmap_mode='r')
+                        for column, file_name in self.meta['columns'].items()}
+        self.column_names = list(self.meta['columns'])
+        self.start = 0
+        self.stop = len(self.timestamps)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, column):
+        return self.columns[column][self.start:self.stop]
+
+    @property
+    def time(self):
+        return self.timestamps[self.start:self.stop]
+
+    def slice(self, start_time=None, end_time=None):
+        # Selecting the rows between two dates (inclusive start, exclusive end) without reading the other rows
+        # The times can be epoch seconds or anything pandas understands as a date
+        if not self.meta['ascending']:
+            raise ValueError(f"{self.meta['source_name']} is not sorted by date and can not be sliced by time")
+        sliced = copy.copy(self)
+        time = self.time
+        if start_time is not None:
+            sliced.start = self.start + int(np.searchsorted(time, to_epoch_seconds(start_time), side='left'))
+        if end_time is not None:
+            sliced.stop = self.start + int(np.searchsorted(time, to_epoch_seconds(end_time), side='left'))
+        return sliced
+
+    def to_dataframe(self, columns=None):
+        # A DataFrame indexed by 'Date', like the scripts build from the CSV - the dates come from the int64 timestamps
+        columns = columns or self.column_names
+        df = pd.DataFrame({column: self[column] for column in columns})
+        df.index = pd.to_datetime(np.asarray(self.time), unit='s', utc=True)
+        df.index.name = 'Date'
+        return df
+
+def to_epoch_seconds(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+
+    # Dates without a time zone are taken as UTC, like the stored timestamps
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return int(timestamp.timestamp())
+
+def load_prices(csv_path, attempts=3):
+    # Converts the CSV on first use (or when it changed) and opens the stored columns
+    # The folder can be replaced by another writer between the conversion and the opening - it is opened again then
+    for attempt in range(attempts):
+        folder = convert_csv(csv_path)
+        try:
+            return PriceSeries(folder)
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+
+def find_csv_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, folders, files in os.walk(path):
+                folders[:] = [folder for folder in folders if folder != store_folder_name]
+                for file_name in sorted(files):
+                    if file_name.lower().endswith('.csv'):
+                        yield os.path.join(root, file_name)
+        else:
+            yield path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Columnar memory mapped price store')
+    parser.add_argument('command', choices=['convert', 'list'])
+    parser.add_argument('paths', nargs='+', help='CSV files or folders containing CSV files')
+    parser.add_argument('--force', action='store_true', help='convert again even if the stored dataset is up to date')
+    args = parser.parse_args(argv)
+
+    for csv_path in find_csv_files(args.paths):
+        if args.command == 'convert':
+            try:
+                convert_csv(csv_path, force=args.force)
+            except (ValueError, KeyError, pd.errors.ParserError) as error:
+                print(f'Skipping {csv_path}: {error}', file=sys.stderr)
+                continue
+        if is_up_to_date(csv_path):
+            meta = PriceSeries(dataset_folder(csv_path)).meta
+            print(f"{csv_path}: {meta['rows']} rows, columns {', '.join(meta['columns'])}")
+        else:
+            print(f'{csv_path}: not converted')
+
+if __name__ == "__main__":
+    main()
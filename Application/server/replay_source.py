@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+from price_store import load_prices
+from scheduler import pipeline_periods
+
+logger = logging.getLogger(__name__)
+
+# Bundled datasets replayed when no other CSV is given - minute prices for the minute and hour pipelines,
+# daily prices for the day pipeline
+data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Backtesting_script', 'data')
+default_minute_csv = os.path.join(data_folder, 'BTC-USD_24H_test_01.csv')
+default_daily_csv = os.path.join(data_folder, 'BTC-USD_3Y_Testing.csv')
+
+# The windows the CoinGecko charts cover - 24 hours of 5 minutes prices, 60 days (plus the current one) of daily prices
+chart_seconds = 24 * 3600
+chart_interval = 300
+daily_chart_days = 60
+
+
+# A price series that can be read past its end - it starts again, with the times shifted by its length
+class LoopedSeries:
+
+    def __init__(self, csv_path):
+        prices = load_prices(csv_path)
+        self.name = os.path.basename(csv_path)
+        self.times = np.asarray(prices.time, dtype=np.int64)
+        self.close = np.asarray(prices['Close'], dtype=np.float64)
+        if len(self.close) < 2:
+            raise ValueError(f"{self.name} needs at least 2 rows to be replayed")
+
+        # The spacing of the rows, and the time the series is shifted by on every loop
+        self.step = int(np.median(np.diff(self.times)))
+        self.span = int(self.times[-1] - self.times[0]) + self.step
+
+    def __len__(self):
+        return len(self.close)
+
+    def rows_for(self, seconds):
+        return max(1, seconds // self.step)
+
+    def window(self, end, size, stride=1):
+        # The rows end - size + 1 ... end of the looped series, every stride-th one ending with the row end
+        indices = np.arange(end - size + 1, end + 1)[::-1][::stride][::-1]
+        loops, positions = np.divmod(indices, len(self.close))
+        return self.times[positions] + loops * self.span, self.close[positions]
+
+
+# Historical replay in place of the Coinbase and CoinGecko APIs, for soak and latency testing without the network:
+# # Every pipeline has its own cursor in the replayed data and every fetch moves it forward by one period of the
+# # pipeline - one row of the minute dataset, one hour of it for the 5 minutes chart, one row of the daily dataset
+# # The datasets are looped when they end, with the times shifted by the length of the dataset, so the replay can
+# # run for days of simulated time and the times keep growing
+# # The replay does not wait - how fast it runs is set by the scheduler periods (replay_periods)
+class CsvReplay:
+
+    def __init__(self, minute_csv=default_minute_csv, daily_csv=default_daily_csv):
+        self.minutes = LoopedSeries(minute_csv)
+        self.days = LoopedSeries(daily_csv)
+        self.lock = threading.Lock()
+
+        # The hour and day pipelines start with a full chart of history behind their cursor
+        self.cursors = {
+            'minute': 0,
+            'hour': self.minutes.rows_for(chart_seconds) - 1,
+            'day': daily_chart_days,
+        }
+
+    def advance(self, frequency):
+        with self.lock:
+            cursor = self.cursors[frequency]
+            self.cursors[frequency] += self.minutes.rows_for(3600) if frequency == 'hour' else 1
+        return cursor
+
+    def next(self, frequency):
+        cursor = self.advance(frequency)
+        if frequency == 'minute':
+            times, prices = self.minutes.window(cursor, 1)
+            return ticker_payload(times[0], prices[0], cursor)
+        if frequency == 'hour':
+            size = self.minutes.rows_for(chart_seconds)
+            return chart_payload(*self.minutes.window(cursor, size, self.minutes.rows_for(chart_interval)))
+        return chart_payload(*self.days.window(cursor, daily_chart_days + 1))
+
+    def simulated_time(self, frequency):
+        # Time of the data the pipeline fetched last
+        series = self.days if frequency == 'day' else self.minutes
+        with self.lock:
+            cursor = self.cursors[frequency] - (self.minutes.rows_for(3600) if frequency == 'hour' else 1)
+        return int(series.window(max(cursor, 0), 1)[0][0])
+
+
+# Replay of a recording made by TickRecorder - the payloads of every frequency are returned in the recorded order,
+# then None once the recording ends, the same as a failed fetch
+# Every frequency reads the file on its own, line by line, so a recording of several days is never held in memory
+class RecordedReplay:
+
+    def __init__(self, recording_path):
+        self.recording_path = recording_path
+        self.lock = threading.Lock()
+        self.readers = {frequency: self.read(frequency) for frequency in pipeline_periods}
+        self.times = {}
+
+    def read(self, frequency):
+        with open(self.recording_path) as recording_file:
+            for line in recording_file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a recording that was stopped while writing
+                    logger.warning(f"Skipping a broken line of {self.recording_path}")
+                    continue
+                if entry['frequency'] == frequency:
+                    yield entry
+
+    def next(self, frequency):
+        with self.lock:
+            entry = next(self.readers[frequency], None)
+        if entry is None:
+            return None
+        self.times[frequency] = entry['time']
+        return entry['data']
+
+    def simulated_time(self, frequency):
+        return self.times.get(frequency)
+
+
+def ticker_payload(tick_time, price, trade_id):
+    # The shape of the Coinbase ticker - the data handler reads the time and the price
+    return {
+        'ask': f'{price + 0.01:.2f}',
+        'bid': f'{price - 0.01:.2f}',
+        'volume': '0.0',
+        'trade_id': int(trade_id),
+        'price': f'{price:.2f}',
+        'size': '0.0',
+        'time': datetime.fromtimestamp(int(tick_time), tz=timezone.utc).isoformat().replace('+00:00', 'Z'),
+    }
+
+def chart_payload(times, prices):
+    # The shape of the CoinGecko market chart - [epoch milliseconds, price] pairs
+    return {'prices': [[int(chart_time) * 1000, float(price)] for chart_time, price in zip(times, prices)]}
+
+
+# Drop in replacements of DataFetching and AsyncDataFetching, reading from a replay source
+class ReplayDataFetching:
+
+    def __init__(self, source):
+        self.source = source
+
+    def get_latest_bitcoin_price(self):
+        return self.source.next('minute')
+
+    def get_5_minutes_bitcoin_prices(self):
+        return self.source.next('hour')
+
+    def get_daily_bitcoin_prices(self):
+        return self.source.next('day')
+
+
+class AsyncReplayDataFetching:
+
+    def __init__(self, source):
+        self.source = source
+
+    async def get_latest_bitcoin_price(self):
+        return self.source.next('minute')
+
+    async def get_5_minutes_bitcoin_prices(self):
+        return self.source.next('hour')
+
+    async def get_daily_bitcoin_prices(self):
+        return self.source.next('day')
+
+    async def close(self):
+        pass
+
+
+# Append only recording of the fetched data, one JSON line per fetch: {"frequency", "time", "data"}
+# Every line is flushed when it is written, so a recording cut by a crash or a restart keeps everything before it,
+# and a restarted recorder continues the same file
+class TickRecorder:
+
+    def __init__(self, recording_path):
+        self.recording_path = recording_path
+        self.lock = threading.Lock()
+        self.recording_file = open(recording_path, 'a', buffering=1)
+        self.lines = 0
+
+    def record(self, frequency, data):
+        line = json.dumps({'frequency': frequency, 'time': time.time(), 'data': data}, separators=(',', ':'))
+        with self.lock:
+            self.recording_file.write(line + '\n')
+            self.lines += 1
+
+    def close(self):
+        with self.lock:
+            self.recording_file.close()
+
+
+# Wraps the live AsyncDataFetching and records every payload it returns
+class RecordingAsyncDataFetching:
+
+    def __init__(self, fetch_manager, recorder):
+        self.fetch_manager = fetch_manager
+        self.recorder = recorder
+
+    async def fetch(self, frequency, get):
+        data = await get()
+        if data is not None:
+            self.recorder.record(frequency, data)
+        return data
+
+    async def get_latest_bitcoin_price(self):
+        return await self.fetch('minute', self.fetch_manager.get_latest_bitcoin_price)
+
+    async def get_5_minutes_bitcoin_prices(self):
+        return await self.fetch('hour', self.fetch_manager.get_5_minutes_bitcoin_prices)
+
+    async def get_daily_bitcoin_prices(self):
+        return await self.fetch('day', self.fetch_manager.get_daily_bitcoin_prices)
+
+    async def close(self):
+        await self.fetch_manager.close()
+        self.recorder.close()
+
+
+def replay_periods(speed):
+    # The scheduler periods for a replay speed-up - 0 runs every pipeline as fast as possible
+    if speed <= 0:
+        return {name: 0 for name in pipeline_periods}
+    return {name: period / speed for name, period in pipeline_periods.items()}
+
+def load_replay_source(recording_path=None, minute_csv=None, daily_csv=None):
+    # A recording is replayed when given, the CSV files otherwise
+    if recording_path:
+        return RecordedReplay(recording_path)
+    return CsvReplay(minute_csv or default_minute_csv, daily_csv or default_daily_csv)
+
+
+async def soak(source, frequencies, speed, duration):
+    # Runs the pipelines of the server against the replay for duration seconds of wall time
+    from data_handler import DataHandler
+    from scheduler import PipelineScheduler
+    from inference_backend import server_inference_pool
+    from model_registry import model_registry
+
+    data_handlers = {frequency: DataHandler(ReplayDataFetching(source), AsyncReplayDataFetching(source)) for frequency in frequencies}
+
+    async def run(frequency):
+        await data_handlers[frequency].populate_array_async(frequency)
+
+    # The workers are started and the models loaded before the pipelines, like in the server
+    pool = server_inference_pool()
+    if pool is not None:
+        await pool.start()
+    await asyncio.to_thread(model_registry.load_all)
+
+    scheduler = PipelineScheduler(run, {frequency: replay_periods(speed)[frequency] for frequency in frequencies})
+    start_time = time.perf_counter()
+    for frequency in frequencies:
+        scheduler.start(frequency)
+    await asyncio.sleep(duration)
+    await scheduler.stop_all()
+    elapsed = time.perf_counter() - start_time
+
+    if pool is not None:
+        pool.shutdown()
+
+    report = {}
+    for frequency, stats in scheduler.stats().items():
+        simulated_time = source.simulated_time(frequency)
+        report[frequency] = {
+            'runs': stats['runs'],
+            'failures': stats['failures'],
+            'skipped_ticks': stats['skipped_ticks'],
+            'predictions': data_handlers[frequency].version,
+            'runs_per_second': round(stats['runs'] / elapsed, 2),
+            'simulated_until': str(datetime.fromtimestamp(simulated_time, tz=timezone.utc)) if simulated_time else None,
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Soak test of the prediction pipelines on replayed data')
+    parser.add_argument('--recording', default=None, help='recording made with RECORD_TICKS, replayed instead of the CSV files')
+    parser.add_argument('--minute-csv', default=default_minute_csv)
+    parser.add_argument('--daily-csv', default=default_daily_csv)
+    parser.add_argument('--frequencies', nargs='+', choices=list(pipeline_periods), default=list(pipeline_periods))
+    parser.add_argument('--speed', type=float, default=0, help='speed-up of the pipeline periods, 0 runs as fast as possible')
+    parser.add_argument('--duration', type=float, default=60, help='wall clock seconds to run for')
+    args = parser.parse_args(argv)
+
+    # The same settings as the server - the inference backend and workers, the minute mode and the log level
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    source = load_replay_source(args.recording, args.minute_csv, args.daily_csv)
+    report = asyncio.run(soak(source, args.frequencies, args.speed, args.duration))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Using the TensorFlow library for machine learning
+import tensorflow as tf
+
+# Number of future steps predicted for every forecast
+forecast_horizon = 60
+
+# The rollout engine runs the whole autoregressive forecast as one compiled TensorFlow graph:
+# # The raw prices are scaled inside the graph, using the min and range of the fitted MinMaxScaler
+# # At each step the model predicts the next scaled value from the current window
+# # The window is shifted by dropping the oldest value and appending the prediction
+# # The predictions are inverse scaled inside the graph before being returned
+# This replaces the 60 separate model.predict calls (and the scaler calls in between) with a single dispatch
+class RolloutEngine:
+
+    def __init__(self, model, horizon=forecast_horizon):
+        self.model = model
+        self.horizon = horizon
+
+        # Traced once with a dynamic batch size and compiled with XLA, which fuses the 60 steps into one kernel launch
+        self.compiled_rollout = tf.function(self.rollout_graph, reduce_retracing=True, jit_compile=True)
+
+    def rollout_graph(self, windows, data_min, data_range):
+        # Scaling the raw prices the same way the MinMaxScaler does, in float64 for precision
+        scaled_windows = (windows - data_min) / data_range
+
+        # The model expects float32 inputs of shape (batch, sequence_length, 1)
+        current_sequence = tf.cast(scaled_windows, tf.float32)
+        future_values = tf.TensorArray(tf.float32, size=self.horizon)
+
+        for step in tf.range(self.horizon):
+            # Predict the next scaled value for every window in the batch
+            next_value = self.model(current_sequence, training=False)
+            future_values = future_values.write(step, next_value[:, 0])
+
+            # Drop the oldest value and append the new predicted value
+            current_sequence = tf.concat([current_sequence[:, 1:, :], next_value[:, tf.newaxis, :]], axis=1)
+
+        # Stacked as (horizon, batch) so it has to be transposed to (batch, horizon)
+        scaled_predictions = tf.transpose(future_values.stack())
+
+        # Inverse transforming the predictions to get actual prices
+        return tf.cast(scaled_predictions, tf.float64) * data_range[:, :, 0] + data_min[:, :, 0]
+
+    def forecast_batch(self, windows, data_min, data_range):
+        # windows: raw prices of shape (batch, sequence_length)
+        # data_min, data_range: the scaler parameters, either one value or one value per window
+        windows = np.asarray(windows, dtype=np.float64)
+        batch_size = windows.shape[0]
+        data_min = np.broadcast_to(np.asarray(data_min, dtype=np.float64), (batch_size,)).reshape(-1, 1, 1)
+        data_range = np.broadcast_to(np.asarray(data_range, dtype=np.float64), (batch_size,)).reshape(-1, 1, 1)
+
+        # A constant series gives a range of 0, the MinMaxScaler uses 1 in this case
+        data_range = np.where(data_range == 0, 1.0, data_range)
+
+        future_prices = self.compiled_rollout(
+            tf.constant(windows.reshape(batch_size, -1, 1)),
+            tf.constant(data_min),
+            tf.constant(data_range),
+        )
+        return future_prices.numpy()
+
+    def forecast(self, window, scaler):
+        # Forecasting a single window using the parameters of an already fitted MinMaxScaler
+        window = np.asarray(window, dtype=np.float64).reshape(1, -1)
+        return self.forecast_batch(window, scaler.data_min_[0], scaler.data_range_[0])[0]
+
+
+# The engine of a direct multi-horizon model, which outputs all the future steps in one forward pass
+# (the last Dense layer has one unit per step) - same interface as RolloutEngine, without the autoregressive loop
+class DirectEngine(RolloutEngine):
+
+    def __init__(self, model):
+        super().__init__(model, horizon=model.output_shape[-1])
+
+    def rollout_graph(self, windows, data_min, data_range):
+        scaled_windows = (windows - data_min) / data_range
+        scaled_predictions = self.model(tf.cast(scaled_windows, tf.float32), training=False)
+
+        # Inverse transforming the predictions to get actual prices
+        return tf.cast(scaled_predictions, tf.float64) * data_range[:, :, 0] + data_min[:, :, 0]
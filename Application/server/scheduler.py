@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import math
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of seconds between two runs of every pipeline - the same cadences the fetching loop slept for
+pipeline_periods = {
+    'minute': 1,
+    'hour': 3600,
+    'day': 86400,
+}
+
+
+# One periodic pipeline, running as an asyncio task:
+# # The runs fire on wall clock ticks aligned to the period (every full second, hour or UTC day)
+# # The next tick is computed from the previous tick and not from the end of the run, so the time a run takes
+# # does not add up into drift
+# # A run that takes longer than the period skips the ticks it overran instead of running late ones back to back,
+# # and the skipped ticks are counted
+# # Stopping cancels the task, which also wakes it up if it is waiting for its next tick
+# # A period of 0 runs the job back to back, as fast as possible (used by the replay soak tests)
+class Pipeline:
+
+    def __init__(self, name, period, job, run_immediately=True):
+        self.name = name
+        self.period = period
+        self.job = job
+        self.run_immediately = run_immediately
+        self.task = None
+
+        self.runs = 0
+        self.failures = 0
+        self.skipped_ticks = 0
+        self.started_at = None
+        self.next_tick = None
+        self.last_run_at = None
+        self.last_run_duration = None
+        self.max_lateness = 0.0
+
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.is_running():
+            self.started_at = time.time()
+            self.task = asyncio.create_task(self.run(), name=f'pipeline-{self.name}')
+        return self.task
+
+    async def stop(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self.next_tick = None
+
+    def first_tick(self, now):
+        # The next wall clock time that is a multiple of the period
+        return math.ceil(now / self.period) * self.period
+
+    async def run(self):
+        # The first run starts right away, so the hour and day pipelines do not wait for their first tick
+        if self.run_immediately:
+            await self.run_job(time.time())
+
+        if self.period <= 0:
+            while True:
+                # Yielding to the event loop between the runs, so the other pipelines and the requests are served
+                await asyncio.sleep(0)
+                await self.run_job(time.time())
+
+        self.next_tick = self.first_tick(time.time())
+
+        while True:
+            delay = self.next_tick - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            tick = self.next_tick
+            await self.run_job(tick)
+
+            # Scheduling from the tick keeps the cadence fixed, whatever the run took
+            self.next_tick = tick + self.period
+            now = time.time()
+            if now >= self.next_tick:
+                # The run overran one or more ticks - they are skipped and the pipeline waits for the next one
+                missed = math.floor((now - self.next_tick) / self.period) + 1
+                self.skipped_ticks += missed
+                metrics.skipped_ticks.inc(missed, frequency=self.name)
+                self.next_tick += missed * self.period
+
+    async def run_job(self, tick):
+        started_at = time.time()
+        self.max_lateness = max(self.max_lateness, started_at - tick)
+        try:
+            await self.job(self.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failing run does not stop the pipeline - the next tick tries again
+            self.failures += 1
+            metrics.pipeline_failures.inc(frequency=self.name)
+            logger.exception(f"Pipeline {self.name} run failed: {e!r}")
+        self.runs += 1
+        self.last_run_at = started_at
+        self.last_run_duration = time.time() - started_at
+
+    def stats(self):
+        return {
+            'running': self.is_running(),
+            'period': self.period,
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped_ticks': self.skipped_ticks,
+            'next_tick': self.next_tick,
+            'last_run_at': self.last_run_at,
+            'last_run_duration': round(self.last_run_duration, 4) if self.last_run_duration is not None else None,
+            'max_lateness': round(self.max_lateness, 4),
+        }
+
+
+# The minute, hour and day pipelines of the server, all running on the same event loop
+class PipelineScheduler:
+
+    def __init__(self, job, periods=pipeline_periods):
+        self.pipelines = {name: Pipeline(name, period, job) for name, period in periods.items()}
+
+    def __contains__(self, name):
+        return name in self.pipelines
+
+    def is_running(self, name=None):
+        if name is None:
+            return any(pipeline.is_running() for pipeline in self.pipelines.values())
+        return self.pipelines[name].is_running()
+
+    def start(self, name):
+        return self.pipelines[name].start()
+
+    async def stop(self, name):
+        await self.pipelines[name].stop()
+
+    async def stop_all(self):
+        await asyncio.gather(*(pipeline.stop() for pipeline in self.pipelines.values()))
+
+    def running(self):
+        return [name for name, pipeline in self.pipelines.items() if pipeline.is_running()]
+
+    def stats(self):
+        return {name: pipeline.stats() for name, pipeline in self.pipelines.items()}
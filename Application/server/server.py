@@ -1,24 +1,75 @@
 import asyncio
+import logging
 import os
-import threading
 import json
 from fastapi import FastAPI, WebSocket, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List
 from fastapi.middleware.cors import CORSMiddleware
 import time
 
-from data_handler import DataHandler
+# Reported as the startup time once the server is ready, and once the models are loaded
+server_start_time = time.perf_counter()
 
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file - before the data handler is imported, since it selects the inference backend
 load_dotenv()
 
-fetching = False  # Flag to indicate if data fetching is ongoing
+# Leveled logging instead of prints - LOG_LEVEL=WARNING keeps only the problems in production
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('server')
+
+from data_handler import DataHandler
+from data_fetching import DataFetching, AsyncDataFetching
+from scheduler import PipelineScheduler, pipeline_periods
+from replay_source import (load_replay_source, replay_periods, ReplayDataFetching, AsyncReplayDataFetching,
+                           RecordingAsyncDataFetching, TickRecorder)
+from forecast_cache import forecast_cache
+from inference_backend import server_inference_pool
+from model_registry import model_registry
+import inference_pool
+from broadcast import Broadcaster
+from payload_format import PayloadFormat
+import metrics
+
+# One data handler per frequency, so every pipeline has its own state and prediction history
+# The fetch managers are shared, so all the pipelines use the same pooled connections
+# DATA_SOURCE=replay replays the bundled CSV files (or a recording) instead of calling the APIs, with the pipeline
+# periods divided by REPLAY_SPEED (0 runs the pipelines as fast as possible)
+data_source = os.getenv('DATA_SOURCE', 'live')
+if data_source == 'replay':
+    replay_source = load_replay_source(os.getenv('REPLAY_RECORDING'), os.getenv('REPLAY_MINUTE_CSV'), os.getenv('REPLAY_DAILY_CSV'))
+    data_fetch_manager = ReplayDataFetching(replay_source)
+    async_fetch_manager = AsyncReplayDataFetching(replay_source)
+    periods = replay_periods(float(os.getenv('REPLAY_SPEED', '1')))
+elif data_source == 'live':
+    data_fetch_manager = DataFetching()
+    async_fetch_manager = AsyncDataFetching()
+    periods = pipeline_periods
+else:
+    raise ValueError(f"Unknown data source: {data_source}")
+
+# RECORD_TICKS appends everything the pipelines fetch to a file, which can be replayed later with REPLAY_RECORDING
+if os.getenv('RECORD_TICKS'):
+    async_fetch_manager = RecordingAsyncDataFetching(async_fetch_manager, TickRecorder(os.getenv('RECORD_TICKS')))
 
-data_handler_manager = DataHandler()
+data_handlers = {frequency: DataHandler(data_fetch_manager, async_fetch_manager) for frequency in pipeline_periods}
+
+# MODEL_LOADING=background loads and warms up the models in a worker thread once the server is started, so it serves
+# requests right away - lazy only loads a model for its first prediction
+# The model files are checked every MODEL_RELOAD_INTERVAL seconds and a changed file is loaded without a restart
+# (0 disables it, POST /models/reload still works)
+model_loading = os.getenv('MODEL_LOADING', 'background')
+if model_loading not in ('background', 'lazy'):
+    raise ValueError(f"Unknown model loading: {model_loading}")
+model_reload_interval = float(os.getenv('MODEL_RELOAD_INTERVAL', '10'))
+
+# Created here, so the workers can be forked by the startup hook before the server starts any thread
+server_inference_pool()
+
+# The frequency of the last prediction, served by /signals when no frequency is asked for
+latest_frequency = 'minute'
 
 app = FastAPI()
 
@@ -29,99 +80,259 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The dashboard can read the ETag of /signals to poll it with If-None-Match
+    expose_headers=["ETag"],
 )
 
 tracked_variable = None
-websocket_connections: List[WebSocket] = []
-fetching = False
+
+def resync_message(frequency=None):
+    # The full history of the client's pipeline (the latest one when it did not choose), sent to a client when it
+    # connects or when it fell behind
+    frequency = frequency if frequency in data_handlers else latest_frequency
+    prediction_data = data_handlers[frequency].prediction_data
+    if not prediction_data:
+        return None
+    return {"signal_data": list(prediction_data), "frequency": frequency}
+
+# The WebSocket clients - every update is serialized once and sent to all of them concurrently
+broadcaster = Broadcaster(resync_message)
 
 class UpdateVariableRequest(BaseModel):
     variable: str
 
+async def read_frequency(request: Request, key="frequency"):
+    # The frequency sent in the request body, or None when the body has no frequency
+    try:
+        payload = await request.json()  # Read the request body as JSON
+    except ValueError:
+        return None
+    return payload.get(key) if isinstance(payload, dict) else None
+
 @app.post("/start_fetch")
 async def start_fetch(request: Request):
-    global fetching
-    payload = await request.json()  # Read the request body as JSON
-    frequency = payload.get("frequency")
-    if not fetching:
-        fetching = True
-        loop = asyncio.get_event_loop()
-        threading.Thread(target=fetch_data, args=(loop,frequency)).start()
-        #await notify_clients(message="Data fetching started")
+    frequency = await read_frequency(request)
+    if frequency not in scheduler:
+        return JSONResponse(content={"message": f"Unknown frequency: {frequency}"}, status_code=400)
+    if not scheduler.is_running(frequency):
+        scheduler.start(frequency)
+        #notify_clients(message="Data fetching started")
         return JSONResponse(content={"message": "Data fetching started"}, status_code=200)
     else:
         return JSONResponse(content={"message": "Data fetching is already in progress"}, status_code=400)
 
 @app.post("/stop_fetch")
-async def stop_fetch():
-    global fetching
-    if fetching:
-        fetching = False
-        data_handler_manager.data_array = []
-        data_handler_manager.prediction_data = []
-        # await notify_clients(message="Data fetching stopped")
+async def stop_fetch(request: Request):
+    # Stops the pipeline of the given frequency, or all the pipelines when no frequency is given
+    frequency = await read_frequency(request)
+    frequencies = [frequency] if frequency in scheduler else scheduler.running()
+    frequencies = [frequency for frequency in frequencies if scheduler.is_running(frequency)]
+    if frequencies:
+        for frequency in frequencies:
+            # Cancelling the task also wakes it up if it is waiting for the next tick
+            await scheduler.stop(frequency)
+            data_handlers[frequency].reset()
+        # notify_clients(message="Data fetching stopped")
         return JSONResponse(content={"message": "Data fetching stopped"}, status_code=200)
     else:
         return JSONResponse(content={"message": "Data fetching is not in progress"}, status_code=400)
 
 @app.post("/is_running")
-async def is_running():
-    return JSONResponse(content={"message": fetching}, status_code=200)
+async def is_running(request: Request):
+    # The client sends the selected frequency as 'key'
+    frequency = await read_frequency(request, key="key")
+    running = scheduler.is_running(frequency if frequency in scheduler else None)
+    return JSONResponse(content={"message": running}, status_code=200)
+
+@app.get("/pipelines")
+async def get_pipelines():
+    # Runs, failures, skipped ticks and timings of every pipeline
+    return JSONResponse(content=scheduler.stats(), status_code=200)
+
+# The encoded /signals bodies of the current versions, by (frequency, payload format, since)
+# A body is only encoded again when a new prediction changed the version
+signals_bodies = {}
+max_signals_bodies = 64
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match can hold several, weak or '*' tags
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
 @app.get("/signals")
-async def get_signals():
-    if len(data_handler_manager.prediction_data):
-        return JSONResponse(content={"signal_data": data_handler_manager.prediction_data}, status_code=200)
-    else:
-        return JSONResponse(content={"signal_data": "No Signals."}, status_code=200)
+async def get_signals(request: Request, frequency: str = None, format: str = None, encoding: str = None, since: int = None):
+    # format=compact sends the prices as columns of epoch milliseconds and floats, encoding=msgpack as MessagePack
+    # Without them the legacy JSON shape read by the React client is sent
+    # since=<version> only sends the predictions added after that version
+    payload_format = PayloadFormat.negotiate(format, encoding)
+    frequency = frequency if frequency in data_handlers else latest_frequency
+    data_handler_manager = data_handlers[frequency]
+
+    key = (frequency, payload_format.key, since)
+    cached = signals_bodies.get(key)
+    if cached is None or cached[0] != data_handler_manager.version:
+        version, prediction_data = data_handler_manager.predictions_since(since)
+        if len(prediction_data) or since is not None:
+            content = {"signal_data": prediction_data, "version": version, "frequency": frequency}
+        else:
+            content = {"signal_data": "No Signals.", "version": version, "frequency": frequency}
+        etag = f'"{frequency}-{version}-{payload_format.layout}-{payload_format.encoding}-{"" if since is None else since}"'
+        if len(signals_bodies) >= max_signals_bodies:
+            signals_bodies.clear()
+        with metrics.serialize_seconds.time(target='http', layout=payload_format.layout, encoding=payload_format.encoding):
+            body = payload_format.encode(content)
+        cached = signals_bodies[key] = (version, etag, body)
+
+    version, etag, body = cached
+    # no-cache lets proxies keep the body, but they have to check the ETag with the server on every request
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=payload_format.media_type, headers=headers, status_code=200)
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text format - latency histograms of every stage, error and skip counters
+    return Response(content=metrics.registry.render(), media_type=metrics.content_type)
+
+@app.get("/cache_stats")
+async def get_cache_stats():
+    return JSONResponse(content=forecast_cache.stats(), status_code=200)
+
+@app.get("/inference_stats")
+async def get_inference_stats():
+    # Queue depth and utilization of the inference worker processes
+    if inference_pool.inference_pool is None:
+        return JSONResponse(content={"workers": 0}, status_code=200)
+    return JSONResponse(content=inference_pool.inference_pool.stats(), status_code=200)
+
+@app.get("/models")
+async def get_models():
+    # State, version and loading times of every model
+    return JSONResponse(content={"models": model_registry.stats(), "startup_seconds": startup_seconds}, status_code=200)
+
+@app.post("/models/reload")
+async def reload_models():
+    # Loads the model files right away instead of waiting for the watcher, a model that failed is tried again
+    # The current models keep serving the predictions until the new ones are warmed up
+    loaded = await asyncio.to_thread(model_registry.load_all, True)
+    return JSONResponse(content={"reloaded": loaded, "models": model_registry.stats()}, status_code=200)
+
+@app.get("/broadcast_stats")
+async def get_broadcast_stats():
+    return JSONResponse(content=broadcaster.stats(), status_code=200)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    websocket_connections.append(websocket)
+    # The payload format is chosen with the query parameters, e.g. /ws?format=compact&encoding=msgpack
+    payload_format = PayloadFormat.negotiate(websocket.query_params.get("format"), websocket.query_params.get("encoding"))
+    # The frequency the client shows, e.g. /ws?frequency=hour - it can change it later by sending {"frequency": "day"}
+    frequency = websocket.query_params.get("frequency")
+    # The client first gets the full history, then only the new signals
+    broadcaster.connect(websocket, payload_format, frequency if frequency in data_handlers else None)
     try:
         while True:
             data = await websocket.receive_text()
-            # Handle incoming messages from the client if needed
+            try:
+                frequency = json.loads(data).get("frequency")
+            except (ValueError, AttributeError):
+                continue
+            if isinstance(frequency, str) and frequency in data_handlers:
+                broadcaster.select(websocket, frequency)
     except Exception as e:
-        print(f"WebSocket connection error: {e}")
+        logger.debug(f"WebSocket connection closed: {e!r}")
     finally:
-        websocket_connections.remove(websocket)
+        await broadcaster.disconnect(websocket)
 
-async def notify_clients(message: str = None, signal_data: str = None):
+def notify_clients(message: str = None, signal: dict = None, frequency: str = None):
+    # Queues the message for every client without waiting for any of them
+    # A signal is sent alone - the clients add it to the history they got when they connected
     global tracked_variable
     message_data = {}
     if message:
         message_data["message"] = message
-    elif signal_data:
-        message_data["signal_data"] = signal_data
-    to_remove = []
-    for connection in websocket_connections:
-        try:
-            await connection.send_json(message_data)
-        except Exception as e:
-            print(f"Error sending message to WebSocket client: {e}")
-            to_remove.append(connection)
-    for connection in to_remove:
-        websocket_connections.remove(connection)
-
-def fetch_data(loop, frequency):
-    asyncio.set_event_loop(loop)
-    while fetching:
-        # Simulate fetching data
-        print("Fetching data...")
-        data_handler_manager.populate_array(frequency)
-        print(len(data_handler_manager.data_array))
-        # Notify WebSocket clients about the fetched data
-        #if len(data_handler_manager.data_array) == 1 and data_handler_manager.prediction_data:
-        if data_handler_manager.prediction_data:
-            asyncio.run_coroutine_threadsafe(notify_clients(signal_data=data_handler_manager.prediction_data), loop)
-        if frequency == 'minute':
-            time.sleep(1)
-        elif frequency == 'hour':
-            time.sleep(3600)
-        elif frequency == 'day':
-            time.sleep(86400)
+    elif signal:
+        message_data["signal"] = signal
+        if frequency:
+            message_data["frequency"] = frequency
+    broadcaster.publish(message_data)
+
+async def fetch_data(frequency):
+    global latest_frequency
+    data_handler_manager = data_handlers[frequency]
+
+    # One run of a pipeline - the scheduler calls it on every tick of its frequency
+    # Fetching the data and predicting - the HTTP requests are awaited, the data handling runs in a worker thread
+    # and the forecasts in the inference worker processes
+    logger.debug("Fetching data...")
+    start_time = time.perf_counter()
+    version_before = data_handler_manager.version
+    await data_handler_manager.populate_array_async(frequency)
+    logger.debug(len(data_handler_manager.tick_buffer))
+    # Notify WebSocket clients about the fetched data
+    #if len(data_handler_manager.tick_buffer) == 1 and data_handler_manager.prediction_data:
+    # Only a new prediction is sent - it also makes this pipeline the one served by /signals
+    if data_handler_manager.prediction_data and data_handler_manager.version != version_before:
+        latest_frequency = frequency
+        signal = data_handler_manager.prediction_data[-1]
+        notify_clients(signal=signal, frequency=frequency)
+        metrics.predictions.inc(frequency=frequency, signal=signal['signal'])
+        metrics.tick_to_signal_seconds.observe(time.perf_counter() - start_time, frequency=frequency)
+
+# The minute, hour and day pipelines, each running fetch_data on its own wall clock aligned ticks
+scheduler = PipelineScheduler(fetch_data, periods)
+
+# Values read when /metrics is collected
+metrics.Gauge('websocket_clients', 'Connected WebSocket clients', lambda: len(broadcaster.clients))
+metrics.Gauge('forecast_cache_hit_rate', 'Share of the forecasts served from the cache', lambda: forecast_cache.stats()['hit_rate'])
+metrics.Gauge('inference_queue_depth', 'Forecast jobs waiting for an inference worker',
+              lambda: inference_pool.inference_pool.stats()['queue_depth'] if inference_pool.inference_pool else 0)
+metrics.Gauge('inference_utilization', 'Share of the last minute the inference workers spent forecasting',
+              lambda: inference_pool.inference_pool.stats()['recent_utilization'] if inference_pool.inference_pool else 0)
+
+# Seconds from the start of the server until it served requests, and until its models were loaded
+startup_seconds = {"server": None, "models": None}
+background_tasks = set()
+
+def load_models():
+    loaded = model_registry.load_all()
+    startup_seconds["models"] = round(time.perf_counter() - server_start_time, 3)
+    logger.info(f"Models {loaded} loaded {startup_seconds['models']:.2f}s after the start")
+
+@app.on_event("startup")
+async def start_inference_workers():
+    # Forking the inference workers before any thread is started - they load the models on their first job
+    if inference_pool.inference_pool is not None:
+        inference_pool.inference_pool.start_workers()
+
+    # The models are loaded and warmed up in a worker thread, the requests are served meanwhile
+    if model_loading == 'background':
+        background_tasks.add(asyncio.get_running_loop().run_in_executor(None, load_models))
+    if model_reload_interval > 0:
+        background_tasks.add(asyncio.create_task(model_registry.watch(model_reload_interval)))
+
+    startup_seconds["server"] = round(time.perf_counter() - server_start_time, 3)
+    logger.info(f"Server started in {startup_seconds['server']:.2f}s")
+
+@app.on_event("shutdown")
+async def close_connections():
+    # Stopping the pipelines and closing the pooled HTTP connections
+    await scheduler.stop_all()
+    await async_fetch_manager.close()
+
+    # Stopping the WebSocket senders
+    await broadcaster.close()
+
+    # Stopping the model file watcher
+    for task in background_tasks:
+        task.cancel()
+
+    # Stopping the inference workers
+    if inference_pool.inference_pool is not None:
+        inference_pool.inference_pool.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,215 @@
+# Streaming LSTM inference for the minute mode ticks
+# The full window forecast feeds the 60 scaled prices through the LSTM from a zero state and then runs a 60 step
+# rollout, where every step feeds the whole shifted window again - about 60 * 60 LSTM steps for every forecast
+# Consecutive minute mode windows only differ by one tick, so the streaming forecaster instead:
+# # keeps the hidden and cell states of every LSTM layer for the observed series and advances them by one step per tick
+# # branches from those states for the forecast, feeding each prediction back in as the next input - 60 LSTM steps
+# The results are not the same as the full window recompute: the state remembers more than the last 60 ticks and the
+# scaler is the one of the last resync instead of the one of the current window
+# resync_interval bounds this drift by rebuilding the states from the current window every resync_interval ticks
+#
+# Drift report usage: python streaming_lstm.py --model models/short_shot.h5 --data ../../Backtesting_script/data/BTC-USD_24H_test_01.csv
+
+import argparse
+import sys
+import time
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Latency histograms served on /metrics
+import metrics
+from lstm_numpy import NumpyLSTMLayer, NumpyDenseLayer, NumpyLSTMModel, NumpyRolloutEngine, NumpyDirectEngine, forecast_horizon
+
+# Setting the sequence length for the LSTM input
+sequence_length = 60
+
+
+class StreamingLSTMForecaster:
+
+    def __init__(self, model, horizon=forecast_horizon, resync_interval=None):
+        # Only the LSTM layers followed by the Dense head can be advanced one step at a time
+        self.lstm_layers = [layer for layer in model.layers if isinstance(layer, NumpyLSTMLayer)]
+        self.dense_layers = [layer for layer in model.layers if isinstance(layer, NumpyDenseLayer)]
+        if not self.lstm_layers or model.layers != self.lstm_layers + self.dense_layers:
+            raise ValueError("Streaming inference needs LSTM layers followed by Dense layers")
+
+        self.model = model
+        self.horizon = horizon
+        self.resync_interval = resync_interval
+        self.dtype = self.lstm_layers[0].kernel.dtype
+        self.clear()
+
+    def clear(self):
+        # (hidden state, cell state) of every LSTM layer, None until the first window is observed
+        self.states = None
+        self.data_min = 0.0
+        self.data_range = 1.0
+        self.ticks_since_resync = 0
+
+    def is_ready(self):
+        return self.states is not None
+
+    def needs_resync(self):
+        if not self.is_ready():
+            return True
+        return bool(self.resync_interval) and self.ticks_since_resync >= self.resync_interval
+
+    def scale(self, prices):
+        return ((np.asarray(prices, dtype=np.float64) - self.data_min) / self.data_range).astype(self.dtype)
+
+    def reset(self, window, data_min, data_range):
+        # Rebuilding the states from a full window, scaled with the given MinMaxScaler parameters
+        # A constant series gives a range of 0, the MinMaxScaler uses 1 in this case
+        self.data_min = float(data_min)
+        self.data_range = float(data_range) or 1.0
+
+        outputs = self.scale(window).reshape(1, -1, 1)
+        self.states = []
+        for layer in self.lstm_layers:
+            outputs, state = layer.forward(outputs)
+            self.states.append(state)
+        self.ticks_since_resync = 0
+
+    def advance(self, states, value):
+        # One LSTM step for every layer - returns the new states and the predicted next scaled value
+        inputs = value
+        new_states = []
+        for layer, (hidden_state, cell_state) in zip(self.lstm_layers, states):
+            hidden_state, cell_state = layer.step(layer.project(inputs), hidden_state, cell_state)
+            new_states.append((hidden_state, cell_state))
+            inputs = hidden_state
+        return new_states, self.head(inputs)
+
+    def head(self, hidden_state):
+        outputs = hidden_state
+        for layer in self.dense_layers:
+            outputs = layer.forward(outputs)
+        return outputs
+
+    def observe(self, price):
+        # Advancing the observed series by one tick
+        self.states, _ = self.advance(self.states, self.scale(price).reshape(1, 1))
+        self.ticks_since_resync += 1
+
+    def forecast(self):
+        # A direct multi-horizon model gives every future step from the observed state, without a rollout
+        if self.model.output_size() > 1:
+            return self.head(self.states[-1][0])[0].astype(np.float64) * self.data_range + self.data_min
+
+        # The step functions return new arrays and never change the states in place, so the rollout branches
+        # from the observed states without copying them
+        states = self.states
+        next_value = self.head(states[-1][0])
+        scaled_predictions = np.empty(self.horizon)
+
+        for step in range(self.horizon):
+            scaled_predictions[step] = next_value[0, 0]
+            if step < self.horizon - 1:
+                with metrics.model_step_seconds.time(engine='streaming'):
+                    states, next_value = self.advance(states, next_value)
+
+        # Inverse transforming the predictions to get actual prices
+        return scaled_predictions * self.data_range + self.data_min
+
+
+def load_streaming_forecaster(model_path, resync_interval=None):
+    from model_artifacts import load_numpy_model
+    return StreamingLSTMForecaster(load_numpy_model(model_path), resync_interval=resync_interval)
+
+def full_window_engine(model, horizon=forecast_horizon):
+    # The engine the server uses for the model, the reference the streaming forecasts are compared with
+    return NumpyDirectEngine(model) if model.output_size() > 1 else NumpyRolloutEngine(model, horizon)
+
+def load_series(data_path, ticks, seed=0):
+    if data_path:
+        from price_store import load_prices
+        return np.asarray(load_prices(data_path)['Close'], dtype=np.float64)[:ticks + sequence_length + 1]
+
+    # Without a dataset a random walk around the current bitcoin price is used
+    steps = np.random.default_rng(seed).normal(0, 15, ticks + sequence_length + 1)
+    return 60000 + np.cumsum(steps)
+
+def window_scalers(prices):
+    # The server fits the scaler on the 61 points of every window - the 60 sequence points and the current price
+    windows = np.lib.stride_tricks.sliding_window_view(prices, sequence_length + 1)
+    data_min = windows.min(axis=1)
+    return windows[:, :sequence_length], windows[:, sequence_length], data_min, windows.max(axis=1) - data_min
+
+def drift_report(forecaster, prices, reference_forecasts=None):
+    sequences, current_prices, data_mins, data_ranges = window_scalers(prices)
+
+    # The full window recompute of every tick, in one batch
+    if reference_forecasts is None:
+        reference_forecasts = full_window_engine(forecaster.model, forecaster.horizon).forecast_batch(sequences, data_mins, data_ranges)
+
+    # The streaming forecasts - the state observes every price of the sequence, the current price is only used
+    # for the signal, the same as in predict.py
+    streaming_forecasts = np.empty_like(reference_forecasts)
+    forecaster.clear()
+    start_time = time.perf_counter()
+    for tick in range(len(sequences)):
+        if forecaster.needs_resync():
+            forecaster.reset(sequences[tick], data_mins[tick], data_ranges[tick])
+        else:
+            forecaster.observe(sequences[tick, -1])
+        streaming_forecasts[tick] = forecaster.forecast()
+    streaming_time = (time.perf_counter() - start_time) / len(sequences)
+
+    # The signal is made from the mean of the forecast, so that is the drift that matters most
+    reference_changes = (reference_forecasts.mean(axis=1) - current_prices) / current_prices * 100
+    streaming_changes = (streaming_forecasts.mean(axis=1) - current_prices) / current_prices * 100
+    forecast_difference = np.abs(streaming_forecasts - reference_forecasts) / current_prices[:, np.newaxis] * 100
+    change_difference = np.abs(streaming_changes - reference_changes)
+
+    return {
+        'ticks': int(len(sequences)),
+        'streaming_ms_per_tick': streaming_time * 1000,
+        'mean_forecast_difference_percent': float(forecast_difference.mean()),
+        'max_forecast_difference_percent': float(forecast_difference.max()),
+        'mean_change_difference_percent': float(change_difference.mean()),
+        'max_change_difference_percent': float(change_difference.max()),
+        'direction_agreement': float(np.mean(np.sign(streaming_changes) == np.sign(reference_changes))),
+    }
+
+def time_full_recompute(model, prices, repeats=5):
+    # The cost of one full window forecast, the way the server makes it for a single window
+    rollout_engine = full_window_engine(model)
+    window = prices[:sequence_length]
+    data_min, data_range = window.min(), window.max() - window.min()
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        rollout_engine.forecast_batch(window.reshape(1, -1), data_min, data_range)
+    return (time.perf_counter() - start_time) / repeats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drift of the streaming LSTM forecasts against the full window recompute')
+    parser.add_argument('--model', default='models/short_shot.h5')
+    parser.add_argument('--data', default=None, help='CSV dataset to replay, a random walk is used when not given')
+    parser.add_argument('--ticks', type=int, default=500)
+    parser.add_argument('--resync-intervals', type=int, nargs='+', default=[0, 10, 60], help='0 never resyncs')
+    args = parser.parse_args(argv)
+
+    model = NumpyLSTMModel.from_h5(args.model)
+    prices = load_series(args.data, args.ticks)
+    if len(prices) <= sequence_length:
+        sys.exit(f'The series needs more than {sequence_length} prices')
+
+    sequences, _, data_mins, data_ranges = window_scalers(prices)
+    reference_forecasts = full_window_engine(model).forecast_batch(sequences, data_mins, data_ranges)
+    full_time = time_full_recompute(model, prices)
+
+    print(f'Full window recompute: {full_time * 1000:.2f} ms per tick')
+    print(f"{'resync':>8} {'ms/tick':>9} {'speedup':>8} {'mean diff %':>12} {'max diff %':>11} "
+          f"{'mean change diff %':>19} {'max change diff %':>18} {'same direction':>15}")
+    for resync_interval in args.resync_intervals:
+        forecaster = StreamingLSTMForecaster(model, resync_interval=resync_interval or None)
+        report = drift_report(forecaster, prices, reference_forecasts)
+        print(f"{resync_interval or 'never':>8} {report['streaming_ms_per_tick']:>9.2f} "
+              f"{full_time * 1000 / report['streaming_ms_per_tick']:>7.1f}x "
+              f"{report['mean_forecast_difference_percent']:>12.4f} {report['max_forecast_difference_percent']:>11.4f} "
+              f"{report['mean_change_difference_percent']:>19.4f} {report['max_change_difference_percent']:>18.4f} "
+              f"{report['direction_agreement']:>15.1%}")
+
+if __name__ == "__main__":
+    main()
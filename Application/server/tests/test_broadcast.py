@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from broadcast import Broadcaster
+
+histories = {
+    'minute': [{'signal': 'Buy', 'time': 'minute'}],
+    'hour': [{'signal': 'Sell', 'time': 'hour'}],
+}
+
+
+def resync_message(frequency=None):
+    # The latest pipeline is the minute one, like in server.py
+    frequency = frequency or 'minute'
+    return {'signal_data': histories[frequency], 'frequency': frequency}
+
+
+# A WebSocket that never finishes sending - its client falls behind as soon as its queue is full
+class StalledWebSocket:
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, payload):
+        self.sent.append(json.loads(payload))
+        await asyncio.Event().wait()
+
+    async def close(self):
+        pass
+
+def queued_messages(client):
+    return [json.loads(client.queue.get_nowait()) for _ in range(client.queue.qsize())]
+
+def test_a_client_that_fell_behind_gets_the_history_of_its_frequency():
+    async def run():
+        broadcaster = Broadcaster(resync_message, queue_size=1, send_timeout=60)
+        hour_socket, latest_socket, switched_socket = StalledWebSocket(), StalledWebSocket(), StalledWebSocket()
+        hour_client = broadcaster.connect(hour_socket, frequency='hour')
+        latest_client = broadcaster.connect(latest_socket)
+        switched_client = broadcaster.connect(switched_socket)
+        broadcaster.select(switched_socket, 'hour')
+
+        # Every client gets the history when it connects, then the send of it stalls
+        while not all(websocket.sent for websocket in (hour_socket, latest_socket, switched_socket)):
+            await asyncio.sleep(0)
+        assert hour_socket.sent == [resync_message('hour')]
+        assert latest_socket.sent == [resync_message()]
+
+        # The first delta fills the queues, the second one makes every client fall behind
+        for _ in range(2):
+            broadcaster.publish({'signal': {'signal': 'Hold'}, 'frequency': 'minute'})
+        assert broadcaster.resyncs == 3
+        results = queued_messages(hour_client), queued_messages(latest_client), queued_messages(switched_client)
+        await broadcaster.close()
+        return results
+
+    hour_messages, latest_messages, switched_messages = asyncio.run(run())
+    assert hour_messages == [resync_message('hour')]
+    assert latest_messages == [resync_message('minute')]
+    assert switched_messages == [resync_message('hour')]
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from data_fetching import AsyncDataFetching
+
+prices = {'price': '60000.00', 'time': '2024-01-01T00:00:00Z'}
+
+
+# A local stand-in for the price APIs - every request gets the next of the given responses, the last one is repeated
+# A response is (status, headers, seconds to wait before answering)
+class StandIn:
+
+    def __init__(self, *responses):
+        self.responses = responses
+        self.requests = 0
+        self.peers = []
+
+    async def handle(self, request):
+        self.peers.append(request.transport.get_extra_info('peername'))
+        status, headers, delay = self.responses[min(self.requests, len(self.responses) - 1)]
+        self.requests += 1
+        if delay:
+            await asyncio.sleep(delay)
+        if status == 200:
+            return web.json_response(prices, headers=headers)
+        return web.Response(status=status, headers=headers)
+
+def run_against(stand_in, fetcher, exercise):
+    # Runs exercise(fetcher, url) with the stand-in served on a local port, then closes the fetcher session
+    async def run():
+        app = web.Application()
+        app.router.add_get('/data', stand_in.handle)
+        async with TestServer(app) as server:
+            try:
+                return await exercise(fetcher, str(server.make_url('/data')))
+            finally:
+                await fetcher.close()
+    return asyncio.run(run())
+
+def fetch_once(fetcher, url):
+    return fetcher.get_json(url)
+
+
+def test_returns_the_json_of_a_successful_response():
+    stand_in = StandIn((200, None, 0))
+    assert run_against(stand_in, AsyncDataFetching(), fetch_once) == prices
+    assert stand_in.requests == 1
+
+def test_timeout_ends_the_request():
+    stand_in = StandIn((200, None, 5))
+    fetcher = AsyncDataFetching(timeout=0.2, max_retries=0)
+    start_time = time.perf_counter()
+    assert run_against(stand_in, fetcher, fetch_once) is None
+    assert time.perf_counter() - start_time < 2
+    assert stand_in.requests == 1
+
+def test_timed_out_requests_are_retried():
+    stand_in = StandIn((200, None, 5), (200, None, 0))
+    fetcher = AsyncDataFetching(timeout=0.2, max_retries=2, backoff=0.01)
+    assert run_against(stand_in, fetcher, fetch_once) == prices
+    assert stand_in.requests == 2
+
+def test_retries_stop_after_the_configured_limit():
+    stand_in = StandIn((503, None, 0))
+    fetcher = AsyncDataFetching(max_retries=2, backoff=0.01)
+    assert run_against(stand_in, fetcher, fetch_once) is None
+    assert stand_in.requests == 3
+
+def test_server_error_is_retried_then_succeeds():
+    stand_in = StandIn((502, None, 0), (200, None, 0))
+    fetcher = AsyncDataFetching(max_retries=3, backoff=0.01)
+    assert run_against(stand_in, fetcher, fetch_once) == prices
+    assert stand_in.requests == 2
+
+def test_server_error_is_reported_after_the_last_retry(caplog):
+    # The pipeline gets None and counts a fetch error - every failed attempt is logged
+    stand_in = StandIn((500, None, 0))
+    fetcher = AsyncDataFetching(max_retries=1, backoff=0.01)
+    with caplog.at_level(logging.WARNING, logger='data_fetching'):
+        assert run_against(stand_in, fetcher, fetch_once) is None
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert messages[-1].endswith('HTTP 500, attempt 2')
+
+def test_client_error_is_not_retried():
+    stand_in = StandIn((404, None, 0))
+    fetcher = AsyncDataFetching(max_retries=3, backoff=0.01)
+    assert run_against(stand_in, fetcher, fetch_once) is None
+    assert stand_in.requests == 1
+
+def test_retry_after_of_a_rate_limited_response_is_honoured():
+    stand_in = StandIn((429, {'Retry-After': '1'}, 0), (200, None, 0))
+    fetcher = AsyncDataFetching(max_retries=3, backoff=0.01)
+    start_time = time.perf_counter()
+    assert run_against(stand_in, fetcher, fetch_once) == prices
+    assert time.perf_counter() - start_time >= 0.9
+    assert stand_in.requests == 2
+
+def test_rate_limit_holds_every_request_to_the_host():
+    # A second request started while the host is rate limited waits for the Retry-After time too
+    stand_in = StandIn((429, {'Retry-After': '1'}, 0), (200, None, 0))
+    fetcher = AsyncDataFetching(max_retries=3, backoff=0.01)
+
+    async def exercise(fetcher, url):
+        first = asyncio.create_task(fetcher.get_json(url))
+        while stand_in.requests == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        start_time = time.perf_counter()
+        second = await fetcher.get_json(url)
+        return await first, second, time.perf_counter() - start_time
+
+    first, second, waited = run_against(stand_in, fetcher, exercise)
+    assert first == prices and second == prices
+    assert waited >= 0.8
+
+def test_session_is_reused_across_calls():
+    stand_in = StandIn((200, None, 0))
+    fetcher = AsyncDataFetching()
+
+    async def exercise(fetcher, url):
+        sessions = []
+        for _ in range(3):
+            assert await fetcher.get_json(url) == prices
+            sessions.append(fetcher.session)
+        return sessions
+
+    sessions = run_against(stand_in, fetcher, exercise)
+    assert all(session is sessions[0] for session in sessions)
+
+    # The kept alive connection answers every request
+    assert len(set(stand_in.peers)) == 1
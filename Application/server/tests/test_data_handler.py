@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+
+import pandas as pd
+
+import global_var
+import predict
+from data_handler import DataHandler
+from model_registry import ModelRegistry
+
+# A 5 minutes chart like the CoinGecko one - [epoch milliseconds, price]
+chart = {'prices': [[1700000000000 + index * 300000, 30000.0 + index] for index in range(80)]}
+
+ticker = {'price': '30000.00', 'time': '2024-01-01T00:00:00Z'}
+
+# 61 Coinbase tickers - the prices are strings with the exchange's own formatting
+tickers = [{'price': f'{30000 + (index * 37 % 11) * 1.25:.2f}', 'time': f'2024-01-01T00:{index // 60:02d}:{index % 60:02d}.{index * 12345:06d}Z'}
+           for index in range(61)]
+
+short_shot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'short_shot.h5')
+
+
+# Stand-in for AsyncDataFetching that answers right away
+class StaticFetching:
+
+    async def get_latest_bitcoin_price(self):
+        return ticker
+
+    async def get_5_minutes_bitcoin_prices(self):
+        return chart
+
+
+def run_blocked_prediction(monkeypatch, stop):
+    # Runs one hour pipeline run whose prediction blocks in the worker thread, calls stop(task, handler) while it
+    # is blocked, then lets the prediction finish - asyncio.run waits for the worker thread before returning
+    predicting = threading.Event()
+    release = threading.Event()
+
+    def blocked_prediction(df, model_name=predict.default_model_name):
+        predicting.set()
+        release.wait(5)
+        return {'signal': 'Buy'}
+
+    monkeypatch.setattr(predict, 'predict_next_trend', blocked_prediction)
+    handler = DataHandler(async_fetch_manager=StaticFetching())
+
+    async def run():
+        task = asyncio.create_task(handler.populate_array_async('hour'))
+        while not predicting.is_set():
+            await asyncio.sleep(0.01)
+        await stop(task, handler)
+        release.set()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    return handler
+
+def test_prediction_of_a_run_is_added(monkeypatch):
+    async def keep_running(task, handler):
+        pass
+
+    handler = run_blocked_prediction(monkeypatch, keep_running)
+    assert handler.prediction_data == [{'signal': 'Buy'}]
+
+def test_stopped_pipeline_drops_the_prediction_of_its_running_thread(monkeypatch):
+    # What /stop_fetch does - the task is cancelled and the handler reset while the thread is still predicting
+    async def stop_fetch(task, handler):
+        task.cancel()
+        handler.reset()
+
+    handler = run_blocked_prediction(monkeypatch, stop_fetch)
+    assert handler.prediction_data == []
+    assert handler.predictions_since(None)[1] == []
+
+def test_stopped_pipeline_drops_the_tick_of_a_run_started_before():
+    handler = DataHandler(async_fetch_manager=StaticFetching())
+    generation = handler.generation
+    handler.reset()
+    handler.populate_for_seconds(ticker, generation)
+    assert len(handler.tick_buffer) == 0
+
+    handler.populate_for_seconds(ticker, handler.generation)
+    assert len(handler.tick_buffer) == 1
+
+def test_minute_window_prediction_matches_the_dataframe_prediction(monkeypatch):
+    monkeypatch.setenv('INFERENCE_WORKERS', '0')
+    monkeypatch.setenv('INFERENCE_BACKEND', 'numpy')
+    monkeypatch.setattr(predict, 'model_registry', ModelRegistry({predict.default_model_name: short_shot_path}))
+
+    # The minute pipeline - the 61st ticker fills the ring buffer and predicts from it
+    monkeypatch.setattr(global_var, 'last_BTC_buy_price', 0.0)
+    handler = DataHandler(async_fetch_manager=StaticFetching())
+    for latest_data in tickers:
+        handler.populate_for_seconds(latest_data)
+    [window_prediction] = handler.prediction_data
+
+    # The DataFrame of the same tickers, like the minute pipeline built it before the ring buffer
+    monkeypatch.setattr(global_var, 'last_BTC_buy_price', 0.0)
+    dataframe_prediction = predict.predict_next_trend(pd.DataFrame(tickers))
+
+    assert window_prediction['historical_prices'][0] == {'time': '2024-01-01 00:00:00+00:00', 'price': '30000.00'}
+    for key in ('historical_prices', 'future_prices', 'signal', 'profit'):
+        assert window_prediction[key] == dataframe_prediction[key]
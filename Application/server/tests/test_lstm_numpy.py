@@ -0,0 +1,70 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lstm_numpy import NumpyLSTMModel, NumpyRolloutEngine
+from model_artifacts import load_numpy_model
+
+# The NumPy backend is compared with Keras, so these tests need TensorFlow
+keras_models = pytest.importorskip('tensorflow.keras.models')
+
+repository_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..')
+
+# The server model, a stacked model with L2 regularized LSTM layers and a single regularized LSTM layer
+model_paths = [
+    os.path.join(repository_folder, 'Application', 'server', 'models', 'short_shot.h5'),
+    os.path.join(repository_folder, 'Backtesting_script', 'models', 'lstm_model_05.h5'),
+    os.path.join(repository_folder, 'Backtesting_script', 'models', 'lstm_model_03.h5'),
+]
+model_ids = [os.path.basename(model_path) for model_path in model_paths]
+
+# Maximum absolute difference allowed between Keras and NumPy, on scaled values
+tolerance = 1e-5
+
+
+@functools.lru_cache(maxsize=None)
+def keras_model(model_path):
+    return keras_models.load_model(model_path)
+
+def price_windows():
+    # Real minute price windows - the rollout feeds its predictions back, so it is checked on the data it runs on
+    close_prices = pd.read_csv(os.path.join(repository_folder, 'Backtesting_script', 'data', 'BTC-USD_24H_test_01.csv'))['Close'].to_numpy(np.float64)
+    windows = np.stack([close_prices[start:start + 60] for start in range(0, 1200, 150)])
+    return windows, close_prices.min(), close_prices.max() - close_prices.min()
+
+
+@pytest.mark.parametrize('model_path', model_paths, ids=model_ids)
+def test_forward_pass_matches_keras(model_path):
+    # Random windows in the [0, 1] range the models were trained on
+    windows = np.random.default_rng(0).random((32, 60, 1)).astype(np.float32)
+    keras_output = keras_model(model_path).predict(windows, verbose=0)
+    numpy_output = NumpyLSTMModel.from_h5(model_path).predict(windows)
+    assert numpy_output.shape == keras_output.shape
+    np.testing.assert_allclose(numpy_output, keras_output, rtol=0, atol=tolerance)
+
+@pytest.mark.parametrize('model_path', model_paths, ids=model_ids)
+def test_rollout_matches_keras(model_path):
+    windows, data_min, data_range = price_windows()
+
+    # The 60 step loop of the notebooks - every prediction replaces the oldest value of the sequence
+    model = keras_model(model_path)
+    current_sequence = ((windows - data_min) / data_range)[:, :, np.newaxis].astype(np.float32)
+    keras_predictions = []
+    for _ in range(60):
+        next_value = model.predict(current_sequence, verbose=0)
+        keras_predictions.append(next_value[:, 0])
+        current_sequence = np.concatenate([current_sequence[:, 1:, :], next_value[:, np.newaxis, :]], axis=1)
+    keras_predictions = np.stack(keras_predictions, axis=1)
+
+    future_prices = NumpyRolloutEngine(NumpyLSTMModel.from_h5(model_path)).forecast_batch(windows, data_min, data_range)
+    assert future_prices.shape == (len(windows), 60)
+    np.testing.assert_allclose((future_prices - data_min) / data_range, keras_predictions, rtol=0, atol=tolerance)
+
+@pytest.mark.parametrize('model_path', model_paths, ids=model_ids)
+def test_converted_artifact_gives_the_same_model(model_path):
+    # The server loads the NumPy model from the converted .npz artifact instead of the .h5 file
+    windows = np.random.default_rng(1).random((8, 60, 1)).astype(np.float32)
+    np.testing.assert_array_equal(load_numpy_model(model_path).predict(windows), NumpyLSTMModel.from_h5(model_path).predict(windows))
@@ -0,0 +1,80 @@
+import os
+import traceback
+
+import h5py
+import numpy as np
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry
+
+short_shot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'short_shot.h5')
+
+
+@pytest.fixture(autouse=True)
+def numpy_models_in_process(monkeypatch):
+    # The models are loaded in this process with the NumPy backend, without the inference workers and TensorFlow
+    monkeypatch.setenv('INFERENCE_WORKERS', '0')
+    monkeypatch.setenv('INFERENCE_BACKEND', 'numpy')
+
+def test_a_model_that_fails_to_load_does_not_stop_the_others(tmp_path):
+    # An .h5 file that is not a Keras model - h5py raises a KeyError for the missing model config
+    foreign_path = str(tmp_path / 'foreign.h5')
+    with h5py.File(foreign_path, 'w') as foreign_file:
+        foreign_file['data'] = np.arange(3)
+    garbage_path = tmp_path / 'garbage.h5'
+    garbage_path.write_bytes(b'not an h5 file')
+
+    registry = ModelRegistry({'foreign': foreign_path, 'garbage': str(garbage_path), 'missing': str(tmp_path / 'missing.h5'),
+                              'good': short_shot_path})
+    assert registry.load_all() == ['good']
+
+    stats = registry.stats()
+    assert stats['good']['state'] == 'ready'
+    for name in ('foreign', 'garbage', 'missing'):
+        assert stats[name]['state'] == 'failed'
+        assert stats[name]['error']
+    with pytest.raises(RuntimeError, match='KeyError'):
+        registry['foreign'].get()
+
+def test_a_failed_version_is_not_loaded_again_until_the_file_changes(tmp_path, monkeypatch):
+    model_path = tmp_path / 'model.h5'
+    model_path.write_bytes(open(short_shot_path, 'rb').read())
+
+    loader = model_registry.load_server_rollout_engine
+    attempts = []
+    def broken_loader(model_path, backend=None, version=None):
+        attempts.append(version)
+        raise TypeError('unexpected layer config')
+
+    monkeypatch.setattr(model_registry, 'load_server_rollout_engine', broken_loader)
+    registry = ModelRegistry({'model': str(model_path)})
+    assert registry.load_all() == []
+    assert registry.load_all() == []
+    assert registry.reload_changed() == []
+    assert len(attempts) == 1
+    assert registry.stats()['model']['state'] == 'failed'
+    assert 'unexpected layer config' in registry.stats()['model']['error']
+
+    # A new version of the file is loaded - the real loader is back, so it succeeds
+    monkeypatch.setattr(model_registry, 'load_server_rollout_engine', loader)
+    os.utime(model_path, ns=(1, 1))
+    assert registry.load_all() == ['model']
+    assert registry.stats()['model']['state'] == 'ready'
+
+def test_a_failed_version_raises_a_new_error_every_time(tmp_path):
+    registry = ModelRegistry({'missing': str(tmp_path / 'missing.h5')})
+    with pytest.raises(FileNotFoundError):
+        registry['missing'].get()
+
+    errors = []
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match='missing.h5 does not exist') as raised:
+            registry['missing'].get()
+        errors.append(raised.value)
+
+    # The stored failure is not raised again, so its traceback does not grow with every request
+    assert len({id(error) for error in errors}) == 3
+    for error in errors:
+        assert error.__cause__ is None and error.__suppress_context__
+        assert len(traceback.extract_tb(error.__traceback__)) == len(traceback.extract_tb(errors[0].__traceback__))
@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import price_store
+from price_store import dataset_folder, is_up_to_date, load_prices
+
+data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'Backtesting_script', 'data')
+csv_name = 'BTC-USD_3Y_Testing.csv'
+
+
+def close_sum(csv_path):
+    # Runs in a spawned worker - the first load of the CSV in every worker races with the others
+    return float(np.sum(load_prices(csv_path)['Close']))
+
+def test_concurrent_first_loads_of_one_csv_all_succeed(tmp_path):
+    expected = float(pd.read_csv(os.path.join(data_folder, csv_name))['Close'].sum())
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        for attempt in range(3):
+            csv_path = str(tmp_path / f'{attempt}_{csv_name}')
+            shutil.copy(os.path.join(data_folder, csv_name), csv_path)
+            assert pool.map(close_sum, [csv_path] * 8) == [expected] * 8
+            assert is_up_to_date(csv_path)
+
+    # No temporary or outdated folder is left behind
+    assert sorted(os.listdir(tmp_path / price_store.store_folder_name)) == [f'{attempt}_{csv_name[:-4]}' for attempt in range(3)]
+
+def test_a_changed_csv_is_converted_again_while_the_old_dataset_is_open(tmp_path):
+    csv_path = str(tmp_path / 'prices.csv')
+    pd.DataFrame({'Date': ['2024-01-01', '2024-01-02'], 'Close': [1.0, 2.0]}).to_csv(csv_path, index=False)
+    old_prices = load_prices(csv_path)
+
+    pd.DataFrame({'Date': ['2024-01-01', '2024-01-02', '2024-01-03'], 'Close': [1.0, 2.0, 3.0]}).to_csv(csv_path, index=False)
+    new_prices = load_prices(csv_path)
+
+    assert list(new_prices['Close']) == [1.0, 2.0, 3.0]
+    assert list(old_prices['Close']) == [1.0, 2.0]
+    assert os.listdir(tmp_path / price_store.store_folder_name) == [os.path.basename(dataset_folder(csv_path))]
+
+def test_a_forced_conversion_replaces_an_up_to_date_dataset(tmp_path):
+    csv_path = str(tmp_path / 'prices.csv')
+    pd.DataFrame({'Date': ['2024-01-01'], 'Close': [1.0]}).to_csv(csv_path, index=False)
+    load_prices(csv_path)
+    inode = os.stat(dataset_folder(csv_path)).st_ino
+
+    price_store.convert_csv(csv_path, force=True)
+    assert os.stat(dataset_folder(csv_path)).st_ino != inode
+    assert list(load_prices(csv_path)['Close']) == [1.0]
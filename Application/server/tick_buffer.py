@@ -0,0 +1,75 @@
+from collections import deque
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Number of ticks needed for one prediction - 60 for the sequence and the current price
+default_capacity = 61
+
+
+# A fixed size ring buffer of (timestamp, price) pairs for the minute mode ticks
+# # Memory is allocated once - pushing a tick is O(1) and never builds a list or a DataFrame
+# # Every tick is written twice, at position i and i + capacity, so the last ticks are always one contiguous slice
+# # and window() can return them as a view, without copying
+# # The min and max of the buffered prices are kept up to date with two monotonic queues (amortized O(1) per tick),
+# # which gives the MinMaxScaler parameters without scanning the window
+class TickRingBuffer:
+
+    def __init__(self, capacity=default_capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros((2 * capacity, 2), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+        # (tick number, price) pairs - increasing prices for the min, decreasing prices for the max
+        self.min_queue = deque()
+        self.max_queue = deque()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def push(self, timestamp, price):
+        self.buffer[self.head] = (timestamp, price)
+        self.buffer[self.head + self.capacity] = (timestamp, price)
+        self.head = (self.head + 1) % self.capacity
+
+        tick_number = self.count
+        self.count += 1
+
+        # A price can never be the min (or max) again once a lower (or higher) price came after it
+        while self.min_queue and self.min_queue[-1][1] >= price:
+            self.min_queue.pop()
+        self.min_queue.append((tick_number, price))
+        while self.max_queue and self.max_queue[-1][1] <= price:
+            self.max_queue.pop()
+        self.max_queue.append((tick_number, price))
+
+        # Dropping the prices that left the buffer
+        oldest_tick = self.count - self.capacity
+        while self.min_queue[0][0] < oldest_tick:
+            self.min_queue.popleft()
+        while self.max_queue[0][0] < oldest_tick:
+            self.max_queue.popleft()
+
+    def window(self, size=None):
+        # View of the last ticks, oldest first: column 0 holds the timestamps and column 1 the prices
+        size = len(self) if size is None else min(size, len(self))
+        end = self.head + self.capacity
+        return self.buffer[end - size:end]
+
+    @property
+    def min(self):
+        return self.min_queue[0][1] if self.min_queue else None
+
+    @property
+    def max(self):
+        return self.max_queue[0][1] if self.max_queue else None
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.min_queue.clear()
+        self.max_queue.clear()
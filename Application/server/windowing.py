@@ -0,0 +1,95 @@
+# Numpy library helps with numerical operation
+import numpy as np
+
+# The stride tricks are used to look at the series as overlapping windows without copying it
+from numpy.lib.stride_tricks import as_strided
+
+import math
+
+# The windowing functions shared by the training, testing and backtesting scripts and the server
+# # The windows are strided views over the original series, so building them costs no memory and no Python loop
+# # The views are read only - the windows overlap, so writing into one window would change its neighbours
+# # WindowBatches copies only one batch of windows at a time, which keeps memory at the size of the series
+
+
+def sliding_windows(data, seq_length):
+    # Every window of seq_length consecutive points: shape (len(data) - seq_length + 1, seq_length, ...)
+    data = np.asarray(data)
+    number_of_windows = len(data) - seq_length + 1
+    if number_of_windows < 0:
+        number_of_windows = 0
+    return as_strided(
+        data,
+        shape=(number_of_windows, seq_length) + data.shape[1:],
+        strides=(data.strides[0],) + data.strides,
+        writeable=False,
+    )
+
+# Prepare sequences for LSTM model - returns the same shapes as the previous loop based version, as zero copy views
+# xs: the input sequences, where each sequence is of length seq_length
+# ys: the target values, each one is the value right after its input sequence
+def create_sequences(data, seq_length):
+    data = np.asarray(data)
+    if len(data) <= seq_length:
+        return sliding_windows(data, seq_length)[:0], data[:0]
+
+    # The last window has no value after it, so it has no label
+    return sliding_windows(data, seq_length)[:-1], data[seq_length:]
+
+
+# Lazy batches of windows and labels, for training and predicting without building all the windows in memory
+# # start and stop select a range of windows, which is how the training and test sets are split
+# # shuffle changes the order of the windows at the end of every epoch, like model.fit does for arrays
+class WindowBatches:
+
+    def __init__(self, data, seq_length, batch_size=32, start=0, stop=None, shuffle=False, seed=None, targets=True):
+        data = np.asarray(data)
+
+        # The windows and labels are kept with a feature dimension - (samples, time steps, features)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+
+        self.windows, self.labels = create_sequences(data, seq_length)
+        stop = len(self.windows) if stop is None else min(stop, len(self.windows))
+        self.order = np.arange(start, stop)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.targets = targets
+        self.random_generator = np.random.default_rng(seed)
+
+        if self.shuffle:
+            self.random_generator.shuffle(self.order)
+
+    def __len__(self):
+        return math.ceil(len(self.order) / self.batch_size)
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+
+        # Only this batch of windows is copied out of the view
+        batch = self.order[index * self.batch_size:(index + 1) * self.batch_size]
+        if self.targets:
+            return self.windows[batch], self.labels[batch]
+        return self.windows[batch]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random_generator.shuffle(self.order)
+
+
+keras_window_sequence_class = None
+
+def keras_window_sequence(data, seq_length, batch_size=32, start=0, stop=None, shuffle=False, seed=None, targets=True):
+    # Keras model.fit / evaluate / predict only accept subclasses of its own Sequence
+    # The subclass is created on first use, so importing this module never imports TensorFlow
+    global keras_window_sequence_class
+    if keras_window_sequence_class is None:
+        from tensorflow.keras.utils import Sequence
+        keras_window_sequence_class = type('KerasWindowSequence', (WindowBatches, Sequence), {})
+
+    return keras_window_sequence_class(data, seq_length, batch_size, start, stop, shuffle, seed, targets)
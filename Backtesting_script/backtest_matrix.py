@@ -0,0 +1,189 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Backtest Matrix
+# Runs the backtest of every model on every dataset, instead of editing the model and dataset of the notebook by hand:
+# # The cells are run in a pool of processes, each one limited to a number of threads so the workers do not compete
+# # for the same cores
+# # A worker gets one model with a group of datasets - it loads the model once and backtests all of them with it
+# # When there are more workers than models, the datasets of a model are split in groups of about the same number
+# # of rows, so every core gets work
+# # The forecasts go through the forecast store, so a matrix that was run before only forecasts what changed
+# The report has one row per model and dataset - the strategy against buy and hold, the trades and the runtime
+#
+# Usage: python backtest_matrix.py --models models/*.h5 --data data/*.csv --workers 4 --output backtest_matrix.csv
+
+import argparse
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+import backtesting
+
+backtesting_folder = os.path.dirname(os.path.abspath(__file__))
+
+report_columns = ['model', 'dataset', 'windows', 'forecasted_windows', 'buys', 'sells', 'trades', 'final_portfolio_value',
+                  'buy_and_hold_value', 'excess_over_buy_and_hold', 'strategy_return', 'buy_and_hold_return',
+                  'model_load_time', 'forecast_time', 'runtime', 'worker']
+
+# The thread pools of OpenMP, OpenBLAS and MKL are sized when the libraries are loaded - a spawned worker imports
+# NumPy before its initializer runs, so the limits are set in the environment the workers are started with
+thread_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+@contextmanager
+def worker_thread_environment(threads_per_worker):
+    # Set while the pool runs, then restored - this process keeps its own settings
+    previous = {name: os.environ.get(name) for name in thread_variables}
+    os.environ.update({name: str(threads_per_worker) for name in thread_variables})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def init_worker(threads_per_worker, backend):
+    # Runs once in every worker, before a model is loaded
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    if (backend or os.getenv('INFERENCE_BACKEND', 'tensorflow')) == 'tensorflow':
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def dataset_rows(data_path):
+    return len(backtesting.load_prices(data_path)['Close'])
+
+def split_datasets(data_paths, groups):
+    # Greedy split in groups of about the same number of rows - the largest dataset goes to the smallest group
+    groups = max(1, min(groups, len(data_paths)))
+    sizes = {data_path: dataset_rows(data_path) for data_path in data_paths}
+    grouped = [[] for _ in range(groups)]
+    totals = [0] * groups
+    for data_path in sorted(data_paths, key=sizes.get, reverse=True):
+        smallest = totals.index(min(totals))
+        grouped[smallest].append(data_path)
+        totals[smallest] += sizes[data_path]
+    return [(group, total) for group, total in zip(grouped, totals) if group]
+
+def matrix_tasks(model_paths, data_paths, workers):
+    # One task per model and group of datasets, the largest first so the last task to finish is a small one
+    groups = max(1, workers // len(model_paths))
+    tasks = [(model_path, group, total) for model_path in model_paths for group, total in split_datasets(data_paths, groups)]
+    return [(model_path, group) for model_path, group, _ in sorted(tasks, key=lambda task: task[2], reverse=True)]
+
+def run_cells(model_path, data_paths, backend, stride, upward_threshold, downward_threshold, use_store):
+    # Executed in a worker process - the model is loaded the first time a window has to be forecasted, then kept
+    loaded = {}
+    def rollout_engine():
+        if 'engine' not in loaded:
+            start_time = time.perf_counter()
+            loaded['engine'] = backtesting.load_rollout_engine(model_path, backend)
+            loaded['load_time'] = time.perf_counter() - start_time
+        return loaded['engine']
+
+    rows = []
+    for data_path in data_paths:
+        # The load time is reported with the cell that loaded the model - it is part of its runtime and forecast time
+        was_loaded = 'engine' in loaded
+        start_time = time.perf_counter()
+        _, results = backtesting.run_backtest(model_path, data_path, upward_threshold, downward_threshold, stride,
+                                              backend=backend, rollout_engine=rollout_engine, use_store=use_store)
+        runtime = time.perf_counter() - start_time
+
+        initial_capital = backtesting.default_initial_capital
+        rows.append({
+            'model': os.path.splitext(os.path.basename(model_path))[0],
+            'dataset': os.path.splitext(os.path.basename(data_path))[0],
+            'windows': results['windows'],
+            'forecasted_windows': results['forecasted_windows'],
+            'buys': len(results['buy_signals']),
+            'sells': len(results['sell_signals']),
+            'trades': len(results['buy_signals']) + len(results['sell_signals']),
+            'final_portfolio_value': results['final_portfolio_value'],
+            'buy_and_hold_value': results['buy_and_hold_value'],
+            'excess_over_buy_and_hold': results['final_portfolio_value'] - results['buy_and_hold_value'],
+            'strategy_return': results['final_portfolio_value'] / initial_capital - 1,
+            'buy_and_hold_return': results['buy_and_hold_value'] / initial_capital - 1,
+            'model_load_time': loaded['load_time'] if 'engine' in loaded and not was_loaded else 0.0,
+            'forecast_time': results['forecast_time'],
+            'runtime': runtime,
+            'worker': os.getpid(),
+        })
+    return rows
+
+def run_matrix(model_paths, data_paths, workers=None, threads_per_worker=1, backend=None, stride=backtesting.default_stride,
+               upward_threshold=backtesting.default_upward_threshold, downward_threshold=backtesting.default_downward_threshold,
+               use_store=True):
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    tasks = matrix_tasks(model_paths, data_paths, workers)
+
+    # Spawned workers start without the state of this process - TensorFlow is only imported inside them
+    rows = []
+    start_time = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with worker_thread_environment(threads_per_worker), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                initargs=(threads_per_worker, backend)) as executor:
+        futures = {executor.submit(run_cells, model_path, group, backend, stride, upward_threshold, downward_threshold, use_store):
+                   (model_path, group) for model_path, group in tasks}
+        for future in as_completed(futures):
+            model_path, group = futures[future]
+            try:
+                cells = future.result()
+            except Exception as e:
+                # A model that fails does not stop the other cells
+                print(f"{os.path.basename(model_path)} on {len(group)} datasets failed: {e!r}")
+                continue
+            for cell in cells:
+                rows.append(cell)
+                print(f"[{len(rows)}/{len(model_paths) * len(data_paths)}] {cell['model']} {cell['dataset']} "
+                      f"excess {cell['excess_over_buy_and_hold']:.2f} in {cell['runtime']:.2f}s")
+    wall_time = time.perf_counter() - start_time
+
+    report = pd.DataFrame(rows, columns=report_columns).sort_values(['model', 'dataset'], ignore_index=True)
+    return report, wall_time
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Backtest of every model on every dataset in a pool of processes')
+    parser.add_argument('--models', nargs='+', default=sorted(glob.glob(os.path.join(backtesting_folder, 'models', '*.h5'))))
+    parser.add_argument('--data', nargs='+', default=sorted(glob.glob(os.path.join(backtesting_folder, 'data', '*.csv'))))
+    parser.add_argument('--upward-threshold', type=float, default=backtesting.default_upward_threshold)
+    parser.add_argument('--downward-threshold', type=float, default=backtesting.default_downward_threshold)
+    parser.add_argument('--stride', type=int, default=backtesting.default_stride)
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='TensorFlow and OpenMP threads of every worker')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the number of cores divided by --threads-per-worker')
+    parser.add_argument('--no-store', action='store_true', help='forecast every window again, without reading or writing the forecast store')
+    parser.add_argument('--output', default=None, help='save the report to this CSV file')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    report, wall_time = run_matrix(args.models, args.data, args.workers, args.threads_per_worker, args.backend, args.stride,
+                                   args.upward_threshold, args.downward_threshold, use_store=not args.no_store)
+    if report.empty:
+        return
+
+    print(report.drop(columns=['worker']).to_string(index=False, float_format=lambda value: f'{value:.4f}'))
+
+    # Excess over buy and hold of every cell, and the time the cells would have taken one after the other
+    print()
+    print(report.pivot(index='dataset', columns='model', values='excess_over_buy_and_hold').to_string(float_format=lambda value: f'{value:.2f}'))
+    cell_time = report['runtime'].sum()
+    print(f"\n{len(report)} cells in {wall_time:.1f}s - {cell_time:.1f}s of cell runtime, {cell_time / wall_time:.2f}x parallel speed-up")
+
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
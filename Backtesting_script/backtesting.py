@@ -0,0 +1,268 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Backtesting Engine
+# The same backtesting algorithm as LSTM_Backtesting.ipynb, with all the evaluation windows forecasted together:
+# every window is stacked in the batch dimension and advanced through the 60 step rollout at the same time,
+# so a full backtest costs 60 batched model calls instead of 60 calls per window
+# The forecasts are kept in the forecast store (forecast_store.py), so a rerun only forecasts the windows it has not
+# forecasted before, and an interrupted run continues where it stopped
+#
+# Usage: python backtesting.py --model models/lstm_model_05.h5 --data data/BTC-USD_1Y_Testing_04.csv --upward-threshold 0.05 --downward-threshold -0.005
+
+import argparse
+import os
+import sys
+import time
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+# A sklearn MinMaxScaler for normalization of our dataset
+from sklearn.preprocessing import MinMaxScaler
+
+# The rollout engines live with the server code, so the backtest uses exactly the same forecasting as the application
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from inference_backend import load_rollout_engine
+from windowing import sliding_windows
+from price_store import load_prices
+from forecast_store import open_forecasts, window_digests
+
+# Setting the sequence length for the LSTM input
+sequence_length = 60
+
+# Number of future points predicted for every window
+forecast_horizon = 60
+
+# Thresholds for determining the strength of the trend
+# Short - Shot
+# up & down = 0.0015
+#
+# Long - Shot
+# up = 0.05
+# down = 0.005
+default_upward_threshold = 0.05
+default_downward_threshold = -0.005
+
+# Number of observations between two evaluation windows
+default_stride = 10
+
+# Initial portfolio capital
+default_initial_capital = 50000
+
+# Maximum number of windows sent to the model in one batch - bounds the memory used by the rollout
+default_batch_size = 4096
+
+
+def load_close_prices(data_path):
+    # Loading the data through the price store - the CSV is parsed once, then the stored columns are memory mapped
+    # The DataFrame has the 'Date' index and 'Close' column, same as in the training and testing scripts
+    return load_prices(data_path).to_dataframe(['Close'])
+
+def window_indices(number_of_points, stride=default_stride):
+    # The same iteration as the notebook - from sequence_length to len(scaled_data) - 61, so there are always 60 future points
+    return np.arange(sequence_length, number_of_points - 61, stride)
+
+def forecast_windows(rollout_engine, close_prices, indices, batch_size=default_batch_size, stored_forecasts=None, scaler=None):
+    # Normalizing data - one scaler fitted on the whole dataset, like in the notebook
+    # A scaler fitted before can be given, when the windows are forecasted a part of the dataset at a time
+    if scaler is None:
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaler.fit(close_prices.reshape(-1, 1))
+
+    # Retrieve the current prices by inversely transforming the current points to the original scale - only the points
+    # of the windows are scaled, not the whole dataset
+    current_prices = np.empty(0)
+    if len(indices):
+        current_prices = scaler.inverse_transform(scaler.transform(close_prices[indices].reshape(-1, 1)))[:, 0]
+
+    # Zero copy view of every sequence - window k holds the 60 prices before the point k + 60
+    windows = sliding_windows(close_prices, sequence_length)
+
+    # The stored forecasts are read back, only the other windows are forecasted
+    future_prices = np.empty((len(indices), forecast_horizon))
+    missing = np.arange(len(indices))
+    if stored_forecasts is not None:
+        digests = window_digests(windows[indices - sequence_length], scaler.data_min_[0], scaler.data_range_[0])
+        found, stored_prices = stored_forecasts.lookup(indices, digests)
+        future_prices[found] = stored_prices
+        missing = np.flatnonzero(~found)
+
+    # The engine can be given as the function that loads it, so the model is only loaded when a window is missing
+    if len(missing) and callable(rollout_engine):
+        rollout_engine = rollout_engine()
+
+    # Forecasting the windows in batches - only the windows of the current batch are copied out of the view
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        batch_windows = windows[indices[batch] - sequence_length]
+        future_prices[batch] = rollout_engine.forecast_batch(batch_windows, scaler.data_min_[0], scaler.data_range_[0])
+
+        # Every batch is stored as soon as it is forecasted
+        if stored_forecasts is not None:
+            stored_forecasts.save(indices[batch], digests[batch], future_prices[batch])
+
+    return current_prices, future_prices
+
+def predicted_changes(current_prices, future_prices):
+    # Calculate the average predicted price change percentage using the mean of the future prices
+    return (np.mean(future_prices, axis=1) - current_prices) / current_prices
+
+def simulate_trades(indices, current_prices, change_percentages, upward_threshold=default_upward_threshold,
+                    downward_threshold=default_downward_threshold, initial_capital=default_initial_capital):
+    # Initialize portfolio
+    capital = initial_capital
+
+    # Initially holding of BTC, set to 0
+    btc_held = 0
+
+    # Saving the last bought price to manage risk further in the backtesting algorithm
+    last_bought_price = 0
+
+    # Get the observation at which the last prediction was made - the backtesting will stop at the last trade ( no matter if it's a sell or buy )
+    buy_signals = []
+    sell_signals = []
+
+    # First BTC pruchase price
+    last_action_price = 0
+    first_purchase_price = 0
+
+    for i, current_price, predicted_change_percentage in zip(indices, current_prices, change_percentages):
+
+        # Strong upward trend detected, decide to buy if there is enough capital
+        if predicted_change_percentage > upward_threshold:
+            if capital > 0:
+
+                # Convert the capital to BTC
+                btc_held += capital / current_price
+                capital = 0
+
+                # Record the price and the transaction
+                last_bought_price = current_price
+                buy_signals.append((int(i), float(current_price)))
+                last_action_price = current_price
+
+                # If it is the first purchase, record the first purchase price
+                if first_purchase_price == 0:
+                    first_purchase_price = current_price
+
+        # Strong downward trend detected, decide to sell if BTC is held and the sale is profitable
+        elif predicted_change_percentage < downward_threshold:
+            if btc_held > 0 and current_price > last_bought_price:
+
+                # Convert BTC to capital
+                capital += btc_held * current_price
+                btc_held = 0
+
+                # Record the price and the transaction
+                last_bought_price = 0
+                sell_signals.append((int(i), float(current_price)))
+                last_action_price = current_price
+
+    # Calculate the final portfolio values of the ML based strategy
+    final_portfolio_value = capital + btc_held * last_action_price
+
+    # Calculate the final portfolio values of the Buy&Hold strategy - if nothing was bought the capital stays the same
+    if first_purchase_price:
+        buy_and_hold_value = initial_capital / first_purchase_price * last_action_price
+    else:
+        buy_and_hold_value = initial_capital
+
+    return {
+        'final_portfolio_value': float(final_portfolio_value),
+        'buy_and_hold_value': float(buy_and_hold_value),
+        'first_purchase_price': float(first_purchase_price),
+        'last_action_price': float(last_action_price),
+        'buy_signals': buy_signals,
+        'sell_signals': sell_signals,
+    }
+
+def run_backtest(model_path, data_path, upward_threshold=default_upward_threshold, downward_threshold=default_downward_threshold,
+                 stride=default_stride, initial_capital=default_initial_capital, backend=None, batch_size=default_batch_size,
+                 rollout_engine=None, use_store=False):
+    df = load_close_prices(data_path)
+    close_prices = df['Close'].values.astype(np.float64)
+    indices = window_indices(len(close_prices), stride)
+
+    # The engine can be passed in, so one loaded model can be reused for several datasets
+    if rollout_engine is None:
+        rollout_engine = lambda: load_rollout_engine(model_path, backend)
+
+    start_time = time.perf_counter()
+    stored_forecasts = open_forecasts(model_path, data_path, forecast_horizon) if use_store else None
+    stored_before = len(stored_forecasts) if use_store else 0
+    current_prices, future_prices = forecast_windows(rollout_engine, close_prices, indices, batch_size, stored_forecasts)
+    forecast_time = time.perf_counter() - start_time
+
+    results = simulate_trades(indices, current_prices, predicted_changes(current_prices, future_prices),
+                              upward_threshold, downward_threshold, initial_capital)
+    results['windows'] = int(len(indices))
+    results['forecasted_windows'] = len(stored_forecasts) - stored_before if use_store else int(len(indices))
+    results['forecast_time'] = forecast_time
+    return df, results
+
+def plot_results(df, results, title, output_path=None):
+    # A very popular library for plotting graphs - only imported when a plot is requested
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(14, 7))
+    plt.plot(df.index, df['Close'], label='Close Prices', color='blue', alpha=0.3)
+
+    # Converting indices to dates
+    buy_dates = [df.index[i] for i, _ in results['buy_signals']]
+    sell_dates = [df.index[i] for i, _ in results['sell_signals']]
+    buy_prices = [price for _, price in results['buy_signals']]
+    sell_prices = [price for _, price in results['sell_signals']]
+
+    # Adding scatter points for the strong buy and sell signals to analyze the decisions
+    plt.scatter(buy_dates, buy_prices, color='green', label='Buy Signals', marker='^', alpha=1)
+    plt.scatter(sell_dates, sell_prices, color='red', label='Sell Signals', marker='v', alpha=1)
+    plt.title(title)
+    plt.xlabel('Date')
+    plt.ylabel('Close Price')
+    plt.legend()
+    plt.grid(True)
+    if output_path:
+        plt.savefig(output_path)
+    else:
+        plt.show()
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Batched LSTM backtesting')
+    parser.add_argument('--model', required=True, help='path to the .h5 model')
+    parser.add_argument('--data', required=True, help='path to the CSV dataset')
+    parser.add_argument('--upward-threshold', type=float, default=default_upward_threshold)
+    parser.add_argument('--downward-threshold', type=float, default=default_downward_threshold)
+    parser.add_argument('--stride', type=int, default=default_stride)
+    parser.add_argument('--initial-capital', type=float, default=default_initial_capital)
+    parser.add_argument('--batch-size', type=int, default=default_batch_size)
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--no-store', action='store_true', help='forecast every window again, without reading or writing the forecast store')
+    parser.add_argument('--plot', nargs='?', const='', default=None, help='plot the signals, optionally saving the figure to the given path')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    print('Start Backtesting...')
+    df, results = run_backtest(args.model, args.data, args.upward_threshold, args.downward_threshold, args.stride,
+                               args.initial_capital, args.backend, args.batch_size, use_store=not args.no_store)
+
+    # Print revenues
+    print(f"Windows evaluated: {results['windows']} ({results['forecasted_windows']} forecasted, "
+          f"{results['windows'] - results['forecasted_windows']} from the store) in {results['forecast_time']:.2f}s")
+    print(f"Buy signals: {len(results['buy_signals'])}, Sell signals: {len(results['sell_signals'])}")
+    print(f"First purchase price: {results['first_purchase_price']}")
+    print(f"Last action price: {results['last_action_price']}")
+    print(f"Final portfolio value (trading strategy): ${results['final_portfolio_value']:.2f}")
+    print(f"Final portfolio value (buy and hold): ${results['buy_and_hold_value']:.2f}")
+
+    if args.plot is not None:
+        plot_results(df, results, os.path.splitext(os.path.basename(args.model))[0] + '_Backtesting', args.plot or None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Parameter Sweep
+# Tries a grid of upward/downward thresholds and window strides on one model and one dataset:
+# # The 60 step forecast is computed once for every possible window (stride 1), and kept in the forecast store, so
+#   the next sweep on the same model and dataset reads them back instead
+# # Every stride reuses the cached forecasts of its own windows
+# # For one stride, all the threshold pairs are simulated together as arrays - one portfolio per pair
+# # The strides are spread over a process pool
+# The result is a table ranked by the final portfolio value
+#
+# Usage: python parameter_sweep.py --model models/lstm_model_05.h5 --data data/BTC-USD_1Y_Testing_04.csv --upward 0.01 0.03 0.05 --downward -0.001 -0.005 --strides 1 5 10
+
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+import backtesting
+
+# Default grid - the values listed in the notebook for the Short - Shot and Long - Shot models
+default_upward_thresholds = [0.0015, 0.005, 0.01, 0.05]
+default_downward_thresholds = [-0.0015, -0.005, -0.01]
+default_strides = [1, 5, 10]
+
+
+def simulate_threshold_grid(indices, current_prices, change_percentages, upward_thresholds, downward_thresholds,
+                            initial_capital=backtesting.default_initial_capital):
+    # The same rules as backtesting.simulate_trades, but every variable holds one value per threshold pair
+    upward_thresholds = np.asarray(upward_thresholds, dtype=np.float64)
+    downward_thresholds = np.asarray(downward_thresholds, dtype=np.float64)
+    number_of_pairs = len(upward_thresholds)
+
+    capital = np.full(number_of_pairs, float(initial_capital))
+    btc_held = np.zeros(number_of_pairs)
+    last_bought_price = np.zeros(number_of_pairs)
+    last_action_price = np.zeros(number_of_pairs)
+    first_purchase_price = np.zeros(number_of_pairs)
+    buy_count = np.zeros(number_of_pairs, dtype=np.int64)
+    sell_count = np.zeros(number_of_pairs, dtype=np.int64)
+
+    for current_price, predicted_change_percentage in zip(current_prices, change_percentages):
+        upward_trend = predicted_change_percentage > upward_thresholds
+
+        # Strong upward trend detected, buy where there is enough capital
+        buy = upward_trend & (capital > 0)
+        btc_held = np.where(buy, btc_held + capital / current_price, btc_held)
+        capital = np.where(buy, 0.0, capital)
+        last_bought_price = np.where(buy, current_price, last_bought_price)
+        first_purchase_price = np.where(buy & (first_purchase_price == 0), current_price, first_purchase_price)
+        buy_count += buy
+
+        # Strong downward trend detected, sell where BTC is held and the sale is profitable
+        sell = ~upward_trend & (predicted_change_percentage < downward_thresholds) & (btc_held > 0) & (current_price > last_bought_price)
+        capital = np.where(sell, capital + btc_held * current_price, capital)
+        btc_held = np.where(sell, 0.0, btc_held)
+        last_bought_price = np.where(sell, 0.0, last_bought_price)
+        sell_count += sell
+
+        last_action_price = np.where(buy | sell, current_price, last_action_price)
+
+    # Calculate the final portfolio values of the ML based strategy and the Buy&Hold strategy
+    final_portfolio_value = capital + btc_held * last_action_price
+    bought = first_purchase_price > 0
+    buy_and_hold_value = np.where(bought, initial_capital / np.where(bought, first_purchase_price, 1.0) * last_action_price, initial_capital)
+
+    return final_portfolio_value, buy_and_hold_value, buy_count, sell_count
+
+def evaluate_stride(arguments):
+    # Runs every threshold pair for one stride - executed in a worker process
+    stride, number_of_points, all_indices, current_prices, change_percentages, threshold_pairs, initial_capital = arguments
+
+    # The windows of this stride are a subset of the cached stride 1 windows
+    selected = np.isin(all_indices, backtesting.window_indices(number_of_points, stride))
+    upward_thresholds = [pair[0] for pair in threshold_pairs]
+    downward_thresholds = [pair[1] for pair in threshold_pairs]
+
+    final_values, buy_and_hold_values, buy_counts, sell_counts = simulate_threshold_grid(
+        all_indices[selected], current_prices[selected], change_percentages[selected],
+        upward_thresholds, downward_thresholds, initial_capital)
+
+    return pd.DataFrame({
+        'upward_threshold': upward_thresholds,
+        'downward_threshold': downward_thresholds,
+        'stride': stride,
+        'final_portfolio_value': final_values,
+        'buy_and_hold_value': buy_and_hold_values,
+        'excess_over_buy_and_hold': final_values - buy_and_hold_values,
+        'buys': buy_counts,
+        'sells': sell_counts,
+    })
+
+def run_sweep(model_path, data_path, upward_thresholds=default_upward_thresholds, downward_thresholds=default_downward_thresholds,
+              strides=default_strides, initial_capital=backtesting.default_initial_capital, backend=None, workers=None,
+              batch_size=backtesting.default_batch_size, use_store=True):
+    df = backtesting.load_close_prices(data_path)
+    close_prices = df['Close'].values.astype(np.float64)
+
+    # Forecasting every window once - every stride is a subset of these
+    all_indices = backtesting.window_indices(len(close_prices), 1)
+    start_time = time.perf_counter()
+    stored_forecasts = backtesting.open_forecasts(model_path, data_path, backtesting.forecast_horizon) if use_store else None
+    current_prices, future_prices = backtesting.forecast_windows(lambda: backtesting.load_rollout_engine(model_path, backend),
+                                                                 close_prices, all_indices, batch_size, stored_forecasts)
+    change_percentages = backtesting.predicted_changes(current_prices, future_prices)
+    forecast_time = time.perf_counter() - start_time
+
+    # Evaluating the grid over the cached forecasts
+    start_time = time.perf_counter()
+    threshold_pairs = list(itertools.product(upward_thresholds, downward_thresholds))
+    tasks = [(stride, len(close_prices), all_indices, current_prices, change_percentages, threshold_pairs, initial_capital) for stride in strides]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tables = list(executor.map(evaluate_stride, tasks))
+    sweep_time = time.perf_counter() - start_time
+
+    ranking = pd.concat(tables, ignore_index=True)
+    ranking = ranking.sort_values('final_portfolio_value', ascending=False, ignore_index=True)
+    return ranking, forecast_time, sweep_time
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Threshold and stride sweep over cached LSTM forecasts')
+    parser.add_argument('--model', required=True, help='path to the .h5 model')
+    parser.add_argument('--data', required=True, help='path to the CSV dataset')
+    parser.add_argument('--upward', type=float, nargs='+', default=default_upward_thresholds, help='upward thresholds to try')
+    parser.add_argument('--downward', type=float, nargs='+', default=default_downward_thresholds, help='downward thresholds to try')
+    parser.add_argument('--strides', type=int, nargs='+', default=default_strides, help='window strides to try')
+    parser.add_argument('--initial-capital', type=float, default=backtesting.default_initial_capital)
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, defaults to the number of cores')
+    parser.add_argument('--no-store', action='store_true', help='forecast every window again, without reading or writing the forecast store')
+    parser.add_argument('--output', default=None, help='save the ranked table to this CSV file')
+    parser.add_argument('--top', type=int, default=20, help='number of rows printed')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    ranking, forecast_time, sweep_time = run_sweep(args.model, args.data, args.upward, args.downward, args.strides,
+                                                   args.initial_capital, args.backend, args.workers, use_store=not args.no_store)
+
+    print(f'Forecasts computed in {forecast_time:.2f}s, {len(ranking)} combinations evaluated in {sweep_time:.2f}s')
+    print(ranking.head(args.top).to_string())
+
+    if args.output:
+        ranking.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
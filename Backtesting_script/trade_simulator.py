@@ -0,0 +1,282 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Streaming Trade Simulator
+# The portfolio of the backtest (capital, btc_held, last_bought_price) as an event driven simulator, apart from the
+# inference - it consumes (timestamp, price, signal) events in chunks and applies the rules of the notebook:
+# # Buy signal - all the capital is converted to BTC, if there is capital
+# # Sell signal - all the BTC is converted back, if BTC is held and the price is above the last bought price
+# # Optional fees (a share of every trade) and slippage (the price moves against every trade by a share of it)
+# Only the current chunk is in memory - the state of the portfolio, the counters and the drawdown are carried from one
+# chunk to the next, and the trades are written to the trade log as they happen, so the memory does not grow with the
+# length of the dataset
+# The events can be read from a CSV file (time, price, signal), or made from a model and a dataset: the windows are
+# read from the memory mapped price store and forecasted one chunk at a time
+#
+# Usage: python trade_simulator.py --model models/lstm_model_05.h5 --data data/BTC-USD_3Y_Testing.csv --fee-rate 0.001 --slippage 0.0005
+#        python trade_simulator.py --events signals.csv --chunk-size 100000 --trades trades.csv
+
+import argparse
+import csv
+import os
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+# A sklearn MinMaxScaler for normalization of our dataset
+from sklearn.preprocessing import MinMaxScaler
+
+import backtesting
+
+# The signals of the events - strings in an events file are mapped with signal_codes
+hold = 0
+buy = 1
+sell = -1
+signal_codes = {'Buy': buy, 'Sell': sell, 'Hold': hold}
+
+# Number of events simulated together
+default_chunk_size = 65536
+
+
+class TradeSimulator:
+
+    def __init__(self, initial_capital=backtesting.default_initial_capital, fee_rate=0.0, slippage=0.0, trade_log=None):
+        self.initial_capital = float(initial_capital)
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+
+        # A CSV writer getting one row per trade, or None
+        self.trade_log = trade_log
+
+        # Initialize portfolio
+        self.capital = self.initial_capital
+        self.btc_held = 0.0
+        self.last_bought_price = 0.0
+        self.first_purchase_price = 0.0
+        self.last_action_price = 0.0
+
+        # Counters, and the peak of the portfolio value for the maximum drawdown
+        self.events = 0
+        self.buys = 0
+        self.sells = 0
+        self.fees_paid = 0.0
+        self.last_price = 0.0
+        self.peak_value = self.initial_capital
+        self.max_drawdown = 0.0
+
+    def buy(self, timestamp, price):
+        # Convert the capital to BTC, at the price moved by the slippage and after the fee
+        execution_price = price * (1 + self.slippage)
+        fee = self.capital * self.fee_rate
+        self.btc_held += (self.capital - fee) / execution_price
+        self.fees_paid += fee
+        self.capital = 0.0
+
+        # Record the price and the transaction - the rules compare the market prices, like the notebook
+        self.last_bought_price = price
+        self.last_action_price = price
+        if self.first_purchase_price == 0:
+            self.first_purchase_price = price
+        self.buys += 1
+        self.log_trade(timestamp, 'Buy', price, execution_price, fee)
+
+    def sell(self, timestamp, price):
+        # Convert BTC to capital, at the price moved by the slippage and after the fee
+        execution_price = price * (1 - self.slippage)
+        proceeds = self.btc_held * execution_price
+        fee = proceeds * self.fee_rate
+        self.capital += proceeds - fee
+        self.fees_paid += fee
+        self.btc_held = 0.0
+
+        self.last_bought_price = 0.0
+        self.last_action_price = price
+        self.sells += 1
+        self.log_trade(timestamp, 'Sell', price, execution_price, fee)
+
+    def log_trade(self, timestamp, side, price, execution_price, fee):
+        if self.trade_log is not None:
+            self.trade_log.writerow([timestamp, side, price, execution_price, fee, self.capital, self.btc_held])
+
+    def process(self, timestamps, prices, signals):
+        # One chunk of events - only the Buy and Sell events are visited one by one, the Hold events never trade
+        prices = np.asarray(prices, dtype=np.float64)
+        signals = np.asarray(signals)
+        if len(prices) == 0:
+            return
+
+        # The portfolio from every trade on - (first event, capital, BTC held)
+        segment_starts = [0]
+        segment_capital = [self.capital]
+        segment_btc = [self.btc_held]
+        for position in np.flatnonzero(signals != hold).tolist():
+            price = prices[position]
+
+            # Strong upward trend detected, buy if there is enough capital
+            if signals[position] == buy:
+                if self.capital > 0:
+                    self.buy(timestamps[position], price)
+                else:
+                    continue
+
+            # Strong downward trend detected, sell if BTC is held and the sale is profitable
+            elif self.btc_held > 0 and price > self.last_bought_price:
+                self.sell(timestamps[position], price)
+            else:
+                continue
+            segment_starts.append(position)
+            segment_capital.append(self.capital)
+            segment_btc.append(self.btc_held)
+
+        # Portfolio value at every event, and the drawdown from the highest value so far
+        segment = np.searchsorted(segment_starts, np.arange(len(prices)), side='right') - 1
+        values = np.asarray(segment_capital)[segment] + np.asarray(segment_btc)[segment] * prices
+        peaks = np.maximum.accumulate(np.maximum(values, self.peak_value))
+        self.max_drawdown = max(self.max_drawdown, float(np.max(1 - values / peaks)))
+        self.peak_value = float(peaks[-1])
+
+        self.events += len(prices)
+        self.last_price = float(prices[-1])
+
+    def results(self):
+        # Calculate the final portfolio values of the ML based strategy - the BTC held is valued at the last action
+        # price like in the notebook, and at the last price of the events
+        final_portfolio_value = self.capital + self.btc_held * self.last_action_price
+        market_value = self.capital + self.btc_held * self.last_price
+
+        # Calculate the final portfolio values of the Buy&Hold strategy - one buy and one sell, with the same costs
+        if self.first_purchase_price:
+            btc_bought = self.initial_capital * (1 - self.fee_rate) / (self.first_purchase_price * (1 + self.slippage))
+            buy_and_hold_value = btc_bought * self.last_action_price * (1 - self.slippage) * (1 - self.fee_rate)
+        else:
+            buy_and_hold_value = self.initial_capital
+
+        return {
+            'events': self.events,
+            'buys': self.buys,
+            'sells': self.sells,
+            'final_portfolio_value': float(final_portfolio_value),
+            'market_value': float(market_value),
+            'buy_and_hold_value': float(buy_and_hold_value),
+            'first_purchase_price': float(self.first_purchase_price),
+            'last_action_price': float(self.last_action_price),
+            'fees_paid': float(self.fees_paid),
+            'max_drawdown': self.max_drawdown,
+        }
+
+
+def signals_from_changes(change_percentages, upward_threshold, downward_threshold):
+    return np.where(change_percentages > upward_threshold, buy, np.where(change_percentages < downward_threshold, sell, hold))
+
+def csv_event_chunks(events_path, chunk_size=default_chunk_size):
+    # An events file with the time, price and signal columns - the signals as Buy/Sell/Hold or 1/-1/0
+    for chunk in pd.read_csv(events_path, chunksize=chunk_size):
+        signals = chunk['signal']
+        if signals.dtype == object:
+            signals = signals.map(signal_codes)
+        yield chunk['time'].to_numpy(), chunk['price'].to_numpy(dtype=np.float64), signals.to_numpy(dtype=np.int8)
+
+def forecast_event_chunks(model_path, data_path, upward_threshold=backtesting.default_upward_threshold,
+                          downward_threshold=backtesting.default_downward_threshold, stride=backtesting.default_stride,
+                          chunk_size=default_chunk_size, backend=None, batch_size=backtesting.default_batch_size):
+    # The events of the backtest - the same windows, scaler and signals, made one chunk of windows at a time
+    prices = backtesting.load_prices(data_path)
+    close_prices = prices['Close']
+    times = prices.time
+
+    # The scaler of the whole dataset from its minimum and maximum - fitting it on them gives the same parameters
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    scaler.fit([[float(close_prices.min())], [float(close_prices.max())]])
+
+    # The model is only loaded for the first chunk
+    rollout_engine = lambda: backtesting.load_rollout_engine(model_path, backend)
+
+    # The windows of backtesting.window_indices, without building the array of all of them
+    end = len(close_prices) - 61
+    for start in range(backtesting.sequence_length, end, stride * chunk_size):
+        indices = np.arange(start, min(start + stride * chunk_size, end), stride)
+        if callable(rollout_engine):
+            rollout_engine = rollout_engine()
+        current_prices, future_prices = backtesting.forecast_windows(rollout_engine, close_prices, indices, batch_size, scaler=scaler)
+        change_percentages = backtesting.predicted_changes(current_prices, future_prices)
+        yield np.asarray(times[indices]), current_prices, signals_from_changes(change_percentages, upward_threshold, downward_threshold)
+
+def simulate(event_chunks, simulator, events_writer=None):
+    for timestamps, prices, signals in event_chunks:
+        simulator.process(timestamps, prices, signals)
+
+        # The events can be saved, to simulate them again with other costs without forecasting
+        if events_writer is not None:
+            events_writer.writerows(zip(timestamps.tolist(), prices.tolist(), signals.tolist()))
+    return simulator.results()
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Streaming trade simulator with fees and slippage')
+    parser.add_argument('--events', default=None, help='CSV file of time, price, signal events, instead of --model and --data')
+    parser.add_argument('--model', default=None, help='path to the .h5 model')
+    parser.add_argument('--data', default=None, help='path to the CSV dataset')
+    parser.add_argument('--upward-threshold', type=float, default=backtesting.default_upward_threshold)
+    parser.add_argument('--downward-threshold', type=float, default=backtesting.default_downward_threshold)
+    parser.add_argument('--stride', type=int, default=backtesting.default_stride)
+    parser.add_argument('--initial-capital', type=float, default=backtesting.default_initial_capital)
+    parser.add_argument('--fee-rate', type=float, default=0.0, help='share of every trade paid as a fee, e.g. 0.001')
+    parser.add_argument('--slippage', type=float, default=0.0, help='share of the price every trade loses, e.g. 0.0005')
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size, help='events simulated together')
+    parser.add_argument('--batch-size', type=int, default=backtesting.default_batch_size)
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--trades', default=None, help='CSV file the trades are written to')
+    parser.add_argument('--save-events', default=None, help='CSV file the events are written to, for --events')
+    args = parser.parse_args(argv)
+    if not args.events and not (args.model and args.data):
+        parser.error('either --events or --model and --data are required')
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    if args.events:
+        event_chunks = csv_event_chunks(args.events, args.chunk_size)
+    else:
+        event_chunks = forecast_event_chunks(args.model, args.data, args.upward_threshold, args.downward_threshold, args.stride,
+                                             args.chunk_size, args.backend, args.batch_size)
+
+    # The trade log and the saved events are written while the events are simulated
+    output_files = []
+    trade_log = events_writer = None
+    if args.trades:
+        output_files.append(open(args.trades, 'w', newline=''))
+        trade_log = csv.writer(output_files[-1])
+        trade_log.writerow(['time', 'side', 'price', 'execution_price', 'fee', 'capital', 'btc_held'])
+    if args.save_events:
+        output_files.append(open(args.save_events, 'w', newline=''))
+        events_writer = csv.writer(output_files[-1])
+        events_writer.writerow(['time', 'price', 'signal'])
+
+    try:
+        simulator = TradeSimulator(args.initial_capital, args.fee_rate, args.slippage, trade_log)
+        results = simulate(event_chunks, simulator, events_writer)
+    finally:
+        for output_file in output_files:
+            output_file.close()
+
+    # Print revenues
+    print(f"Events simulated: {results['events']}")
+    print(f"Buy signals: {results['buys']}, Sell signals: {results['sells']}, fees paid: ${results['fees_paid']:.2f}")
+    print(f"First purchase price: {results['first_purchase_price']}")
+    print(f"Last action price: {results['last_action_price']}")
+    print(f"Final portfolio value (trading strategy): ${results['final_portfolio_value']:.2f}")
+    print(f"Final portfolio value (at the last price): ${results['market_value']:.2f}")
+    print(f"Final portfolio value (buy and hold): ${results['buy_and_hold_value']:.2f}")
+    print(f"Maximum drawdown: {results['max_drawdown']:.2%}")
+
+    # Peak resident memory of the process, in kilobytes on Linux
+    if os.name == 'posix':
+        import resource
+        print(f"Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Benchmark Suite
+# Times the hot paths of the application and of the backtesting on the bundled CSV files:
+# # windowing - create_sequences and the batches used for training
+# # predict - predict_next_trend of the short and long models, with and without the forecast cache
+# # data_handler - the populate functions of the minute, hour and day modes, and the full fetch + populate cycle
+# #                against a local stand-in for the Coinbase and CoinGecko APIs (stub_api.py)
+# # backtesting - the batched backtest of LSTM_Backtesting.ipynb and its trading simulation
+# # serialization - a prediction snapshot encoded in the legacy and compact payload formats
+# The results are written as JSON, and a previous result file can be given to compare the two runs
+#
+# Usage: python benchmarks.py
+#        python benchmarks.py --compare results/benchmark_20240701T120000Z.json --fail-on-regression
+#        python benchmarks.py --only predict --repeats 20
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+server_folder = os.path.join(benchmark_folder, '..', 'Application', 'server')
+backtesting_folder = os.path.join(benchmark_folder, '..', 'Backtesting_script')
+data_folder = os.path.join(backtesting_folder, 'data')
+
+sys.path.append(server_folder)
+sys.path.append(backtesting_folder)
+
+default_results_folder = os.path.join(benchmark_folder, 'results')
+
+# A benchmark is a regression when its median is this much slower than in the compared run
+default_tolerance = 0.2
+
+
+def measure(function, repeats, warmup=1, setup=None):
+    # setup() runs before every call, outside of the timing, and returns the arguments of the call (or None)
+    for _ in range(warmup):
+        function(*((setup() if setup else None) or ()))
+
+    times = []
+    for _ in range(repeats):
+        arguments = (setup() if setup else None) or ()
+        start_time = time.perf_counter()
+        function(*arguments)
+        times.append(time.perf_counter() - start_time)
+
+    times.sort()
+    return {
+        'status': 'ok',
+        'repeats': repeats,
+        'min': times[0],
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'p95': times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))],
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+def skipped(reason):
+    return {'status': 'skipped', 'reason': reason}
+
+
+class BenchmarkSuite:
+
+    def __init__(self, repeats, only=None):
+        self.repeats = repeats
+        self.only = only
+        self.results = {}
+        self.loop = asyncio.new_event_loop()
+
+    def selected(self, name):
+        return not self.only or any(part in name for part in self.only)
+
+    def run(self, name, function, repeats=None, warmup=1, setup=None):
+        if not self.selected(name):
+            return
+        try:
+            result = measure(function, repeats or self.repeats, warmup, setup)
+        except Exception as e:
+            result = {'status': 'error', 'reason': repr(e)}
+        self.record(name, result)
+
+    def run_async(self, name, coroutine_function, repeats=None, warmup=1, setup=None):
+        self.run(name, lambda *arguments: self.loop.run_until_complete(coroutine_function(*arguments)), repeats, warmup, setup)
+
+    def record(self, name, result):
+        if not self.selected(name):
+            return
+        self.results[name] = result
+        if result['status'] == 'ok':
+            print(f"{name:<55} median {result['median'] * 1000:>10.3f} ms   p95 {result['p95'] * 1000:>10.3f} ms")
+        else:
+            print(f"{name:<55} {result['status']}: {result['reason']}")
+
+
+def close_prices(csv_name):
+    from price_store import load_prices
+    return np.asarray(load_prices(os.path.join(data_folder, csv_name))['Close'], dtype=np.float64)
+
+def benchmark_windowing(suite):
+    from windowing import create_sequences, WindowBatches
+
+    for csv_name in ['BTC-USD_1Y_Testing_04.csv', 'BTC-USD_10D_Testing_01.csv']:
+        prices = close_prices(csv_name).reshape(-1, 1)
+        label = csv_name.replace('.csv', '')
+        suite.run(f'windowing.create_sequences[{label}]', lambda: create_sequences(prices, 60))
+
+        # Copying every window out of the views, the cost paid by a model that needs all of them at once
+        suite.run(f'windowing.materialize_windows[{label}]', lambda: np.array(create_sequences(prices, 60)[0]))
+
+        batches = WindowBatches(prices, 60, batch_size=32)
+        suite.run(f'windowing.iterate_batches[{label}]', lambda: [batch for batch in batches])
+
+def minute_frame(prices, times):
+    return pd.DataFrame({'time': [str(pd.Timestamp(t, unit='s', tz='UTC')) for t in times], 'price': [str(p) for p in prices]})
+
+def benchmark_predict(suite):
+    from forecast_cache import forecast_cache
+    prices = close_prices('BTC-USD_24H_test_01.csv')[-61:]
+    times = np.arange(61) * 60 + 1719870000
+
+    for label, model_name in [('short', 'short_shot'), ('long', 'long_shot')]:
+        name = f'predict.predict_next_trend[{label}]'
+        if not suite.selected(name):
+            continue
+        try:
+            import predict
+            from model_registry import model_registry
+            model_registry[model_name].load()
+        except (OSError, ValueError, ImportError) as e:
+            suite.record(name, skipped(f'{model_name} could not be loaded: {e}'))
+            suite.record(name + '[cached]', skipped(f'{model_name} could not be loaded: {e}'))
+            continue
+
+        # predict_next_trend changes the DataFrame it gets, so every call gets a new one
+        def uncached_setup():
+            forecast_cache.clear()
+            return minute_frame(prices, times), model_name
+
+        suite.run(name, predict.predict_next_trend, setup=uncached_setup)
+        suite.run(name + '[cached]', predict.predict_next_trend, setup=lambda: (minute_frame(prices, times), model_name))
+
+def load_data_handler():
+    try:
+        from data_handler import DataHandler
+        return DataHandler, None
+    except (OSError, ImportError) as e:
+        return None, f'data_handler could not be loaded: {e}'
+
+def benchmark_data_handler(suite, stub_prices):
+    from forecast_cache import forecast_cache
+    names = ['data_handler.populate_for_seconds', 'data_handler.populate_for_5_minutes', 'data_handler.populate_for_days']
+    if not any(suite.selected(name) for name in names):
+        return
+    DataHandler, error = load_data_handler()
+    if DataHandler is None:
+        for name in names:
+            suite.record(name, skipped(error))
+        return
+
+    # Minute mode - the 61st tick, which makes a prediction from the full ring buffer
+    def seconds_setup():
+        forecast_cache.clear()
+        data_handler_manager = DataHandler()
+        for _ in range(60):
+            data_handler_manager.populate_for_seconds(stub_prices.next_ticker())
+        return data_handler_manager, stub_prices.next_ticker()
+    suite.run(names[0], lambda data_handler_manager, ticker: data_handler_manager.populate_for_seconds(ticker), setup=seconds_setup)
+
+    def chart_setup(chart):
+        forecast_cache.clear()
+        return DataHandler(), chart
+    five_minute_chart = stub_prices.five_minute_chart()
+    daily_chart = stub_prices.daily_chart()
+    suite.run(names[1], lambda data_handler_manager, chart: data_handler_manager.populate_for_5_minutes(chart),
+              setup=lambda: chart_setup(five_minute_chart))
+    suite.run(names[2], lambda data_handler_manager, chart: data_handler_manager.populate_for_days(chart),
+              setup=lambda: chart_setup(daily_chart))
+
+def benchmark_fetch_cycle(suite):
+    # The full asynchronous cycle of the server - fetching from the stand-in API, then the data handling and prediction
+    from stub_api import start_stub_api, api_urls, StubPrices
+    from data_fetching import AsyncDataFetching
+    from forecast_cache import forecast_cache
+
+    names = {frequency: f'data_handler.populate_array_async[{frequency}]' for frequency in ['minute', 'hour', 'day']}
+    if not any(suite.selected(name) for name in names.values()):
+        return
+    DataHandler, error = load_data_handler()
+    if DataHandler is None:
+        for name in names.values():
+            suite.record(name, skipped(error))
+        return
+
+    runner, base_url = suite.loop.run_until_complete(start_stub_api(stub_prices=StubPrices()))
+    async_fetch_manager = AsyncDataFetching(**api_urls(base_url))
+    try:
+        # The minute handler is filled first, so every measured cycle makes a prediction
+        minute_handler = DataHandler(async_fetch_manager=async_fetch_manager)
+        minute_handler.prediction_interval = 1
+        for _ in range(60):
+            suite.loop.run_until_complete(minute_handler.populate_array_async('minute'))
+
+        for frequency, name in names.items():
+            data_handler_manager = minute_handler if frequency == 'minute' else DataHandler(async_fetch_manager=async_fetch_manager)
+            suite.run_async(name, lambda data_handler_manager=data_handler_manager, frequency=frequency:
+                            data_handler_manager.populate_array_async(frequency), setup=lambda: forecast_cache.clear())
+    finally:
+        suite.loop.run_until_complete(async_fetch_manager.close())
+        suite.loop.run_until_complete(runner.cleanup())
+
+def benchmark_backtesting(suite, backend):
+    import backtesting
+
+    model_path = os.path.join(backtesting_folder, 'models', 'lstm_model_05.h5')
+    data_path = os.path.join(data_folder, 'BTC-USD_1Y_Testing_04.csv')
+    name = 'backtesting.run_backtest[lstm_model_05,1Y_Testing_04]'
+    if not suite.selected('backtesting'):
+        return
+
+    from inference_backend import load_rollout_engine
+    rollout_engine = load_rollout_engine(model_path, backend)
+    suite.run(name, lambda: backtesting.run_backtest(model_path, data_path, stride=1, rollout_engine=rollout_engine), repeats=max(3, suite.repeats // 5))
+
+    df, _ = backtesting.run_backtest(model_path, data_path, stride=1, rollout_engine=rollout_engine)
+    close = df['Close'].values.astype(np.float64)
+    indices = backtesting.window_indices(len(close), 1)
+    current_prices, future_prices = backtesting.forecast_windows(rollout_engine, close, indices)
+    changes = backtesting.predicted_changes(current_prices, future_prices)
+    suite.run('backtesting.simulate_trades[1Y_Testing_04]', lambda: backtesting.simulate_trades(indices, current_prices, changes))
+
+def benchmark_serialization(suite):
+    from payload_format import PayloadFormat, sample_snapshot, compact_snapshot, compact_cache, orjson, msgpack
+
+    snapshot = sample_snapshot()
+    suite.run('serialization.snapshot[legacy,json stdlib]', lambda: json.dumps(snapshot, separators=(",", ":")))
+    if orjson is not None:
+        suite.run('serialization.snapshot[legacy,orjson]', lambda: PayloadFormat('legacy', 'json').encode(snapshot))
+        suite.run('serialization.snapshot[compact,orjson]', lambda: PayloadFormat('compact', 'json').encode({'signal': snapshot}))
+    if msgpack is not None:
+        suite.run('serialization.snapshot[compact,msgpack]', lambda: PayloadFormat('compact', 'msgpack').encode({'signal': snapshot}))
+    suite.run('serialization.compact_snapshot[uncached]', lambda: compact_snapshot(snapshot), setup=lambda: compact_cache.clear())
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmark_folder, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def environment_info(args):
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'inference_backend': os.getenv('INFERENCE_BACKEND', 'tensorflow'),
+        'inference_workers': int(os.getenv('INFERENCE_WORKERS', '0')),
+        'repeats': args.repeats,
+    }
+
+def compare_results(current, previous, tolerance=default_tolerance):
+    # Median ratios of the benchmarks found in both runs
+    regressions = []
+    print(f"\n{'benchmark':<55} {'previous ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, result in current['benchmarks'].items():
+        previous_result = previous['benchmarks'].get(name)
+        if result['status'] != 'ok' or previous_result is None or previous_result['status'] != 'ok':
+            continue
+        ratio = result['median'] / previous_result['median']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / (1 + tolerance):
+            flag = '  faster'
+        print(f"{name:<55} {previous_result['median'] * 1000:>12.3f} {result['median'] * 1000:>12.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the forecasting, windowing and backtesting hot paths')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--only', nargs='+', default=None, help='only the benchmarks whose name contains one of these')
+    parser.add_argument('--output', default=None, help='result file, defaults to results/benchmark_<time>.json')
+    parser.add_argument('--compare', default=None, help='previous result file to compare with')
+    parser.add_argument('--tolerance', type=float, default=default_tolerance, help='allowed slowdown of the median, 0.2 = 20%%')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when a benchmark regressed')
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--inference-workers', type=int, default=0, help='inference worker processes of the server code, 0 runs the models in process')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    # The server modules load their models from paths relative to the server folder, and read their settings from the environment
+    if args.backend:
+        os.environ['INFERENCE_BACKEND'] = args.backend
+    os.environ['INFERENCE_WORKERS'] = str(args.inference_workers)
+
+    # The result files given on the command line are relative to where the benchmarks were started from
+    output_path = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(server_folder)
+
+    suite = BenchmarkSuite(args.repeats, args.only)
+    if args.inference_workers > 0:
+        from inference_backend import server_inference_pool
+        suite.loop.run_until_complete(server_inference_pool(args.backend).start())
+
+    from stub_api import StubPrices
+
+    benchmark_windowing(suite)
+    benchmark_predict(suite)
+    benchmark_data_handler(suite, StubPrices())
+    benchmark_fetch_cycle(suite)
+    benchmark_backtesting(suite, args.backend)
+    benchmark_serialization(suite)
+
+    if args.inference_workers > 0:
+        from inference_backend import server_inference_pool
+        server_inference_pool().shutdown()
+
+    results = {'environment': environment_info(args), 'benchmarks': suite.results}
+    output_path = output_path or os.path.join(default_results_folder, f"benchmark_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f'\nResults written to {output_path}')
+
+    if compare_path:
+        with open(compare_path) as previous_file:
+            regressions = compare_results(results, json.load(previous_file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Direct vs Autoregressive Forecasting
+# Compares a direct multi-horizon model (training.py --horizon 60) with an autoregressive model on the testing datasets:
+# # latency - one window, the way the server forecasts, and all the windows of a dataset in one batch
+# # accuracy - the 60 forecasted prices against the 60 prices that followed, and the direction of the mean change
+#   that the trading signal is made from
+# The windows are scaled one by one like in the server, each one with the scaler of its own prices
+#
+# Usage: python horizon_benchmark.py --autoregressive ../Application/server/models/short_shot.h5 --direct ../Application/server/models/short_shot_direct.h5
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(benchmark_folder, '..', 'Application', 'server'))
+from inference_backend import load_rollout_engine
+from price_store import load_prices
+from windowing import sliding_windows
+
+models_folder = os.path.join(benchmark_folder, '..', 'Application', 'server', 'models')
+testing_data_folder = os.path.join(benchmark_folder, '..', 'Testing_script', 'data')
+
+# Setting the sequence length for the LSTM input and the number of forecasted prices
+sequence_length = 60
+forecast_horizon = 60
+
+
+def evaluation_windows(close_prices, stride):
+    # Window k holds the prices k ... k + 59 and is followed by the 60 prices k + 60 ... k + 119
+    windows = sliding_windows(close_prices, sequence_length)
+    starts = np.arange(0, len(close_prices) - sequence_length - forecast_horizon + 1, stride)
+    sequences = windows[starts]
+    actual_prices = sliding_windows(close_prices, forecast_horizon)[starts + sequence_length]
+    data_min = sequences.min(axis=1)
+    return sequences, actual_prices, data_min, sequences.max(axis=1) - data_min
+
+def accuracy(future_prices, actual_prices, sequences):
+    errors = future_prices - actual_prices
+    last_prices = sequences[:, -1]
+    predicted_direction = np.sign(future_prices.mean(axis=1) - last_prices)
+    actual_direction = np.sign(actual_prices.mean(axis=1) - last_prices)
+    return {
+        'mae': float(np.mean(np.abs(errors))),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mape': float(np.mean(np.abs(errors) / actual_prices) * 100),
+        'direction_accuracy': float(np.mean(predicted_direction == actual_direction)),
+    }
+
+def latency(rollout_engine, sequences, data_min, data_range, repeats):
+    # One window at a time, like a server prediction, then the whole dataset in one batch
+    rollout_engine.forecast_batch(sequences[:1], data_min[:1], data_range[:1])
+    single_times = []
+    for index in range(repeats):
+        window = index % len(sequences)
+        start_time = time.perf_counter()
+        rollout_engine.forecast_batch(sequences[window:window + 1], data_min[window:window + 1], data_range[window:window + 1])
+        single_times.append(time.perf_counter() - start_time)
+
+    # The compiled rollout is traced again for a new batch size, which is not part of the timing
+    rollout_engine.forecast_batch(sequences, data_min, data_range)
+    start_time = time.perf_counter()
+    future_prices = rollout_engine.forecast_batch(sequences, data_min, data_range)
+    batch_time = time.perf_counter() - start_time
+    return future_prices, {
+        'single_window_ms': statistics.median(single_times) * 1000,
+        'batch_ms': batch_time * 1000,
+        'windows_per_second': len(sequences) / batch_time,
+    }
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Latency and accuracy of a direct multi-horizon model against an autoregressive one')
+    parser.add_argument('--autoregressive', default=os.path.join(models_folder, 'short_shot.h5'))
+    parser.add_argument('--direct', default=os.path.join(models_folder, 'short_shot_direct.h5'))
+    parser.add_argument('--data', nargs='+', default=sorted(glob.glob(os.path.join(testing_data_folder, '*.csv'))))
+    parser.add_argument('--stride', type=int, default=10, help='step between two evaluated windows')
+    parser.add_argument('--repeats', type=int, default=50, help='single window forecasts timed per dataset')
+    parser.add_argument('--backend', choices=['tensorflow', 'numpy'], default=None, help='defaults to INFERENCE_BACKEND or tensorflow')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if not os.path.exists(args.direct):
+        sys.exit(f'{args.direct} does not exist - train it with: python training.py --horizon 60 --output {os.path.basename(args.direct)}')
+
+    engines = {
+        'autoregressive': load_rollout_engine(args.autoregressive, args.backend),
+        'direct': load_rollout_engine(args.direct, args.backend),
+    }
+
+    results = []
+    print(f"{'dataset':<28} {'model':<15} {'1 window ms':>12} {'windows/s':>10} {'MAE $':>10} {'RMSE $':>10} {'MAPE %':>8} {'direction':>10}")
+    for data_path in args.data:
+        close_prices = np.asarray(load_prices(data_path)['Close'], dtype=np.float64)
+        sequences, actual_prices, data_min, data_range = evaluation_windows(close_prices, args.stride)
+        if len(sequences) == 0:
+            print(f'{os.path.basename(data_path)} is too short for a {sequence_length} + {forecast_horizon} window')
+            continue
+
+        for model_name, rollout_engine in engines.items():
+            future_prices, timing = latency(rollout_engine, sequences, data_min, data_range, args.repeats)
+            result = {'dataset': os.path.basename(data_path), 'model': model_name, 'windows': int(len(sequences)),
+                      **timing, **accuracy(future_prices, actual_prices, sequences)}
+            results.append(result)
+            print(f"{result['dataset']:<28} {model_name:<15} {result['single_window_ms']:>12.2f} {result['windows_per_second']:>10.0f} "
+                  f"{result['mae']:>10.2f} {result['rmse']:>10.2f} {result['mape']:>8.3f} {result['direction_accuracy']:>10.1%}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'autoregressive': args.autoregressive, 'direct': args.direct, 'stride': args.stride, 'results': results},
+                      output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
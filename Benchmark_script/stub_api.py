@@ -0,0 +1,119 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Local stand-in for the Coinbase and CoinGecko APIs
+# The same routes and response shapes the server fetches, answered from the bundled CSV files:
+# # /products/BTC-USD/ticker - the Coinbase ticker, replaying the minute prices of a 24H dataset one tick per request
+# # /api/v3/coins/bitcoin/market_chart?days=1 - the CoinGecko 5 minutes prices of the last 24 hours
+# # /api/v3/coins/bitcoin/market_chart?days=60&interval=daily - the CoinGecko daily prices of the last 60 days
+# The server can be pointed to it through AsyncDataFetching(current_url, minutes_url, daily_url)
+#
+# Usage: python stub_api.py --port 8001
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+
+# aiohttp is already used by the server for the fetching, its web module serves the stand-in
+from aiohttp import web
+
+# The price store lives with the server code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from price_store import load_prices
+
+data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backtesting_script', 'data')
+default_minute_csv = os.path.join(data_folder, 'BTC-USD_24H_test_01.csv')
+default_daily_csv = os.path.join(data_folder, 'BTC-USD_1Y_Testing_04.csv')
+
+ticker_path = '/products/BTC-USD/ticker'
+market_chart_path = '/api/v3/coins/bitcoin/market_chart'
+
+
+class StubPrices:
+
+    def __init__(self, minute_csv=default_minute_csv, daily_csv=default_daily_csv):
+        minute_prices = load_prices(minute_csv)
+        daily_prices = load_prices(daily_csv)
+        self.minute_times = minute_prices.time.tolist()
+        self.minute_close = minute_prices['Close'].tolist()
+        self.daily_times = daily_prices.time.tolist()
+        self.daily_close = daily_prices['Close'].tolist()
+        self.tick = 0
+
+    def next_ticker(self):
+        # One minute price per request, starting again at the beginning when the dataset ends
+        index = self.tick % len(self.minute_close)
+        self.tick += 1
+        time_string = datetime.fromtimestamp(self.minute_times[index], tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+        price = self.minute_close[index]
+        return {
+            'ask': f'{price + 0.01:.2f}',
+            'bid': f'{price - 0.01:.2f}',
+            'volume': '1000.0',
+            'trade_id': self.tick,
+            'price': f'{price:.2f}',
+            'size': '0.01',
+            'time': time_string,
+        }
+
+    def five_minute_chart(self):
+        # Every 5th minute price of the last 24 hours, as [epoch milliseconds, price] pairs
+        pairs = list(zip(self.minute_times, self.minute_close))[-24 * 60::5]
+        return {'prices': [[time * 1000, price] for time, price in pairs]}
+
+    def daily_chart(self, days=60):
+        # The last days + 1 daily prices, CoinGecko also returns the current day
+        pairs = list(zip(self.daily_times, self.daily_close))[-(days + 1):]
+        return {'prices': [[time * 1000, price] for time, price in pairs]}
+
+
+def create_app(stub_prices=None):
+    stub_prices = stub_prices or StubPrices()
+    app = web.Application()
+
+    async def ticker(request):
+        return web.json_response(stub_prices.next_ticker())
+
+    async def market_chart(request):
+        days = int(request.query.get('days', '1'))
+        if request.query.get('interval') == 'daily':
+            return web.json_response(stub_prices.daily_chart(days))
+        return web.json_response(stub_prices.five_minute_chart())
+
+    app.router.add_get(ticker_path, ticker)
+    app.router.add_get(market_chart_path, market_chart)
+    return app
+
+def api_urls(base_url):
+    # The three links of data_fetching.py, pointing to the stand-in
+    return {
+        'current_url': base_url + ticker_path,
+        'minutes_url': base_url + market_chart_path + '?vs_currency=usd&days=1',
+        'daily_url': base_url + market_chart_path + '?vs_currency=usd&days=60&interval=daily',
+    }
+
+async def start_stub_api(host='127.0.0.1', port=0, stub_prices=None):
+    # Starts the stand-in on the running event loop - port 0 picks a free port
+    runner = web.AppRunner(create_app(stub_prices))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://{host}:{port}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the Coinbase and CoinGecko APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--minute-csv', default=default_minute_csv)
+    parser.add_argument('--daily-csv', default=default_daily_csv)
+    args = parser.parse_args(argv)
+
+    for name, url in api_urls(f'http://{args.host}:{args.port}').items():
+        print(f'{name}: {url}')
+    web.run_app(create_app(StubPrices(args.minute_csv, args.daily_csv)), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,14 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 from tensorflow.keras.models import load_model
-from sklearn.model_selection import train_test_split
+import os
+import sys
 
-def create_sequences(data, seq_length):
-    sequences = []
-    labels = []
-    for i in range(len(data) - seq_length):
-        sequences.append(data[i:i+seq_length])
-        labels.append(data[i+seq_length])
-    return np.array(sequences), np.array(labels)
+# The shared windowing and price store modules live with the server code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from windowing import create_sequences
+from price_store import load_prices
+from sklearn.model_selection import train_test_split
 
 def predict_future_prices(model, data, n_steps, seq_length):
     predictions = []
@@ -32,11 +31,8 @@ def predict_future_prices(model, data, n_steps, seq_length):
 def main():
     # Load the new dataset
     new_file_path = 'BTC-USD_6M.csv'  # Replace with the path to your new dataset
-    new_data = pd.read_csv(new_file_path)
-
-    # Convert the 'Date' column to datetime and set it as index
-    new_data['Date'] = pd.to_datetime(new_data['Date'])
-    new_data.set_index('Date', inplace=True)
+    # The CSV is parsed once into the price store - the DataFrame comes with the 'Date' index
+    new_data = load_prices(new_file_path).to_dataframe()
 
     # Extract the 'Close' prices
     new_close_prices = new_data['Close'].values
@@ -1,5 +1,4 @@
 import numpy as np  # Importing numpy library for numerical operations
-import pandas as pd  # Importing pandas library for data manipulation
 from sklearn.preprocessing import MinMaxScaler  # Importing MinMaxScaler for normalization
 import matplotlib.pyplot as plt  # Importing matplotlib for plotting
 import tensorflow as tf  # Importing TensorFlow library for machine learning
@@ -7,14 +6,19 @@ from tensorflow.keras.models import Sequential  # Importing Sequential model fro
 from tensorflow.keras.layers import LSTM, Dense, Dropout, BatchNormalization  # Importing LSTM, Dense, and Dropout layers from Keras
 from sklearn.metrics import mean_squared_error, mean_absolute_error  # Importing evaluation metrics from sklearn
 from tensorflow.keras.regularizers import L2
+import os
+import sys
+
+# The shared price store and windowing modules live with the server code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from price_store import load_prices
+from windowing import create_sequences, keras_window_sequence
 
 # Load the dataset
 file_path = 'BTC-USD_24H.csv'  # File path for the dataset (replace with your file path)
-df = pd.read_csv(file_path)  # Reading the CSV file into a pandas DataFrame
 
-# Convert the 'Date' column to datetime and set it as index
-df['Date'] = pd.to_datetime(df['Date'])  # Converting 'Date' column to datetime format
-df.set_index('Date', inplace=True)  # Setting 'Date' column as the index of the DataFrame
+# The CSV is parsed once into the price store, then the stored columns are read - the 'Date' index is already set
+df = load_prices(file_path).to_dataframe()  # DataFrame indexed by 'Date' with the numeric columns of the CSV
 
 # Extract the 'Close' prices
 close_prices = df['Close'].values  # Extracting 'Close' prices as numpy array
@@ -23,18 +27,11 @@ close_prices = df['Close'].values  # Extracting 'Close' prices as numpy array
 scaler = MinMaxScaler(feature_range=(0, 1))  # Creating MinMaxScaler object
 scaled_close_prices = scaler.fit_transform(close_prices.reshape(-1, 1))  # Normalizing 'Close' prices
 
-# Function to create sequences for LSTM
-def create_sequences(data, seq_length):
-    sequences = []
-    labels = []
-    for i in range(len(data) - seq_length):
-        sequences.append(data[i:i+seq_length])  # Creating sequences of length seq_length
-        labels.append(data[i+seq_length])  # Creating labels for each sequence
-    return np.array(sequences), np.array(labels)
+# Function to create sequences for LSTM - shared zero copy windows (windowing.py, imported above)
 
 # Create sequences for training
 seq_length = 60  # Length of each sequence
-X, y = create_sequences(scaled_close_prices, seq_length)  # Creating sequences and labels
+X, y = create_sequences(scaled_close_prices, seq_length)  # Creating sequences and labels - views over scaled_close_prices, nothing is copied
 
 # Split the data into training and test sets
 split_ratio = 0.8  # Ratio of training data
@@ -54,25 +51,32 @@ model = Sequential([
 model.compile(optimizer='adam', loss='mean_squared_error')  
 # Compiling the model with Adam optimizer, which is effective for training neural networks, and using Mean Squared Error as the loss function
 
+# Lazy batches of windows - only one batch of 32 windows is copied at a time
+train_batches = keras_window_sequence(scaled_close_prices, seq_length, batch_size=32, stop=train_size, shuffle=True)  
+# Training windows, shuffled at every epoch like model.fit does for arrays
+
+test_batches = keras_window_sequence(scaled_close_prices, seq_length, batch_size=32, start=train_size)  
+# Test windows, kept in order
+
 # Train the LSTM model
-history = model.fit(X_train, y_train, epochs=20, batch_size=32, validation_data=(X_test, y_test), verbose=1)  
+history = model.fit(train_batches, epochs=20, validation_data=test_batches, verbose=1)  
 # Training the model with 20 epochs (iterations over the entire dataset), batch size of 32 (number of samples per gradient update), and using validation data for monitoring performance
 
 # Evaluate the LSTM model
-train_loss = model.evaluate(X_train, y_train, verbose=0)  
+train_loss = model.evaluate(keras_window_sequence(scaled_close_prices, seq_length, stop=train_size), verbose=0)  
 # Evaluating training loss
 
-test_loss = model.evaluate(X_test, y_test, verbose=0)  
+test_loss = model.evaluate(test_batches, verbose=0)  
 # Evaluating test loss
 
 print(f'Train Loss: {train_loss:.4f}, Test Loss: {test_loss:.4f}')  
 # Printing training and test loss
 
 # Make predictions with the LSTM model
-train_predictions = model.predict(X_train)  
+train_predictions = model.predict(keras_window_sequence(scaled_close_prices, seq_length, stop=train_size, targets=False))  
 # Making predictions on training data
 
-test_predictions = model.predict(X_test)  
+test_predictions = model.predict(keras_window_sequence(scaled_close_prices, seq_length, start=train_size, targets=False))  
 # Making predictions on test data
 
 train_predictions = scaler.inverse_transform(train_predictions)  
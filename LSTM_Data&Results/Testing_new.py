@@ -3,16 +3,19 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from tensorflow.keras.models import load_model
 from sklearn.preprocessing import MinMaxScaler
+import os
+import sys
 
 # Load the pre-trained LSTM model
 model = load_model('lstm_model.h5')  # Replace with your model path
 
-# Load data from CSV
-df = pd.read_csv('BTC-USD_24H.csv')
+# The shared price store and windowing modules live with the server code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from price_store import load_prices
+from windowing import create_sequences
 
-# Convert 'Date' column to datetime and set as index
-df['Date'] = pd.to_datetime(df['Date'])
-df.set_index('Date', inplace=True)
+# Load data from the price store - the CSV is parsed once, the DataFrame comes with the 'Date' index
+df = load_prices('BTC-USD_24H.csv').to_dataframe()
 
 df_full = df
 df = df.iloc[:-301]
@@ -24,15 +27,7 @@ close_prices = df['Close'].values.reshape(-1, 1)
 scaler = MinMaxScaler(feature_range=(0, 1))
 scaled_data = scaler.fit_transform(close_prices)
 
-# Prepare sequences for LSTM model
-def create_sequences(data, seq_length):
-    xs, ys = [], []
-    for i in range(len(data)-seq_length):
-        x = data[i:i+seq_length]
-        y = data[i+seq_length]
-        xs.append(x)
-        ys.append(y)
-    return np.array(xs), np.array(ys)
+# Prepare sequences for LSTM model - the shared windowing module (imported above)
 
 # Sequence length for LSTM input
 sequence_length = 60  # Adjust as needed based on your model's input size
@@ -0,0 +1,241 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Hyperparameter Search
+# Trains and evaluates a grid of model configurations instead of editing the notebook by hand for every variant:
+# # The search space is the Sequential([LSTM, Dropout, Dense]) model of the notebook (Config_05), with the sequence
+# # length, units, dropout, regularization, learning rate, batch size and dataset as the searched values
+# # The configurations are trained in a pool of processes, each one limited to a number of TensorFlow threads so the
+# # workers do not compete for the same cores
+# # Every result is saved under the hash of its configuration (and of the dataset file), so an interrupted search
+# # resumes with the configurations that were not trained yet
+# # The leaderboard ranks the configurations by validation MSE
+#
+# Usage: python hyperparameter_search.py --data BTC-USD_10D_Training.csv --units 20 50 50,50 --dropouts 0.2 0.4 --epochs 20 --patience 3
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# Pandas library is used for data manipulation
+import pandas as pd
+
+import training
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from price_store import load_prices, source_signature
+
+# The baseline of the search space - Config_05 of the notebook
+baseline_architecture = '05'
+
+leaderboard_columns = ['rank', 'config_hash', 'data', 'sequence_length', 'units', 'dropout', 'l2', 'learning_rate', 'batch_size',
+                       'val_mse', 'val_mae', 'epochs_run', 'best_epoch', 'training_time', 'samples_per_second']
+
+# The thread pools of OpenMP, OpenBLAS and MKL are sized when the libraries are loaded - a spawned worker imports
+# NumPy before its initializer runs, so the limits are set in the environment the workers are started with
+thread_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+def search_space(args):
+    # Every combination of the searched values
+    for data, sequence_length, units, dropout, l2_factor, learning_rate, batch_size in itertools.product(
+            args.data, args.sequence_lengths, args.units, args.dropouts, args.l2, args.learning_rates, args.batch_sizes):
+        yield {
+            'data': os.path.abspath(data),
+            'architecture': baseline_architecture,
+            'sequence_length': sequence_length,
+            'units': [int(value) for value in units.split(',')],
+            'dropout': dropout,
+            'l2': l2_factor,
+            'learning_rate': learning_rate,
+            'batch_size': batch_size,
+            'epochs': args.epochs,
+            'patience': args.patience,
+            'split_ratio': args.split_ratio,
+            'seed': args.seed,
+        }
+
+def config_hash(config):
+    # The dataset signature (size and modification time) is part of the hash, so a changed CSV is trained again
+    keyed = dict(config, data_signature=source_signature(config['data']))
+    return hashlib.sha1(json.dumps(keyed, sort_keys=True).encode()).hexdigest()[:16]
+
+def result_path(output_dir, config_key):
+    return os.path.join(output_dir, 'results', f'{config_key}.json')
+
+def load_result(output_dir, config_key):
+    path = result_path(output_dir, config_key)
+    if not os.path.exists(path):
+        return None
+    with open(path) as result_file:
+        return json.load(result_file)
+
+def save_result(output_dir, config_key, result):
+    # Written to a temporary file first - a search stopped while writing never leaves a half result behind
+    path = result_path(output_dir, config_key)
+    with open(path + '.tmp', 'w') as result_file:
+        json.dump(result, result_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def worker_thread_environment(threads_per_worker):
+    # Set while the pool runs, then restored - this process keeps its own settings
+    previous = {name: os.environ.get(name) for name in thread_variables}
+    os.environ.update({name: str(threads_per_worker) for name in thread_variables})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def init_worker(threads_per_worker):
+    # Runs once in every worker, before TensorFlow executes anything
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    training.configure_threads(threads_per_worker, 1)
+
+def evaluate_model(model, scaled_prices, scaler, window_range, sequence_length, batch_size):
+    # Validation MSE on the scaled prices (the training loss) and MAE in dollars
+    start, stop = window_range
+    predictions = model.predict(training.window_dataset(scaled_prices, window_range, sequence_length, batch_size), verbose=0)[:, 0]
+    labels = scaled_prices[start + sequence_length:stop + sequence_length]
+    errors = predictions.astype(np.float64) - labels
+    return float(np.mean(errors ** 2)), float(np.mean(np.abs(errors)) * scaler.data_range_[0])
+
+def run_config(config, config_key, output_dir):
+    import tensorflow as tf
+
+    model_path = os.path.join(output_dir, 'models', f'{config_key}.h5')
+    _, report = training.train(config['data'], config['architecture'], config['sequence_length'], config['split_ratio'],
+                               config['epochs'], config['batch_size'], config['learning_rate'], config['patience'],
+                               output_path=model_path, seed=config['seed'], verbose=False,
+                               units=config['units'], dropout=config['dropout'], l2=config['l2'])
+
+    # The best model of the training is evaluated, not the one of the last epoch
+    scaled_prices, scaler = training.load_scaled_prices(config['data'])
+    _, test_range = training.split_windows(len(scaled_prices), config['sequence_length'], config['split_ratio'])
+    val_mse, val_mae = evaluate_model(tf.keras.models.load_model(model_path), scaled_prices, scaler, test_range,
+                                      config['sequence_length'], config['batch_size'])
+
+    result = {
+        'config_hash': config_key,
+        'config': config,
+        'model_path': model_path,
+        'val_mse': val_mse,
+        'val_mae': val_mae,
+        'epochs_run': report['epochs_run'],
+        'best_epoch': report['best_epoch'],
+        'training_time': report['training_time'],
+        'samples_per_second': report['mean_samples_per_second'],
+        'worker': os.getpid(),
+    }
+    save_result(output_dir, config_key, result)
+    return result
+
+def write_leaderboard(results, output_dir):
+    rows = []
+    for result in results:
+        config = result['config']
+        rows.append({
+            'config_hash': result['config_hash'],
+            'data': os.path.basename(config['data']),
+            'sequence_length': config['sequence_length'],
+            'units': ','.join(str(units) for units in config['units']),
+            'dropout': config['dropout'],
+            'l2': config['l2'],
+            'learning_rate': config['learning_rate'],
+            'batch_size': config['batch_size'],
+            'val_mse': result['val_mse'],
+            'val_mae': result['val_mae'],
+            'epochs_run': result['epochs_run'],
+            'best_epoch': result['best_epoch'],
+            'training_time': round(result['training_time'], 2),
+            'samples_per_second': round(result['samples_per_second'] or 0),
+        })
+    leaderboard = pd.DataFrame(rows).sort_values('val_mse').reset_index(drop=True)
+    leaderboard.insert(0, 'rank', leaderboard.index + 1)
+    leaderboard = leaderboard[leaderboard_columns]
+    leaderboard.to_csv(os.path.join(output_dir, 'leaderboard.csv'), index=False)
+    return leaderboard
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter search of the LSTM model')
+    parser.add_argument('--data', nargs='+', default=['BTC-USD_10D_Training.csv'])
+    parser.add_argument('--sequence-lengths', type=int, nargs='+', default=[training.default_sequence_length])
+    parser.add_argument('--units', nargs='+', default=['20', '50'], help='units of the LSTM layers, comma separated for stacked layers (e.g. 50,50)')
+    parser.add_argument('--dropouts', type=float, nargs='+', default=[0.2, 0.4])
+    parser.add_argument('--l2', type=float, nargs='+', default=[0.0, 0.01])
+    parser.add_argument('--learning-rates', type=float, nargs='+', default=[0.0001])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32])
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--patience', type=int, default=3)
+    parser.add_argument('--split-ratio', type=float, default=training.default_split_ratio)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='TensorFlow threads of every worker')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the number of cores divided by --threads-per-worker')
+    parser.add_argument('--output-dir', default='search_results')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads_per_worker)
+    os.makedirs(os.path.join(args.output_dir, 'results'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_dir, 'models'), exist_ok=True)
+
+    configs = {config_hash(config): config for config in search_space(args)}
+    results = []
+    pending = {}
+    for config_key, config in configs.items():
+        result = load_result(args.output_dir, config_key)
+        if result is not None:
+            results.append(result)
+        else:
+            pending[config_key] = config
+    print(f"{len(configs)} configurations - {len(results)} cached, {len(pending)} to train on {workers} workers "
+          f"with {args.threads_per_worker} threads each")
+
+    # Every dataset is converted here once - the workers only open the stored columns instead of all converting it together
+    for data_path in sorted({config['data'] for config in pending.values()}):
+        load_prices(data_path)
+
+    # Spawned workers start without the state of this process - TensorFlow is only imported inside them
+    start_time = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with worker_thread_environment(args.threads_per_worker), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                initargs=(args.threads_per_worker,)) as executor:
+        futures = {executor.submit(run_config, config, config_key, args.output_dir): config_key for config_key, config in pending.items()}
+        for future in as_completed(futures):
+            config_key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # A failed configuration is not cached, so the next run tries it again
+                print(f"{config_key} failed: {e!r}")
+                continue
+            results.append(result)
+            print(f"[{len(results)}/{len(configs)}] {config_key} val_mse {result['val_mse']:.6f} val_mae {result['val_mae']:.2f} "
+                  f"in {result['training_time']:.1f}s")
+
+    if pending:
+        print(f"Trained {len(pending)} configurations in {time.perf_counter() - start_time:.1f}s")
+    if results:
+        leaderboard = write_leaderboard(results, args.output_dir)
+        print(leaderboard.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# Msc Computing - University of Sunderland - 2023-2024
+# Alexandru Sandor
+# bi52eb
+
+# Training Script
+# The training of LSTM_Training.ipynb as a command line tool, for datasets that do not fit the notebook workflow:
+# # The windows are never built in memory - a tf.data pipeline gathers every batch of windows from the scaled series,
+# # in parallel with the training step, and prefetches the next batches
+# # The CPU threads used inside one operation (intra op) and between operations (inter op) can be set
+# # Early stopping ends the training when the validation loss has not improved for a number of epochs
+# # The model, the optimizer and the training state are checkpointed every few epochs, so a stopped training can be
+# # resumed where it was left
+# # The best model so far is saved as .h5 (the format the server and the backtesting load) whenever it improves
+# # The samples per second of every epoch are reported
+# # --horizon 60 trains a direct multi-horizon model, whose last Dense layer outputs the 60 future prices at once,
+# # instead of a model of the next price that has to be fed back into itself 60 times
+#
+# Usage: python training.py --data BTC-USD_10D_Training.csv --architecture 03 --epochs 20 --output lstm_model.h5
+#        python training.py --data BTC-USD_10D_Training.csv --checkpoint-dir checkpoints --resume
+#        python training.py --data BTC-USD_10D_Training.csv --horizon 60 --output short_shot_direct.h5
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Numpy library helps with numerical operation
+import numpy as np
+
+# A sklearn MinMaxScaler for normalization of our dataset
+from sklearn.preprocessing import MinMaxScaler
+
+# The datasets are read through the price store of the server - parsed once, then memory mapped
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Application', 'server'))
+from price_store import load_prices
+
+# Length of each sequence -  this means that the model will require the last 60 units in order to predict the next one
+default_sequence_length = 60
+
+# 80% of the windows go to training, like in the notebook
+default_split_ratio = 0.8
+
+# Model Architectural Components - the configurations of the notebook
+# Config_06 is left out - its second LSTM layer is commented out in the notebook, so it returns a sequence instead of
+# one price and can not be used by the server or the backtesting
+architectures = {
+    '01': {'units': [50], 'dropout': 0.0, 'dense_units': 0, 'l2': 0.0, 'dense_l2': 0.0},
+    '02': {'units': [20, 20], 'dropout': 0.4, 'dense_units': 25, 'l2': 0.0, 'dense_l2': 0.0},
+    '03': {'units': [50, 50], 'dropout': 0.2, 'dense_units': 25, 'l2': 0.0, 'dense_l2': 0.0},
+    '04': {'units': [50, 50], 'dropout': 0.2, 'dense_units': 25, 'l2': 0.001, 'dense_l2': 0.001, 'conv_filters': 64},
+    '05': {'units': [20], 'dropout': 0.4, 'dense_units': 0, 'l2': 0.01, 'dense_l2': 0.0},
+}
+
+# Name of the file that holds the training state next to the checkpoints
+state_file_name = 'training_state.json'
+
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    # Must run before TensorFlow executes anything - 0 lets TensorFlow pick the number of cores
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+def build_model(architecture='03', sequence_length=default_sequence_length, outputs=1, **overrides):
+    # Importing Sequential model and the layers from Keras
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input, LSTM, Dense, Dropout, Conv1D, MaxPooling1D
+    from tensorflow.keras.regularizers import l2
+
+    # The preset of the notebook, with any value replaced by the overrides (used by the hyperparameter search)
+    config = dict(architectures[architecture], **{key: value for key, value in overrides.items() if value is not None})
+    regularizer = l2(config['l2']) if config['l2'] else None
+    dense_regularizer = l2(config['dense_l2']) if config['dense_l2'] else None
+
+    layers = [Input(shape=(sequence_length, 1))]
+    if config.get('conv_filters'):
+        layers += [Conv1D(filters=config['conv_filters'], kernel_size=3, activation='relu'), MaxPooling1D(pool_size=2)]
+    for index, units in enumerate(config['units']):
+        # Every LSTM layer but the last returns the full sequence for the next one
+        layers.append(LSTM(units, return_sequences=index < len(config['units']) - 1, kernel_regularizer=regularizer))
+        if config['dropout']:
+            layers.append(Dropout(config['dropout']))
+    if config['dense_units']:
+        layers.append(Dense(config['dense_units'], kernel_regularizer=dense_regularizer))
+    layers.append(Dense(outputs))
+    return Sequential(layers)
+
+def load_scaled_prices(data_path):
+    # Normalizing 'Close' prices - one scaler fitted on the whole dataset, like in the notebook
+    close_prices = np.asarray(load_prices(data_path)['Close'], dtype=np.float64)
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    scaled_close_prices = scaler.fit_transform(close_prices.reshape(-1, 1))[:, 0].astype(np.float32)
+    return scaled_close_prices, scaler
+
+def split_windows(number_of_prices, sequence_length=default_sequence_length, split_ratio=default_split_ratio, horizon=1):
+    # The same split as the notebook - window k holds the prices k ... k + sequence_length - 1, its labels come after it
+    number_of_windows = max(0, number_of_prices - sequence_length - horizon + 1)
+    train_size = int(number_of_windows * split_ratio)
+    return (0, train_size), (train_size, number_of_windows)
+
+def window_dataset(scaled_prices, window_range, sequence_length=default_sequence_length, batch_size=32, shuffle=False,
+                   seed=None, horizon=1):
+    # Streaming input pipeline - only the window start indices are shuffled and batched, the windows of a batch are
+    # gathered from the series in the map step, which runs in parallel with the training and is prefetched
+    import tensorflow as tf
+
+    series = tf.constant(scaled_prices, dtype=tf.float32)
+    window_offsets = tf.range(sequence_length, dtype=tf.int64)
+    label_offsets = tf.range(sequence_length, sequence_length + horizon, dtype=tf.int64)
+
+    def gather_batch(indices):
+        windows = tf.gather(series, indices[:, tf.newaxis] + window_offsets)[..., tf.newaxis]
+        labels = tf.gather(series, indices[:, tf.newaxis] + label_offsets)
+        return windows, labels
+
+    start, stop = window_range
+    dataset = tf.data.Dataset.range(start, stop)
+    if shuffle:
+        # The indices are small, so the whole range is shuffled again at every epoch like model.fit does for arrays
+        dataset = dataset.shuffle(max(1, stop - start), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(gather_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def training_callback_class():
+    # The callback class is created on first use, so importing this module never imports TensorFlow
+    import tensorflow as tf
+
+    # Early stopping, checkpointing, best model saving and throughput reporting in one callback, so all of them
+    # share one training state that is saved with the checkpoints
+    class TrainingMonitor(tf.keras.callbacks.Callback):
+
+        def __init__(self, state, train_samples, checkpoint_manager=None, checkpoint_every=1, patience=0,
+                     min_delta=0.0, output_path=None, verbose=True):
+            super().__init__()
+            self.state = state
+            self.train_samples = train_samples
+            self.checkpoint_manager = checkpoint_manager
+            self.checkpoint_every = checkpoint_every
+            self.patience = patience
+            self.min_delta = min_delta
+            self.output_path = output_path
+            self.verbose = verbose
+            self.epoch_start_time = None
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.epoch_start_time = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            logs = dict(logs or {})
+            epoch_time = time.perf_counter() - self.epoch_start_time
+            logs['epoch_time'] = epoch_time
+            logs['samples_per_second'] = self.train_samples / epoch_time
+            self.state['epoch'] = epoch + 1
+            self.state['history'].append({key: float(value) for key, value in logs.items()})
+
+            # The validation loss decides the best model, the training loss when there is no validation set
+            monitored = logs.get('val_loss', logs.get('loss'))
+            if monitored < self.state['best_loss'] - self.min_delta:
+                self.state['best_loss'] = float(monitored)
+                self.state['best_epoch'] = epoch + 1
+                self.state['epochs_without_improvement'] = 0
+                if self.output_path:
+                    self.model.save(self.output_path)
+            else:
+                self.state['epochs_without_improvement'] += 1
+
+            if self.verbose:
+                print(f"Epoch {epoch + 1}: loss {logs['loss']:.6f}"
+                      + (f", val_loss {logs['val_loss']:.6f}" if 'val_loss' in logs else '')
+                      + f", {epoch_time:.1f}s, {logs['samples_per_second']:.0f} samples/s")
+
+            if self.patience and self.state['epochs_without_improvement'] >= self.patience:
+                if self.verbose:
+                    print(f"Early stopping - no improvement since epoch {self.state['best_epoch']}")
+                self.state['stopped_early'] = True
+                self.model.stop_training = True
+
+            # Checkpointing every few epochs and always at the end, so the training can be resumed
+            if self.checkpoint_manager and ((epoch + 1) % self.checkpoint_every == 0 or self.model.stop_training
+                                            or epoch + 1 == self.params.get('epochs')):
+                self.save_checkpoint(epoch + 1)
+
+        def save_checkpoint(self, epoch):
+            self.checkpoint_manager.checkpoint.epoch.assign(epoch)
+            self.checkpoint_manager.save(checkpoint_number=epoch)
+            save_state(self.checkpoint_manager.directory, self.state)
+
+    return TrainingMonitor
+
+def new_state():
+    return {'epoch': 0, 'best_loss': float('inf'), 'best_epoch': 0, 'epochs_without_improvement': 0,
+            'stopped_early': False, 'history': []}
+
+def save_state(checkpoint_dir, state):
+    # Written to a temporary file first, so a crash never leaves half a state file
+    path = os.path.join(checkpoint_dir, state_file_name)
+    with open(path + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+def load_state(checkpoint_dir):
+    path = os.path.join(checkpoint_dir, state_file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as state_file:
+        return json.load(state_file)
+
+def train(data_path, architecture='03', sequence_length=default_sequence_length, split_ratio=default_split_ratio,
+          epochs=20, batch_size=32, learning_rate=0.0001, patience=0, min_delta=0.0, checkpoint_dir=None,
+          checkpoint_every=1, resume=False, output_path=None, seed=None, horizon=1, verbose=True, **overrides):
+    import tensorflow as tf
+
+    if seed is not None:
+        tf.keras.utils.set_random_seed(seed)
+
+    scaled_prices, scaler = load_scaled_prices(data_path)
+    train_range, test_range = split_windows(len(scaled_prices), sequence_length, split_ratio, horizon)
+    train_samples = train_range[1] - train_range[0]
+    if train_samples <= 0:
+        raise ValueError(f"{data_path} has too few prices for windows of {sequence_length}")
+
+    train_dataset = window_dataset(scaled_prices, train_range, sequence_length, batch_size, shuffle=True, seed=seed, horizon=horizon)
+    test_dataset = window_dataset(scaled_prices, test_range, sequence_length, batch_size, horizon=horizon) if test_range[1] > test_range[0] else None
+
+    # The LSTM model is compiled using the Adam optimizer and using Mean Squared Error as the loss function
+    model = build_model(architecture, sequence_length, outputs=horizon, **overrides)
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+    model.compile(optimizer=optimizer, loss='mean_squared_error')
+
+    # Restoring the weights, the optimizer and the training state of the last checkpoint
+    state = new_state()
+    checkpoint_manager = None
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint = tf.train.Checkpoint(model=model, optimizer=optimizer, epoch=tf.Variable(0, dtype=tf.int64))
+        checkpoint_manager = tf.train.CheckpointManager(checkpoint, checkpoint_dir, max_to_keep=3)
+        if resume and checkpoint_manager.latest_checkpoint:
+            checkpoint.restore(checkpoint_manager.latest_checkpoint).expect_partial()
+            state = load_state(checkpoint_dir) or state
+            state['epoch'] = int(checkpoint.epoch.numpy())
+            state['stopped_early'] = False
+            if verbose:
+                print(f"Resuming from {checkpoint_manager.latest_checkpoint} at epoch {state['epoch']}")
+
+    monitor = training_callback_class()(state, train_samples, checkpoint_manager, checkpoint_every, patience,
+                                        min_delta, output_path, verbose)
+    start_time = time.perf_counter()
+    model.fit(train_dataset, epochs=epochs, initial_epoch=state['epoch'], validation_data=test_dataset,
+              callbacks=[monitor], verbose=0)
+    training_time = time.perf_counter() - start_time
+
+    epoch_history = state['history']
+    return model, {
+        'data': data_path,
+        'architecture': architecture,
+        'horizon': horizon,
+        'overrides': overrides,
+        'train_windows': train_samples,
+        'test_windows': test_range[1] - test_range[0],
+        'epochs_run': state['epoch'],
+        'best_epoch': state['best_epoch'],
+        'best_loss': state['best_loss'],
+        'stopped_early': state['stopped_early'],
+        'training_time': training_time,
+        'mean_samples_per_second': float(np.mean([epoch['samples_per_second'] for epoch in epoch_history])) if epoch_history else None,
+        'history': epoch_history,
+        'scaler': {'data_min': float(scaler.data_min_[0]), 'data_max': float(scaler.data_max_[0])},
+    }
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='LSTM training with a streaming input pipeline and checkpoints')
+    parser.add_argument('--data', default='BTC-USD_10D_Training.csv')
+    parser.add_argument('--architecture', choices=sorted(architectures), default='03')
+    parser.add_argument('--sequence-length', type=int, default=default_sequence_length)
+    parser.add_argument('--split-ratio', type=float, default=default_split_ratio)
+    parser.add_argument('--horizon', type=int, default=1, help='future prices the model outputs, 60 trains a direct multi-horizon model')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--patience', type=int, default=0, help='epochs without improvement before stopping, 0 never stops early')
+    parser.add_argument('--min-delta', type=float, default=0.0, help='smallest loss decrease counted as an improvement')
+    parser.add_argument('--checkpoint-dir', default=None, help='folder of the checkpoints, no checkpoints when not given')
+    parser.add_argument('--checkpoint-every', type=int, default=1, help='epochs between two checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue from the last checkpoint in --checkpoint-dir')
+    parser.add_argument('--intra-op-threads', type=int, default=0, help='threads inside one operation, 0 lets TensorFlow decide')
+    parser.add_argument('--inter-op-threads', type=int, default=0, help='operations run in parallel, 0 lets TensorFlow decide')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default='lstm_model.h5', help='the best model is saved here')
+    parser.add_argument('--report', default=None, help='JSON file for the training report')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+
+    if args.resume and not args.checkpoint_dir:
+        sys.exit('--resume needs --checkpoint-dir')
+
+    _, report = train(args.data, args.architecture, args.sequence_length, args.split_ratio, args.epochs, args.batch_size,
+                      args.learning_rate, args.patience, args.min_delta, args.checkpoint_dir, args.checkpoint_every,
+                      args.resume, args.output, args.seed, args.horizon)
+
+    print(f"Trained {report['epochs_run']} epochs in {report['training_time']:.1f}s - best loss {report['best_loss']:.6f} "
+          f"at epoch {report['best_epoch']}")
+    if report['mean_samples_per_second']:
+        print(f"{report['mean_samples_per_second']:.0f} samples/s on average")
+    print(f"Best model saved to {args.output}")
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+if __name__ == "__main__":
+    main()